@@ -1,21 +1,58 @@
+import selectors
 import socket
-from select import select
+import time
+from queue import Empty, Queue
 from threading import Event, Thread
+from typing import List, Optional
 
 
 class AcceptThread:
-    def __init__(self, listening_socket: socket.socket) -> None:
+    """
+    Accepts connections on a listening socket in the background.
+
+    The thread sleeps until a connection arrives or stop() is called,
+    rather than repeatedly polling the socket.
+    """
+
+    def __init__(self,
+                 listening_socket: socket.socket,
+                 max_connections: int = 1) -> None:
+        """
+        Creates a thread to accept connections.
+
+        :param listening_socket: The socket to accept connections on.
+        :param max_connections: How many connections to accept before
+                                stopping, or 0 to accept until stopped.
+        """
         self.listening_socket = listening_socket
+        self.max_connections = max_connections
         self.thread = Thread(target=self.run)
         self.stop_event = Event()
-        self.connected_socket = None
+        # Writing to wakeup_sender wakes the thread up, so that it can stop.
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+        # The first connection accepted.
+        self.connected_socket: Optional[socket.socket] = None
+        # Every connection accepted, in order,
+        # and the ones not yet taken with next_connection().
+        self.connected_sockets: List[socket.socket] = []
+        self.new_connections: Queue = Queue()
+        # Metrics, in seconds. accept_latencies has how long each connection
+        # took to accept once the socket was ready, and wait_times has how
+        # long the thread had been running when each connection arrived.
+        self.start_time: float = 0
+        self.accept_latencies: List[float] = []
+        self.wait_times: List[float] = []
 
     def start(self) -> None:
+        self.start_time = time.monotonic()
         self.thread.start()
 
     def stop(self) -> None:
         self.stop_event.set()
+        self.wakeup_sender.send(b'\0')
         self.thread.join()
+        self.wakeup_sender.close()
+        self.wakeup_receiver.close()
 
     def is_stopped(self) -> bool:
         return self.stop_event.is_set()
@@ -23,11 +60,58 @@ class AcceptThread:
     def connected(self) -> bool:
         return self.connected_socket is not None
 
+    def next_connection(self,
+                        timeout: Optional[float] = None) -> Optional[socket.socket]:
+        """
+        Takes the oldest connection that hasn't been taken yet,
+        waiting for one to arrive if necessary.
+
+        :param timeout: How many seconds to wait, or None to wait forever.
+        :return: The connected socket, or None if the wait timed out.
+        """
+        try:
+            return self.new_connections.get(timeout=timeout)
+        except Empty:
+            return None
+
     def run(self) -> None:
-        ready = []
-        while not self.is_stopped() and not ready:
-            ready = select([self.listening_socket], [], [], 0)[0]
-        if not ready:
-            return
-        self.connected_socket = self.listening_socket.accept()[0]
+        self.listening_socket.setblocking(False)
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.listening_socket, selectors.EVENT_READ)
+            selector.register(self.wakeup_receiver, selectors.EVENT_READ)
+            while not self.is_stopped():
+                events = selector.select()
+                ready_time = time.monotonic()
+                if any(key.fileobj is self.wakeup_receiver for key, _ in events):
+                    break
+                try:
+                    connected_socket = self.listening_socket.accept()[0]
+                except BlockingIOError:
+                    # The connection was abandoned before it could be accepted.
+                    continue
+                connected_socket.setblocking(True)
+                self.accept_latencies.append(time.monotonic() - ready_time)
+                self.wait_times.append(ready_time - self.start_time)
+                if self.connected_socket is None:
+                    self.connected_socket = connected_socket
+                self.connected_sockets.append(connected_socket)
+                self.new_connections.put(connected_socket)
+                if len(self.connected_sockets) == self.max_connections:
+                    break
         self.stop_event.set()
+
+    def metrics(self) -> str:
+        """
+        Describes how many connections were accepted and how quickly.
+
+        :return: The description.
+        """
+        if not self.accept_latencies:
+            return 'No connections accepted.'
+        latencies = self.accept_latencies
+        return (
+            f'{len(latencies)} connections accepted, latency '
+            f'mean {sum(latencies) / len(latencies) * 1e6:.0f}us, '
+            f'max {max(latencies) * 1e6:.0f}us, '
+            f'first after {self.wait_times[0]:.3f}s'
+        )
@@ -0,0 +1,190 @@
+import asyncio
+import time
+from typing import Optional, Tuple
+
+from connect_four import ConnectFour, Player
+from game_connection import BaseGameConnection
+from game_protocol import MessageType, enable_keepalive
+from metrics import MetricsSink
+from network_settings import (CHAT_ENCODING, HANDSHAKE_TIMEOUT,
+                              JOINING_TIMEOUT, MOVE_TIMEOUT)
+
+
+class AsyncGameConnection(BaseGameConnection):
+    """
+    The asyncio counterpart of GameConnection, so that many games
+    can be played from one event loop.
+    """
+
+    def __init__(self,
+                 stream_reader: asyncio.StreamReader,
+                 stream_writer: asyncio.StreamWriter,
+                 player: Player,
+                 username: str,
+                 opponent_username: str = '',
+                 metrics: Optional[MetricsSink] = None,
+                 move_timeout: Optional[float] = MOVE_TIMEOUT) -> None:
+        """
+        Wraps an existing connection. handshake() must be awaited
+        before the game starts.
+
+        :param stream_reader: The stream to receive from your opponent with.
+        :param stream_writer: The stream to send to your opponent with.
+        :param player: The player you are.
+        :param username: Your username.
+        :param opponent_username: Your opponent's username, if known.
+                                  It is replaced by the one they say hello with.
+        :param metrics: Where to record measurements of the connection,
+                        or None to not measure it.
+        :param move_timeout: How many seconds your opponent has to make each move,
+                             or None to wait forever.
+        """
+        super().__init__(player, username, opponent_username, metrics, move_timeout)
+        self.stream_reader: asyncio.StreamReader = stream_reader
+        self.stream_writer: asyncio.StreamWriter = stream_writer
+        connected_socket = stream_writer.get_extra_info('socket')
+        if connected_socket is not None:
+            enable_keepalive(connected_socket)
+
+    @classmethod
+    async def open(cls,
+                   address: Tuple[str, int],
+                   player: Player,
+                   username: str,
+                   timeout: float = JOINING_TIMEOUT,
+                   **kwargs) -> 'AsyncGameConnection':
+        """
+        Connects to your opponent and says hello.
+        :param address: Your opponent's address.
+        :param player: The player you are.
+        :param username: Your username.
+        :param timeout: How many seconds to wait for the connection to succeed.
+        :param kwargs: The rest of the arguments to AsyncGameConnection().
+        :return: The connection.
+        """
+        stream_reader, stream_writer = await asyncio.wait_for(
+            asyncio.open_connection(*address), timeout
+        )
+        connection = cls(stream_reader, stream_writer, player, username, **kwargs)
+        try:
+            await connection.handshake()
+        except BaseException:
+            await connection.disconnect()
+            raise
+        return connection
+
+    async def handshake(self, timeout: Optional[float] = HANDSHAKE_TIMEOUT) -> None:
+        """
+        Says hello to your opponent, and waits for them to say hello back.
+        :param timeout: How many seconds to wait, or None to wait forever.
+        """
+        self.queue_hello()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.said_hello():
+            await self.receive(deadline)
+
+    def peer_address(self) -> Optional[Tuple[str, int]]:
+        address = self.stream_writer.get_extra_info('peername')
+        return address if isinstance(address, tuple) else None
+
+    async def flush(self) -> None:
+        """Sends every queued frame."""
+        if not self.outgoing:
+            return
+        self.stream_writer.write(self.outgoing)
+        self.bytes_sent += len(self.outgoing)
+        self.outgoing.clear()
+        self.urgent = False
+        await self.stream_writer.drain()
+
+    async def receive(self, deadline: Optional[float] = None) -> None:
+        """
+        Sends any queued frames, then waits until more is received from your
+        opponent, handling any frames it completes.
+        :param deadline: When to give up waiting (by time.monotonic()),
+                         or None to wait forever.
+        """
+        await self.flush()
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                raise TimeoutError('Your opponent stopped responding.')
+        try:
+            data = await asyncio.wait_for(self.stream_reader.read(4096), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError('Your opponent stopped responding.')
+        if not data:
+            raise ConnectionError('Your opponent disconnected.')
+        self.reader.feed(data)
+        self.process_frames()
+        if self.urgent:
+            await self.flush()
+
+    async def send_move(self, column: int) -> None:
+        """
+        Sends the column you placed your tile in to your opponent.
+        :param column: The column where your tile was placed.
+        """
+        self.queue_move(column)
+        await self.flush()
+
+    async def receive_move(self, deadline: Optional[float] = None) -> Optional[int]:
+        """
+        Receives the column that your opponent placed their tile in,
+        raising TimeoutError if it doesn't arrive in time.
+
+        Anything else your opponent sends in the meantime is handled,
+        such as chat messages.
+
+        :param deadline: When to give up waiting (by time.monotonic()),
+                         or None for when your opponent runs out of time.
+        :return: The column that your opponent placed their tile in,
+                 or None if they resigned.
+        """
+        if deadline is None:
+            deadline = self.move_deadline
+        start = time.perf_counter()
+        try:
+            while not self.received_moves:
+                await self.receive(deadline)
+            return self.received_moves.popleft()
+        finally:
+            self.record_wait(start)
+
+    async def send_chat(self, message: str) -> None:
+        """
+        Sends a chat message to your opponent.
+        :param message: The message.
+        """
+        self.queue_frame(MessageType.CHAT, message.encode(CHAT_ENCODING))
+        await self.flush()
+
+    async def resign(self) -> None:
+        """Gives up the game."""
+        self.queue_frame(MessageType.RESIGN)
+        await self.flush()
+
+    async def send_state(self, game: ConnectFour) -> None:
+        """
+        Sends the whole game so far to your opponent.
+        :param game: The game.
+        """
+        self.queue_state(game)
+        await self.flush()
+
+    async def disconnect(self) -> None:
+        """
+        Disconnects from the game, sending any queued frames first.
+        If the connection is being measured, its totals are recorded.
+        """
+        try:
+            await self.flush()
+        except ConnectionError:
+            pass
+        self.stream_writer.close()
+        try:
+            await self.stream_writer.wait_closed()
+        except ConnectionError:
+            pass
+        self.record_counters()
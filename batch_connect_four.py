@@ -0,0 +1,202 @@
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from connect_four import Tile
+from player import Player
+
+# The codes used for tiles in BatchConnectFour.grid and
+# BatchConnectFour.winners. A player's code is player.value + 1.
+EMPTY: int = 0
+PLAYER_ONE: int = 1
+PLAYER_TWO: int = 2
+
+
+class BatchConnectFour:
+    """
+    Plays many games of Connect 4 at once, in lockstep.
+
+    Every game's state is stored in NumPy arrays, and each call to place()
+    makes one move in every game, so the cost of a move is shared by all
+    of the games rather than paid once per game.
+    """
+
+    def __init__(self, games: int, rows: int = 6, columns: int = 7,
+                 connect_n: int = 4) -> None:
+        """
+        Creates a batch of new games of Connect 4.
+
+        :param games: The number of games.
+        :param rows: The number of rows.
+        :param columns: The number of columns.
+        :param connect_n: How many tiles in a row to win.
+        """
+        self.games: int = games
+        self.rows: int = rows
+        self.columns: int = columns
+        self.connect_n: int = connect_n
+        # Accessed like grid[game, row, column], holding tile codes,
+        # where grid[game, 0, 0] is the bottom-left of that game's grid.
+        self.grid: np.ndarray = np.zeros((games, rows, columns), np.int8)
+        self.column_heights: np.ndarray = np.zeros((games, columns), np.int32)
+        # The value of the player whose turn it is in each game.
+        self.turns: np.ndarray = np.zeros(games, np.bool_)
+        self.move_counts: np.ndarray = np.zeros(games, np.int32)
+        # The tile code of each game's winner, or EMPTY if there isn't one.
+        self.winners: np.ndarray = np.zeros(games, np.int8)
+        self.over: np.ndarray = np.zeros(games, np.bool_)
+
+    def reset(self) -> None:
+        """Resets every game."""
+        self.grid.fill(EMPTY)
+        self.column_heights.fill(0)
+        self.turns.fill(False)
+        self.move_counts.fill(0)
+        self.winners.fill(EMPTY)
+        self.over.fill(False)
+
+    def can_place(self) -> np.ndarray:
+        """
+        Checks which columns a tile can be placed in, for every game.
+
+        No tiles can be placed in a game that is over.
+
+        :return: A (games, columns) array,
+                 True where a tile can be placed.
+        """
+        return (self.column_heights < self.rows) & ~self.over[:, None]
+
+    def place(self, columns: np.ndarray) -> np.ndarray:
+        """
+        Places a tile for the current player of every game,
+        and changes turn to the other player in those games.
+
+        Games where the move is not legal are left unchanged.
+
+        :param columns: The column to place the tile in, for each game.
+        :return: An array of whether the move was legal, for each game.
+        """
+        columns = np.asarray(columns)
+        in_range = (columns >= 0) & (columns < self.columns)
+        clipped = np.where(in_range, columns, 0)
+        every_game = np.arange(self.games)
+        legal = (in_range & ~self.over
+                 & (self.column_heights[every_game, clipped] < self.rows))
+        games = np.flatnonzero(legal)
+        columns = clipped[games]
+        rows = self.column_heights[games, columns]
+        tiles = self.turns[games].astype(np.int8) + 1
+        self.grid[games, rows, columns] = tiles
+        self.column_heights[games, columns] += 1
+        self.move_counts[games] += 1
+        won = self.connects(games, rows, columns, tiles)
+        self.winners[games[won]] = tiles[won]
+        self.over[games] = won | (self.move_counts[games] == self.rows * self.columns)
+        self.turns[games] = ~self.turns[games]
+        return legal
+
+    def connects(self, games: np.ndarray, rows: np.ndarray,
+                 columns: np.ndarray, tiles: np.ndarray) -> np.ndarray:
+        """
+        Checks if tiles are part of a connection,
+        only looking at the lines that pass through each tile.
+
+        :param games: The games the tiles are in.
+        :param rows: The row of each tile.
+        :param columns: The column of each tile.
+        :param tiles: The tile code of each tile.
+        :return: An array of whether each tile is part of a connection.
+        """
+        connected = np.zeros(len(games), np.bool_)
+        for row_step, column_step in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            counts = np.ones(len(games), np.int32)
+            for sign in (1, -1):
+                # Whether the run of tiles has continued up to this distance.
+                running = np.ones(len(games), np.bool_)
+                for distance in range(1, self.connect_n):
+                    row = rows + sign * distance * row_step
+                    column = columns + sign * distance * column_step
+                    running &= ((row >= 0) & (row < self.rows)
+                                & (column >= 0) & (column < self.columns))
+                    row = np.clip(row, 0, self.rows - 1)
+                    column = np.clip(column, 0, self.columns - 1)
+                    running &= self.grid[games, row, column] == tiles
+                    counts += running
+            connected |= counts >= self.connect_n
+        return connected
+
+    def random_columns(self, generator: np.random.Generator) -> np.ndarray:
+        """
+        Chooses a random column that can be placed in, for every game.
+
+        :param generator: The random number generator to use.
+        :return: The chosen column for each game,
+                 which is 0 for games that are over.
+        """
+        weights = generator.random((self.games, self.columns))
+        weights[~self.can_place()] = -1
+        return weights.argmax(axis=1)
+
+    def winner(self, game: int) -> Optional[Player]:
+        """
+        Determines the winner of one of the games.
+
+        :param game: The index of the game.
+        :return: The winner of the game,
+                 or None if the game is either not over or ended in a draw.
+        """
+        return tile_from_code(self.winners[game])
+
+    def winner_list(self) -> List[Tile]:
+        """
+        Gets the winner of every game, like ConnectFour.winner().
+
+        :return: The winners of the games.
+        """
+        return [tile_from_code(code) for code in self.winners]
+
+
+def tile_from_code(code: int) -> Tile:
+    """
+    Converts a tile code to the player it represents.
+
+    :param code: The tile code.
+    :return: The player, or None for an empty tile.
+    """
+    if code == EMPTY:
+        return None
+    return Player(bool(code - 1))
+
+
+def simulate_random_games(games: int,
+                          rows: int = 6,
+                          columns: int = 7,
+                          connect_n: int = 4,
+                          seed: Optional[int] = None) -> BatchConnectFour:
+    """
+    Plays a batch of games where every move is chosen at random.
+
+    :param games: The number of games.
+    :param rows: The number of rows.
+    :param columns: The number of columns.
+    :param connect_n: How many tiles in a row to win.
+    :param seed: The seed for the random number generator.
+    :return: The finished games.
+    """
+    generator = np.random.default_rng(seed)
+    batch = BatchConnectFour(games, rows, columns, connect_n)
+    while not batch.over.all():
+        batch.place(batch.random_columns(generator))
+    return batch
+
+
+if __name__ == '__main__':
+    start = time.monotonic()
+    finished = simulate_random_games(100000, seed=0)
+    seconds = time.monotonic() - start
+    print(f'{finished.games} random games in {seconds:.2f}s '
+          f'({finished.games / seconds:.0f} games/s)')
+    for code, name in ((PLAYER_ONE, 'Player one'), (PLAYER_TWO, 'Player two'),
+                       (EMPTY, 'Draws')):
+        print(f'{name}: {np.count_nonzero(finished.winners == code)}')
@@ -0,0 +1,261 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+from connect_four import ConnectFour
+from solver import Solver
+
+# One measurement, as written to the JSON output.
+Result = Dict[str, Any]
+
+# The board sizes (rows, columns, connect_n) and depths perft is run for.
+PERFT_SIZES: List[Tuple[int, int, int, int]] = [
+    (6, 7, 4, 6),
+    (5, 6, 4, 6),
+    (4, 4, 3, 8),
+    (8, 9, 5, 5),
+]
+
+# The board sizes that random games are played on.
+PLAYOUT_SIZES: List[Tuple[int, int, int]] = [
+    (6, 7, 4),
+    (4, 4, 3),
+    (12, 14, 6),
+]
+
+# The positions the solver is timed on: the board size (rows, columns,
+# connect_n), the 1-indexed columns played to reach the position,
+# and its known score, which the solver must agree with.
+SOLVER_POSITIONS: List[Tuple[int, int, int, str, int]] = [
+    (6, 7, 4, '1114176155432314575644', 0),
+    (4, 5, 4, '', 0),
+    (6, 7, 4, '2252576253462244111563365343671351441', -1),
+    (5, 5, 4, '', 0),
+]
+
+
+def perft(game: ConnectFour, depth: int) -> int:
+    """
+    Counts the sequences of legal moves of a certain length.
+    No moves are legal once the game is over.
+
+    :param game: The game to start from. It is left as it was found.
+    :param depth: The number of moves in each sequence.
+    :return: The number of sequences.
+    """
+    if depth == 0:
+        return 1
+    if game.is_over():
+        return 0
+    nodes = 0
+    for column in range(game.columns):
+        if game.can_place(column):
+            game.place_tile(column)
+            nodes += perft(game, depth - 1)
+            game.unplace()
+    return nodes
+
+
+def random_game(game: ConnectFour, generator: random.Random) -> None:
+    """
+    Plays random moves until the game is over.
+
+    :param game: The game to play.
+    :param generator: The random number generator to use.
+    """
+    columns = range(game.columns)
+    while not game.is_over():
+        game.place(generator.choice([column for column in columns
+                                     if game.can_place(column)]))
+
+
+def midgame(rows: int = 6, columns: int = 7, connect_n: int = 4,
+            moves: int = 20, seed: int = 0) -> ConnectFour:
+    """
+    Creates a game that is partly played, but not over.
+
+    :param rows: The number of rows.
+    :param columns: The number of columns.
+    :param connect_n: How many tiles in a row to win.
+    :param moves: The number of moves to play.
+    :param seed: The seed of the random moves.
+    :return: The game.
+    """
+    generator = random.Random(seed)
+    while True:
+        game = ConnectFour(rows, columns, connect_n)
+        while game.move_count < moves and not game.is_over():
+            game.place(generator.choice([column for column in range(columns)
+                                         if game.can_place(column)]))
+        if not game.is_over():
+            return game
+
+
+def throughput(name: str, operation: Callable[[], Any],
+               number: int, repeat: int = 5) -> Result:
+    """
+    Measures how many times per second an operation can run,
+    taking the best of several repeats.
+
+    :param name: The name of the measurement.
+    :param operation: The operation to run.
+    :param number: How many times to run the operation in each repeat.
+    :param repeat: How many repeats to run.
+    :return: The measurement.
+    """
+    best = min(timeit.repeat(operation, number=number, repeat=repeat))
+    return {'name': name, 'unit': 'ops/s', 'value': number / best}
+
+
+def benchmark_operations(scale: float) -> List[Result]:
+    """Measures the throughput of the ConnectFour methods."""
+    game = midgame()
+    sequence = list(game.moves)
+    fresh = ConnectFour()
+
+    def play_sequence() -> None:
+        fresh.reset()
+        for column in sequence:
+            fresh.place(column)
+
+    number = max(1, int(20000 * scale))
+    results = [
+        throughput('place', play_sequence, max(1, number // len(sequence))),
+        throughput('is_over', game.is_over, number),
+        throughput('winner', game.winner, number),
+        throughput('winning_connections', game.winning_connections,
+                   max(1, number // 10)),
+        throughput('threats', game.threats, max(1, number // 10)),
+        throughput('__str__', game.__str__, max(1, number // 10)),
+    ]
+    # play_sequence() makes one place() per move.
+    results[0]['value'] *= len(sequence)
+    return results
+
+
+def benchmark_perft(scale: float) -> List[Result]:
+    """Counts and times perft on each of the PERFT_SIZES."""
+    results = []
+    for rows, columns, connect_n, depth in PERFT_SIZES:
+        if scale < 1:
+            depth -= 1
+        game = ConnectFour(rows, columns, connect_n)
+        start = time.perf_counter()
+        nodes = perft(game, depth)
+        seconds = time.perf_counter() - start
+        results.append({
+            'name': f'perft {rows}x{columns} connect {connect_n} depth {depth}',
+            'unit': 'nodes/s',
+            'value': nodes / seconds,
+            'nodes': nodes,
+            'seconds': seconds,
+        })
+    return results
+
+
+def benchmark_playouts(scale: float) -> List[Result]:
+    """Measures random games per second on each of the PLAYOUT_SIZES."""
+    results = []
+    for rows, columns, connect_n in PLAYOUT_SIZES:
+        generator = random.Random(0)
+        game = ConnectFour(rows, columns, connect_n)
+        games = max(1, int(2000 * scale * 42 / (rows * columns)))
+        start = time.perf_counter()
+        for _ in range(games):
+            game.reset()
+            random_game(game, generator)
+        seconds = time.perf_counter() - start
+        results.append({
+            'name': f'random games {rows}x{columns} connect {connect_n}',
+            'unit': 'games/s',
+            'value': games / seconds,
+        })
+    return results
+
+
+def benchmark_memory(scale: float) -> List[Result]:
+    """Measures how much memory new and partly played games take up."""
+    results = []
+    games = max(1, int(2000 * scale))
+    for name, create in (('new game', ConnectFour),
+                         ('midgame', lambda: midgame(seed=len(kept)))):
+        kept = []
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for _ in range(games):
+            kept.append(create())
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results.append({
+            'name': f'memory per {name}',
+            'unit': 'bytes',
+            'value': (after - before) / games,
+        })
+    return results
+
+
+def benchmark_solver(scale: float) -> List[Result]:
+    """Solves each of the SOLVER_POSITIONS, checking their scores."""
+    results = []
+    positions = SOLVER_POSITIONS if scale >= 1 else SOLVER_POSITIONS[:3]
+    for rows, columns, connect_n, moves, expected in positions:
+        game = ConnectFour(rows, columns, connect_n)
+        for move in moves:
+            game.place(int(move) - 1)
+        solver = Solver()
+        score = solver.solve(game)
+        if score != expected:
+            raise AssertionError(f'The solver scored {moves} {score}, not {expected}.')
+        statistics = solver.statistics
+        results.append({
+            'name': f'solve {rows}x{columns} connect {connect_n} '
+                    f'after {len(moves)} moves',
+            'unit': 'nodes/s',
+            'value': statistics.nodes_per_second(),
+            'nodes': statistics.nodes,
+            'seconds': statistics.seconds,
+        })
+    return results
+
+
+def run(scale: float = 1) -> Dict[str, Any]:
+    """
+    Runs every benchmark.
+
+    :param scale: How much work to do, relative to a normal run.
+    :return: The results, along with details of the machine they ran on.
+    """
+    return {
+        'python': sys.version,
+        'platform': platform.platform(),
+        'time': time.time(),
+        'results': benchmark_operations(scale)
+                   + benchmark_perft(scale)
+                   + benchmark_playouts(scale)
+                   + benchmark_memory(scale)
+                   + benchmark_solver(scale),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmarks ConnectFour.')
+    parser.add_argument('--json', help='a file to write the results to as JSON')
+    parser.add_argument('--quick', action='store_true',
+                        help='do less work, for a rough but fast result')
+    args = parser.parse_args()
+    report = run(0.1 if args.quick else 1)
+    for result in report['results']:
+        print(f'{result["name"]:<40} {result["value"]:>14,.0f} {result["unit"]}')
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,409 @@
+import time
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from connect_four import ConnectFour
+
+if TYPE_CHECKING:
+    from opening_book import OpeningBook
+
+# The score of winning on the very next move.
+# Wins further in the future score one less for each move it takes,
+# so the search prefers quick wins and slow losses.
+WIN_SCORE: int = 1000000
+
+# Any score further from 0 than this is a win or a loss.
+WIN_BOUND: int = WIN_SCORE // 2
+
+# How the score stored in a transposition table entry
+# relates to the actual score of the position.
+EXACT: int = 0
+LOWER_BOUND: int = 1
+UPPER_BOUND: int = 2
+
+
+class SearchTimeout(Exception):
+    """Raised inside a search when its time budget has run out."""
+
+
+class SearchStatistics:
+    """Counters collected while searching for a move."""
+
+    def __init__(self) -> None:
+        """Creates statistics with every counter at 0."""
+        self.nodes: int = 0
+        self.table_probes: int = 0
+        self.table_hits: int = 0
+        self.depth: int = 0
+        self.seconds: float = 0
+
+    def nodes_per_second(self) -> float:
+        """
+        Gets how many positions were searched per second.
+
+        :return: The number of nodes per second.
+        """
+        if not self.seconds:
+            return 0
+        return self.nodes / self.seconds
+
+    def table_hit_rate(self) -> float:
+        """
+        Gets how often a position was found in the transposition table.
+
+        :return: The fraction of probes that found their position.
+        """
+        if not self.table_probes:
+            return 0
+        return self.table_hits / self.table_probes
+
+    def __str__(self) -> str:
+        return (
+            f'depth {self.depth}, {self.nodes} nodes in {self.seconds:.3f}s '
+            f'({self.nodes_per_second():.0f} nodes/s), '
+            f'TT hit rate {self.table_hit_rate():.1%}'
+        )
+
+
+class TranspositionTable:
+    """
+    A fixed size table of previously searched positions.
+
+    Each position key maps to a single slot, and a new entry always
+    replaces whatever was in its slot, so memory use never grows.
+    """
+
+    def __init__(self, size: int = 1 << 20) -> None:
+        """
+        Creates an empty transposition table.
+
+        :param size: How many entries the table can hold.
+        """
+        self.size: int = size
+        self.keys: List[Optional[int]] = [None] * size
+        self.depths: List[int] = [0] * size
+        self.flags: List[int] = [EXACT] * size
+        self.scores: List[int] = [0] * size
+        self.columns: List[int] = [0] * size
+
+    def clear(self) -> None:
+        """Removes every entry from the table."""
+        self.keys = [None] * self.size
+
+    def index(self, key: int) -> Optional[int]:
+        """
+        Finds the slot holding a position.
+
+        :param key: The key of the position.
+        :return: The slot of the position, or None if it isn't in the table.
+        """
+        index = key % self.size
+        if self.keys[index] != key:
+            return None
+        return index
+
+    def store(self, key: int, depth: int, flag: int,
+              score: int, column: int) -> None:
+        """
+        Stores the result of searching a position.
+
+        :param key: The key of the position.
+        :param depth: How many moves deep the position was searched.
+        :param flag: Whether the score is EXACT, a LOWER_BOUND,
+                     or an UPPER_BOUND.
+        :param score: The score of the position.
+        :param column: The best column found for the position.
+        """
+        index = key % self.size
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.flags[index] = flag
+        self.scores[index] = score
+        self.columns[index] = column
+
+
+class ComputerPlayer:
+    """
+    Chooses moves for a game of Connect 4.
+
+    Uses negamax search with alpha-beta pruning and a transposition table,
+    searching one move deeper at a time until its time budget runs out.
+    """
+
+    def __init__(self,
+                 time_limit: float = 1,
+                 max_depth: Optional[int] = None,
+                 table_size: int = 1 << 20,
+                 book: Optional['OpeningBook'] = None) -> None:
+        """
+        Creates a computer player.
+
+        :param time_limit: How many seconds to spend choosing a move.
+        :param max_depth: How many moves deep to search at most,
+                          or None to search until time runs out.
+        :param table_size: How many entries the transposition table holds.
+        :param book: An opening book to look positions up in before searching.
+        """
+        self.time_limit: float = time_limit
+        self.max_depth: Optional[int] = max_depth
+        self.table: TranspositionTable = TranspositionTable(table_size)
+        self.book: Optional['OpeningBook'] = book
+        self.statistics: SearchStatistics = SearchStatistics()
+        # The score of the last chosen column,
+        # from the point of view of the player who chose it.
+        self.score: int = 0
+        self.deadline: float = 0
+        self.order: List[int] = []
+        # Added to every key in the table, so that positions of different
+        # sizes of game, which can have the same key, are told apart.
+        self.size_key: int = 0
+
+    def __call__(self, game: ConnectFour) -> int:
+        return self.choose_column(game)
+
+    def choose_column(self, game: ConnectFour) -> int:
+        """
+        Chooses the column to place the current player's tile in.
+
+        The game is searched in place, and is left as it was found.
+        The game must not be over.
+
+        :param game: The game to choose a move for.
+        :return: The chosen column.
+        """
+        self.statistics = SearchStatistics()
+        start = time.monotonic()
+        if self.book is not None:
+            entry = self.book.lookup(game)
+            if entry is not None and game.can_place(entry[1]):
+                self.score = entry[0]
+                self.statistics.seconds = time.monotonic() - start
+                return entry[1]
+        self.deadline = start + self.time_limit
+        move_count = game.move_count
+        self.order = center_first(game.columns)
+        self.size_key = size_key(game)
+        threats = game.threats()
+        winning_columns = threats.winning_columns[game.turn.value]
+        if winning_columns:
+            self.score = WIN_SCORE
+            self.statistics.seconds = time.monotonic() - start
+            return winning_columns[0]
+        # Only the forced column needs searching, unless the opponent
+        # has more than one threat and the game is lost anyway.
+        root_order = self.order
+        if len(threats.forced_columns) == 1:
+            root_order = threats.forced_columns
+        best_column = next(filter(game.can_place, root_order))
+        self.score = 0
+        max_depth = game.rows * game.columns - game.move_count
+        if self.max_depth is not None:
+            max_depth = min(max_depth, self.max_depth)
+        try:
+            for depth in range(1, max_depth + 1):
+                score, column = self.search_root(game, depth, root_order)
+                best_column = column
+                self.score = score
+                self.statistics.depth = depth
+                # There is no point searching deeper once the result is known.
+                if abs(score) > WIN_BOUND:
+                    break
+        except SearchTimeout:
+            # Undo the moves of the search that was interrupted.
+            while game.move_count > move_count:
+                game.unplace()
+        self.statistics.seconds = time.monotonic() - start
+        return best_column
+
+    def search_root(self, game: ConnectFour, depth: int,
+                    order: List[int]) -> Tuple[int, int]:
+        """
+        Searches every move of the current player to a fixed depth.
+
+        :param game: The game to search.
+        :param depth: How many moves deep to search.
+        :param order: The order to try the columns in.
+        :return: The score of the best move, and its column.
+        """
+        best_score = -WIN_SCORE - 1
+        best_column = -1
+        key = game.key | self.size_key
+        index = self.table.index(key)
+        if index is not None and self.table.columns[index] in order:
+            order = move_first(order, self.table.columns[index])
+        for column in order:
+            if not game.can_place(column):
+                continue
+            game.place_tile(column)
+            if game.winning_player is not None:
+                score = WIN_SCORE
+            else:
+                score = -self.negamax(game, depth - 1, -WIN_SCORE - 1,
+                                      -best_score, 1)
+            game.unplace()
+            if score > best_score:
+                best_score = score
+                best_column = column
+        self.table.store(key, depth, EXACT, best_score, best_column)
+        return best_score, best_column
+
+    def negamax(self, game: ConnectFour, depth: int,
+                alpha: int, beta: int, ply: int) -> int:
+        """
+        Scores a position from the point of view of the current player.
+
+        :param game: The game to search.
+        :param depth: How many more moves deep to search.
+        :param alpha: The score the current player is already guaranteed.
+        :param beta: The score the opponent is already guaranteed.
+        :param ply: How many moves have been made since the root.
+        :return: The score of the position.
+        """
+        statistics = self.statistics
+        statistics.nodes += 1
+        if not statistics.nodes & 1023 and time.monotonic() > self.deadline:
+            raise SearchTimeout
+        bitboard = game.bitboards[game.turn.value]
+        opponent = game.bitboards[not game.turn.value]
+        mask = bitboard | opponent
+        playable = (mask + game.bottom_mask) & game.board_mask
+        # Win immediately if possible.
+        if game.winning_cells(bitboard) & playable:
+            return WIN_SCORE - ply
+        if game.move_count == game.rows * game.columns:
+            return 0
+        if depth <= 0:
+            return evaluate(game, bitboard, opponent, mask)
+        # Look up the position in the transposition table.
+        table = self.table
+        key = game.key | self.size_key
+        statistics.table_probes += 1
+        index = table.index(key)
+        table_column = None
+        if index is not None:
+            statistics.table_hits += 1
+            table_column = table.columns[index]
+            if table.depths[index] >= depth:
+                score = from_table(table.scores[index], ply)
+                flag = table.flags[index]
+                if flag == EXACT:
+                    return score
+                if flag == LOWER_BOUND:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+        original_alpha = alpha
+        best_score = -WIN_SCORE - 1
+        best_column = -1
+        order = self.order
+        if table_column is not None:
+            order = move_first(order, table_column)
+        for column in order:
+            if not game.can_place(column):
+                continue
+            game.place_tile(column)
+            score = -self.negamax(game, depth - 1, -beta, -alpha, ply + 1)
+            game.unplace()
+            if score > best_score:
+                best_score = score
+                best_column = column
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        table.store(key, depth, flag, to_table(best_score, ply), best_column)
+        return best_score
+
+
+def evaluate(game: ConnectFour, bitboard: int,
+             opponent: int, mask: int) -> int:
+    """
+    Estimates the score of a position without searching it,
+    by counting the empty cells that would complete a connection
+    for each player.
+
+    :param game: The game being searched.
+    :param bitboard: The current player's bitboard.
+    :param opponent: The other player's bitboard.
+    :param mask: The bitboard of every tile.
+    :return: The estimated score from the point of view of the current player.
+    """
+    empty = game.board_mask & ~mask
+    threats = bin(game.winning_cells(bitboard) & empty).count('1')
+    opponent_threats = bin(game.winning_cells(opponent) & empty).count('1')
+    return threats - opponent_threats
+
+
+def size_key(game: ConnectFour) -> int:
+    """
+    Gets a number to add to the keys of a size of game, above the bits
+    that its keys use, so that keys are unique across every size of game.
+
+    The leading 1 marks where the size starts,
+    so that keys of different lengths can't overlap.
+
+    :param game: The game.
+    :return: The rows, columns and connect_n of the game, shifted above its keys.
+    """
+    size = (1 << 48) | (game.rows << 32) | (game.columns << 16) | game.connect_n
+    return size << (game.column_bits * game.columns)
+
+
+def to_table(score: int, ply: int) -> int:
+    """
+    Converts a score relative to the root of the search into one
+    relative to the position, so it can be stored in a transposition table.
+    """
+    if score > WIN_BOUND:
+        return score + ply
+    if score < -WIN_BOUND:
+        return score - ply
+    return score
+
+
+def from_table(score: int, ply: int) -> int:
+    """The reverse of to_table()."""
+    if score > WIN_BOUND:
+        return score - ply
+    if score < -WIN_BOUND:
+        return score + ply
+    return score
+
+
+def center_first(columns: int) -> List[int]:
+    """
+    Orders the columns from the center outwards.
+
+    :param columns: The number of columns.
+    :return: The ordered columns.
+    """
+    return sorted(range(columns), key=lambda column: abs(2 * column - columns + 1))
+
+
+def move_first(order: List[int], column: int) -> List[int]:
+    """
+    Moves a column to the front of an order.
+
+    :param order: The order of the columns.
+    :param column: The column to try first.
+    :return: The new order.
+    """
+    return [column] + [other for other in order if other != column]
+
+
+if __name__ == '__main__':
+    game = ConnectFour()
+    computer = ComputerPlayer(time_limit=1)
+    while not game.is_over():
+        game.place(computer.choose_column(game))
+        print(game)
+        print(computer.statistics)
+        print()
+    print(f'Winner: {game.winner()}')
@@ -1,4 +1,6 @@
-from typing import List, Tuple, Optional
+from array import array
+from functools import lru_cache
+from typing import List, NamedTuple, Tuple, Optional
 
 from player import Player
 
@@ -12,10 +14,78 @@ Cell = Tuple[int, int]
 Connection = Tuple[Cell]
 Connections = List[Connection]
 
+# How far to shift a bitboard to move one cell in a direction,
+# paired with the (row, column) step of that direction.
+Directions = Tuple[Tuple[int, Cell], ...]
+
+
+class Threats(NamedTuple):
+    """
+    What each player threatens in a position, from ConnectFour.threats().
+    Pairs are indexed by player.value, and cells are bitboards.
+    """
+
+    # The columns each player would win by placing in right now.
+    winning_columns: Tuple[List[int], List[int]]
+    # The columns the player to move must place in to stop
+    # their opponent winning with their next move.
+    # More than one means the opponent can't be stopped.
+    forced_columns: List[int]
+    # The columns that would let the opponent win straight away,
+    # by placing under one of their threats, without winning first.
+    losing_columns: List[int]
+    # The empty cells that would complete a connection for each player.
+    threat_cells: Tuple[int, int]
+    # The threat cells on odd rows (counting the bottom row as row 1),
+    # and on even rows. Player one usually needs odd threats to win
+    # as the board fills up, and player two even threats.
+    odd_threats: Tuple[int, int]
+    even_threats: Tuple[int, int]
+
+
+@lru_cache(maxsize=None)
+def grid_directions(rows: int) -> Directions:
+    """
+    Gets the directions that connections can be made in,
+    shared by every game with the same number of rows.
+    The order matches the order connections are reported in.
+
+    :param rows: The number of rows.
+    :return: The directions.
+    """
+    column_bits = rows + 1
+    return (
+        (column_bits, (0, 1)),        # Row
+        (1, (1, 0)),                  # Column
+        (column_bits + 1, (1, 1)),    # Up-right diagonal
+        (column_bits - 1, (1, -1)),   # Up-left diagonal
+    )
+
+
+def smallest_typecode(maximum: int) -> str:
+    """
+    Gets the array typecode of the smallest unsigned integer type
+    that can hold a value.
+
+    :param maximum: The largest value the array will hold.
+    :return: The typecode.
+    """
+    for typecode in 'BHIQ':
+        if maximum < 1 << (8 * array(typecode).itemsize):
+            return typecode
+    raise OverflowError(f'{maximum} is too large for an array.')
+
 
 class ConnectFour:
     """Handles game logic for Connect 4."""
 
+    __slots__ = (
+        'rows', 'columns', 'connect_n', 'bitboards', 'column_heights',
+        'turn', 'move_count', 'winning_player', 'winning_move', 'moves',
+        'undone_moves', 'key', 'mirror_key', 'column_bits', 'bottom_mask',
+        'board_mask', 'odd_rows_mask', 'directions',
+    )
+
     def __init__(self, rows: int = 6, columns: int = 7,
                  connect_n: int = 4) -> None:
         """
@@ -25,57 +95,260 @@ class ConnectFour:
         :param columns: The number of columns.
         :param connect_n: How many tiles in a row to win.
         """
-        # Accessed like grid[row][column],
-        # where grid[0][0] is the bottom-left of the grid,
-        # and grid[0][columns] is the bottom-right of the grid.
-        self.grid: TileGrid = [[]]
-        self.column_heights: List[int] = []
         self.rows: int = rows
         self.columns: int = columns
         self.connect_n: int = connect_n
+        # The tiles are stored as one bitboard (integer) per player,
+        # accessed like bitboards[player.value].
+        # Each column takes up (rows + 1) bits, where bit 0 is the
+        # bottom-left of the grid. The extra bit at the top of each column
+        # is always empty, which stops connections from wrapping around
+        # from one column into the next.
+        self.bitboards: List[int] = [0, 0]
+        self.column_heights: array = array('B')
         self.turn: Player = Player.ONE
+        # Updated by place(), so that is_over() and winner()
+        # don't need to search the grid.
+        self.move_count: int = 0
+        self.winning_player: Tile = None
+        # The index in moves of the move that won the game.
+        self.winning_move: Optional[int] = None
+        # The columns that have been placed in, in order,
+        # and the columns that have been undone and can be redone.
+        # Arrays of the smallest type that can hold a column are used,
+        # as they take up much less memory than lists.
+        self.moves: array = array('B')
+        self.undone_moves: array = array('B')
+        # Numbers that uniquely identify the tiles on the grid,
+        # and the tiles on the grid mirrored left to right.
+        # See position_key() for how they are built.
+        self.key: int = 0
+        self.mirror_key: int = 0
+        # Constants derived from the size of the grid.
+        self.column_bits: int = rows + 1
+        self.bottom_mask: int = sum(
+            1 << (column * self.column_bits) for column in range(columns)
+        )
+        self.board_mask: int = self.bottom_mask * ((1 << rows) - 1)
+        self.odd_rows_mask: int = self.bottom_mask * sum(1 << row for row in range(0, rows, 2))
+        self.directions: Directions = grid_directions(rows)
         self.reset()
 
+    @property
+    def grid(self) -> TileGrid:
+        """
+        The tiles of the game as a list of rows.
+
+        The grid is built from the bitboards each time it is accessed,
+        so it should not be used in performance sensitive code.
+
+        Accessed like grid[row][column],
+        where grid[0][0] is the bottom-left of the grid,
+        and grid[0][columns - 1] is the bottom-right of the grid.
+        """
+        return [[self.tile(row, column) for column in range(self.columns)]
+                for row in range(self.rows)]
+
     def reset(self) -> None:
         """Resets the game."""
-        self.grid = [[None] * self.columns for _ in range(self.rows)]
-        self.column_heights = [0] * self.columns
+        self.bitboards = [0, 0]
+        self.column_heights = array(smallest_typecode(self.rows), [0]) * self.columns
         self.turn = Player.ONE
+        self.move_count = 0
+        self.winning_player = None
+        self.winning_move = None
+        self.moves = array(smallest_typecode(self.columns))
+        self.undone_moves = array(smallest_typecode(self.columns))
+        self.key = self.bottom_mask
+        self.mirror_key = self.bottom_mask
+
+    def copy(self) -> 'ConnectFour':
+        """
+        Copies the game, so that the copy can be searched or played on
+        without changing this game.
+
+        :return: The copy.
+        """
+        game = type(self).__new__(type(self))
+        for name in self.__slots__:
+            setattr(game, name, getattr(self, name))
+        game.bitboards = list(self.bitboards)
+        game.column_heights = self.column_heights[:]
+        game.moves = self.moves[:]
+        game.undone_moves = self.undone_moves[:]
+        return game
+
+    def tile(self, row: int, column: int) -> Tile:
+        """
+        Gets the tile at the specified cell.
+
+        :param row: The row of the cell.
+        :param column: The column of the cell.
+        :return: The player whose tile is in the cell,
+                 or None if the cell is empty.
+        """
+        bit = 1 << (column * self.column_bits + row)
+        if self.bitboards[Player.ONE.value] & bit:
+            return Player.ONE
+        if self.bitboards[Player.TWO.value] & bit:
+            return Player.TWO
+        return None
+
+    def position_key(self) -> int:
+        """
+        Gets a number that uniquely identifies the tiles on the grid,
+        for a given number of rows and columns.
+
+        The key is player one's bitboard plus the bitboard of every tile
+        plus one tile at the bottom of each column. Each column of the key
+        is then a 1 above the column's tiles, followed by a 1 for each of
+        player one's tiles and a 0 for each of player two's tiles.
+
+        The key is kept up to date by place() and unplace(),
+        so this is the same as reading the key attribute.
+
+        :return: The key of the position.
+        """
+        return self.key
+
+    def canonical_key(self) -> int:
+        """
+        Gets a number that identifies the tiles on the grid,
+        which is the same for a position and its mirror image,
+        for a given number of rows and columns.
+
+        :return: The smaller of the position's key and its mirror's key.
+        """
+        return min(self.key, self.mirror_key)
 
     def can_place(self, column: int) -> bool:
         """
         Checks if a tile can be placed in the specified column.
-        AKA checks if the column is full.
+        AKA checks if the column is on the grid and isn't full.
 
         :param column: The column to check.
         :return: True if a tile can be placed in the column, false otherwise.
         """
-        return self.column_heights[column] < self.rows
+        return 0 <= column < self.columns and self.column_heights[column] < self.rows
 
     def place(self, column: int) -> bool:
         """
         Places a tile for the current player in the specified column.
         Changes turn to the other player.
 
+        Only the lines passing through the new tile are checked for a
+        connection, and the result is remembered for is_over() and winner().
+
+        Any moves that were undone can no longer be redone.
+
         :param column: The column to place the tile in.
         :return: True if placeable(column) is true, false otherwise.
         """
         if not self.can_place(column):
             return False
-        row = self.column_heights[column]
-        self.grid[row][column] = self.turn
-        self.column_heights[column] += 1
-        self.turn = Player(not self.turn)
+        if self.undone_moves:
+            del self.undone_moves[:]
+        self.place_tile(column)
         return True
 
+    def place_tile(self, column: int) -> None:
+        """
+        Places a tile for the current player in the specified column,
+        without checking if the column is full or clearing undone_moves.
+
+        :param column: The column to place the tile in.
+        """
+        turn = self.turn
+        row = self.column_heights[column]
+        bit = 1 << (column * self.column_bits + row)
+        mirror_bit = 1 << ((self.columns - 1 - column) * self.column_bits + row)
+        if turn is Player.ONE:
+            bitboard = self.bitboards[0] | bit
+            self.bitboards[0] = bitboard
+            # Player one's tiles are counted twice, see position_key().
+            self.key += bit << 1
+            self.mirror_key += mirror_bit << 1
+            self.turn = Player.TWO
+        else:
+            bitboard = self.bitboards[1] | bit
+            self.bitboards[1] = bitboard
+            self.key += bit
+            self.mirror_key += mirror_bit
+            self.turn = Player.ONE
+        self.column_heights[column] = row + 1
+        self.moves.append(column)
+        self.move_count += 1
+        if self.winning_player is None and self.connects(bitboard, bit):
+            self.winning_player = turn
+            self.winning_move = self.move_count - 1
+
+    def unplace(self) -> Optional[int]:
+        """
+        Removes the last tile that was placed.
+        Changes turn back to the player who placed it.
+
+        Unlike undo(), the move cannot be redone afterwards.
+        This is meant for searching, where moves are made and unmade often.
+
+        :return: The column the tile was removed from,
+                 or None if no tiles have been placed.
+        """
+        if not self.moves:
+            return None
+        column = self.moves.pop()
+        self.move_count -= 1
+        if self.winning_move == self.move_count:
+            self.winning_player = None
+            self.winning_move = None
+        row = self.column_heights[column] - 1
+        self.column_heights[column] = row
+        bit = 1 << (column * self.column_bits + row)
+        mirror_bit = 1 << ((self.columns - 1 - column) * self.column_bits + row)
+        if self.turn is Player.TWO:
+            self.bitboards[0] &= ~bit
+            self.key -= bit << 1
+            self.mirror_key -= mirror_bit << 1
+            self.turn = Player.ONE
+        else:
+            self.bitboards[1] &= ~bit
+            self.key -= bit
+            self.mirror_key -= mirror_bit
+            self.turn = Player.TWO
+        return column
+
+    def undo(self) -> Optional[int]:
+        """
+        Undoes the last move, so that it can be redone with redo().
+
+        :return: The column of the move that was undone,
+                 or None if there are no moves to undo.
+        """
+        column = self.unplace()
+        if column is not None:
+            self.undone_moves.append(column)
+        return column
+
+    def redo(self) -> Optional[int]:
+        """
+        Redoes the last move that was undone with undo().
+
+        :return: The column of the move that was redone,
+                 or None if there are no moves to redo.
+        """
+        if not self.undone_moves:
+            return None
+        column = self.undone_moves.pop()
+        self.place_tile(column)
+        return column
+
     def is_over(self) -> bool:
         """
         Checks if the game is over or not.
 
         :return: True if the game is over, false otherwise.
         """
-        is_winner = self.winner() is not None
-        grid_is_full = not any(map(self.can_place, range(self.columns)))
+        is_winner = self.winning_player is not None
+        grid_is_full = self.move_count == self.rows * self.columns
         return is_winner or grid_is_full
 
     def winner(self) -> Optional[Player]:
@@ -85,13 +358,124 @@ class ConnectFour:
         You should use is_over() to check if the game has ended,
         and then winner() afterwards to determine the result.
 
+        If tiles are placed after the game is over,
+        the first player to have connected N tiles remains the winner.
+
         :return: The winner of the game,
                  or None if the game is either not over or ended in a draw.
         """
-        connections = self.winning_connections()
-        if not connections:
-            return None
-        return self.grid[connections[0][0][0]][connections[0][0][1]]
+        return self.winning_player
+
+    def connects(self, bitboard: int, bit: int) -> bool:
+        """
+        Checks if a tile is part of a connection,
+        only looking at the lines that pass through the tile.
+
+        :param bitboard: The bitboard containing the tile.
+        :param bit: The bit of the tile.
+        :return: True if the tile is part of a connection, false otherwise.
+        """
+        for shift, _ in self.directions:
+            count = 1
+            neighbor = bit >> shift
+            while count < self.connect_n and bitboard & neighbor:
+                count += 1
+                neighbor >>= shift
+            neighbor = bit << shift
+            while count < self.connect_n and bitboard & neighbor:
+                count += 1
+                neighbor <<= shift
+            if count >= self.connect_n:
+                return True
+        return False
+
+    def has_connection(self, bitboard: int) -> bool:
+        """
+        Checks if a bitboard contains N tiles in a row.
+
+        :param bitboard: The bitboard to check.
+        :return: True if there is at least one connection, false otherwise.
+        """
+        return any(self.connection_starts(bitboard, shift)
+                   for shift, _ in self.directions)
+
+    def connection_starts(self, bitboard: int, shift: int) -> int:
+        """
+        Finds the connections in a bitboard along a single direction.
+
+        :param bitboard: The bitboard to search.
+        :param shift: How far to shift the bitboard to move one cell
+                      along the direction.
+        :return: A bitboard of the lowest bit of every connection.
+        """
+        starts = bitboard
+        for i in range(1, self.connect_n):
+            starts &= bitboard >> (shift * i)
+            if not starts:
+                break
+        return starts
+
+    def winning_cells(self, bitboard: int) -> int:
+        """
+        Finds every cell that would complete a connection for a bitboard.
+
+        :param bitboard: The bitboard of one player's tiles.
+        :return: A bitboard of the cells, which may already be occupied.
+        """
+        cells = 0
+        for shift, _ in self.directions:
+            # after[i] has the cells followed by i tiles along the direction,
+            # and before[i] has the cells preceded by i tiles.
+            after = [-1]
+            before = [-1]
+            for i in range(1, self.connect_n):
+                after.append(after[-1] & (bitboard >> (shift * i)))
+                before.append(before[-1] & (bitboard << (shift * i)))
+            for i in range(self.connect_n):
+                cells |= after[i] & before[self.connect_n - 1 - i]
+        return cells & self.board_mask
+
+    def threats(self) -> Threats:
+        """
+        Finds what each player threatens, using a few bitboard operations
+        rather than trying every column.
+
+        :return: The threats of the position.
+        """
+        mask = self.bitboards[0] | self.bitboards[1]
+        empty = self.board_mask & ~mask
+        playable = (mask + self.bottom_mask) & self.board_mask
+        threat_cells = (self.winning_cells(self.bitboards[0]) & empty,
+                        self.winning_cells(self.bitboards[1]) & empty)
+        winning_columns = (self.cell_columns(threat_cells[0] & playable),
+                           self.cell_columns(threat_cells[1] & playable))
+        opponent = not self.turn.value
+        # Placing under an opponent's threat lets them place on it,
+        # unless placing there wins first.
+        losing = playable & (threat_cells[opponent] >> 1) & ~threat_cells[self.turn.value]
+        return Threats(
+            winning_columns,
+            winning_columns[opponent],
+            self.cell_columns(losing),
+            threat_cells,
+            (threat_cells[0] & self.odd_rows_mask, threat_cells[1] & self.odd_rows_mask),
+            (threat_cells[0] & ~self.odd_rows_mask, threat_cells[1] & ~self.odd_rows_mask),
+        )
+
+    def cell_columns(self, cells: int) -> List[int]:
+        """
+        Finds the columns of the cells in a bitboard.
+
+        :param cells: The bitboard of the cells.
+        :return: The columns that have at least one of the cells, in order.
+        """
+        columns = []
+        while cells:
+            column = ((cells & -cells).bit_length() - 1) // self.column_bits
+            columns.append(column)
+            # Skip the rest of the column.
+            cells &= ~((1 << ((column + 1) * self.column_bits)) - 1)
+        return columns
 
     def winning_connections(self) -> List[Connection]:
         """
@@ -105,41 +489,25 @@ class ConnectFour:
 
         :return: Returns the winning connection(s).
         """
-        def tile(connect_four: ConnectFour, cell: Tuple[int, int]) -> Tile:
-            return connect_four.grid[cell[0]][cell[1]]
-
-        connections = []
-        for row in range(self.rows):
-            for column in range(self.columns):
-                player = self.grid[row][column]
-                # Skip the cell if it is empty
-                if player is None:
-                    continue
-                can_check_row = (column <= self.columns - self.connect_n)
-                can_check_column = (row <= self.rows - self.connect_n)
-                can_check_reverse_row = (column >= self.connect_n - 1)
-                # Check row
-                if can_check_row:
-                    cells = tuple((row, column + i) for i in range(self.connect_n))
-                    if all([tile(self, cell) == player for cell in cells]):
-                        connections.append(cells)
-                # Check column
-                if can_check_column:
-                    cells = tuple((row + i, column) for i in range(self.connect_n))
-                    if all([tile(self, cell) == player for cell in cells]):
-                        connections.append(cells)
-                # Check up-right diagonal
-                if can_check_row and can_check_column:
-                    cells = tuple((row + i, column + i) for i in range(self.connect_n))
-                    if all([tile(self, cell) == player for cell in cells]):
-                        connections.append(cells)
-                # Check up-left diagonal
-                if can_check_reverse_row and can_check_column:
-                    cells = tuple((row + i, column - i) for i in range(self.connect_n))
-                    if all([tile(self, cell) == player for cell in cells]):
-                        connections.append(cells)
-        # No winner (either the game is not over, or it ended in a draw)
-        return connections
+        found = []
+        for bitboard in self.bitboards:
+            for order, (shift, (row_step, column_step)) in enumerate(self.directions):
+                starts = self.connection_starts(bitboard, shift)
+                while starts:
+                    lowest = starts & -starts
+                    starts ^= lowest
+                    column, row = divmod(lowest.bit_length() - 1, self.column_bits)
+                    # Connections going up-left are found from their
+                    # top-left cell, but are reported from their bottom cell.
+                    if column_step < 0:
+                        row -= row_step * (self.connect_n - 1)
+                        column -= column_step * (self.connect_n - 1)
+                    cells = tuple((row + i * row_step, column + i * column_step)
+                                  for i in range(self.connect_n))
+                    found.append((row, column, order, cells))
+        # Report the connections in the order they appear on the grid.
+        found.sort()
+        return [cells for _, _, _, cells in found]
 
     def __str__(self) -> str:
         def player_to_str(player: Player):
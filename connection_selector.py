@@ -0,0 +1,139 @@
+import selectors
+import time
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+from game_connection import GameConnection
+from game_protocol import ProtocolError
+
+
+class ConnectionEvent(Enum):
+    """Something that happened on a connection serviced by a ConnectionSelector."""
+
+    # The opponent said hello, so the game can start.
+    READY = 'ready'
+    MOVE = 'move'
+    RESIGNED = 'resigned'
+    # The opponent disconnected, or broke the protocol.
+    CLOSED = 'closed'
+    # The opponent ran out of time to make their move.
+    TIMED_OUT = 'timed out'
+
+
+# A connection, what happened on it, and the column for moves.
+ConnectionUpdate = Tuple[GameConnection, ConnectionEvent, Optional[int]]
+
+
+class ConnectionSelector:
+    """
+    Services many non-blocking GameConnections from one thread,
+    sleeping until one of them has something to receive or send,
+    or an opponent runs out of time.
+    """
+
+    def __init__(self) -> None:
+        """Creates a selector with no connections."""
+        self.selector = selectors.DefaultSelector()
+        # The events each connection is registered for.
+        self.connections: Dict[GameConnection, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    def register(self, connection: GameConnection) -> None:
+        """
+        Starts servicing a connection.
+        :param connection: The connection, which must be non-blocking.
+        """
+        if connection.blocking:
+            raise ValueError('only non-blocking connections can be selected')
+        events = self.events(connection)
+        self.selector.register(connection, events, connection)
+        self.connections[connection] = events
+
+    def unregister(self, connection: GameConnection) -> None:
+        """
+        Stops servicing a connection. It is not disconnected.
+        :param connection: The connection.
+        """
+        if self.connections.pop(connection, None) is not None:
+            self.selector.unregister(connection)
+
+    @staticmethod
+    def events(connection: GameConnection) -> int:
+        """
+        Gets the events to wait for on a connection.
+        :param connection: The connection.
+        :return: The events.
+        """
+        if connection.wants_write():
+            return selectors.EVENT_READ | selectors.EVENT_WRITE
+        return selectors.EVENT_READ
+
+    def poll(self, timeout: Optional[float] = None) -> List[ConnectionUpdate]:
+        """
+        Waits for something to happen on the connections, then handles it.
+
+        Connections that close are unregistered. Connections that time out
+        are not, and are reported again once their opponent next runs out of time.
+
+        :param timeout: The most seconds to wait, or None to wait
+                        until something happens.
+        :return: What happened, which may be nothing if the timeout passed.
+        """
+        # Frames may have been queued since the last poll.
+        for connection, events in self.connections.items():
+            if self.events(connection) != events:
+                self.modify(connection)
+        deadlines = [connection.move_deadline for connection in self.connections
+                     if connection.move_deadline is not None]
+        if deadlines:
+            until_deadline = max(0.0, min(deadlines) - time.monotonic())
+            timeout = until_deadline if timeout is None else min(timeout, until_deadline)
+        updates: List[ConnectionUpdate] = []
+        for key, mask in self.selector.select(timeout):
+            connection: GameConnection = key.data
+            said_hello = connection.said_hello()
+            try:
+                if mask & selectors.EVENT_WRITE:
+                    connection.flush()
+                is_open = True
+                if mask & selectors.EVENT_READ:
+                    is_open = connection.receive_available()
+            except (OSError, ProtocolError):
+                # OSError includes the peer resetting the connection,
+                # and keepalive finding that the peer is gone (ETIMEDOUT).
+                is_open = False
+            if not said_hello and connection.said_hello():
+                updates.append((connection, ConnectionEvent.READY, None))
+            while connection.received_moves:
+                column = connection.received_moves.popleft()
+                if column is None:
+                    updates.append((connection, ConnectionEvent.RESIGNED, None))
+                else:
+                    updates.append((connection, ConnectionEvent.MOVE, column))
+            if not is_open:
+                self.unregister(connection)
+                updates.append((connection, ConnectionEvent.CLOSED, None))
+            elif self.events(connection) != self.connections[connection]:
+                self.modify(connection)
+        now = time.monotonic()
+        for connection in self.connections:
+            if connection.timed_out(now):
+                connection.move_deadline = None
+                updates.append((connection, ConnectionEvent.TIMED_OUT, None))
+        return updates
+
+    def modify(self, connection: GameConnection) -> None:
+        """
+        Updates the events a connection is registered for.
+        :param connection: The connection.
+        """
+        events = self.events(connection)
+        self.selector.modify(connection, events, connection)
+        self.connections[connection] = events
+
+    def close(self) -> None:
+        """Stops servicing every connection, without disconnecting them."""
+        self.selector.close()
+        self.connections.clear()
@@ -1,77 +1,546 @@
+import secrets
 import socket
-from struct import Struct, pack, unpack
-from typing import Optional
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
 
-from connect_four import Player
-from network_settings import (GAME_STRUCT, USERNAME_BYTES,
-                              NAME_ENCODING, NAME_ERRORS)
+from connect_four import ConnectFour, Player
+from game_protocol import (FrameReader, MessageType, ProtocolError,
+                           decode_hello, decode_payload, decode_state,
+                           enable_keepalive, encode_frame, encode_hello,
+                           encode_state, negotiate_version)
+from metrics import MetricsSink, RttEstimator
+from network_settings import (ACK_STRUCT, CHAT_ENCODING, HANDSHAKE_TIMEOUT,
+                              MOVE_STRUCT, MOVE_TIMEOUT, PING_STRUCT,
+                              SESSION_PROTOCOL_VERSION, SESSION_TOKEN_BYTES)
 
 
-class GameConnection:
-    """Simplifies the process of playing Connect 4 across a network."""
+class BaseGameConnection:
+    """
+    The state of a connection to your opponent, and how the frames they send
+    change it, without any sending or receiving, which subclasses do.
+    """
+
+    def __init__(self,
+                 player: Player,
+                 username: str,
+                 opponent_username: str = '',
+                 metrics: Optional[MetricsSink] = None,
+                 move_timeout: Optional[float] = MOVE_TIMEOUT) -> None:
+        """
+        Creates the state of a connection that hasn't said hello yet.
+
+        :param player: The player you are.
+        :param username: Your username.
+        :param opponent_username: Your opponent's username, if known.
+                                  It is replaced by the one they say hello with.
+        :param metrics: Where to record measurements of the connection,
+                        or None to not measure it. When measured, every move
+                        is sent with a ping, to track the round trip time.
+        :param move_timeout: How many seconds your opponent has to make each move,
+                             or None to wait forever.
+        """
+        self.player: Player = player
+        self.username: str = username
+        self.opponent_username: str = opponent_username
+        # The version of the protocol to speak, or None until hello is said.
+        self.version: Optional[int] = None
+        self.reader = FrameReader()
+        # Frames that have been queued, but not yet sent by flush(), and whether
+        # any of them should be sent right away rather than with your next move.
+        self.outgoing = bytearray()
+        self.urgent: bool = False
+        # How many moves have been sent and received, which numbers each move,
+        # and how many of the moves sent the opponent has acknowledged.
+        self.moves_sent: int = 0
+        self.moves_received: int = 0
+        self.moves_acknowledged: int = 0
+        # Moves that have been received but not yet taken, with None for a resignation.
+        self.received_moves: Deque[Optional[int]] = deque()
+        # When your opponent has to have moved by (by time.monotonic()),
+        # or None if it isn't their turn.
+        self.move_timeout: Optional[float] = move_timeout
+        self.move_deadline: Optional[float] = None
+        # What the opponent has sent besides moves.
+        self.chat_messages: List[str] = []
+        self.opponent_resigned: bool = False
+        self.rematch_requested: bool = False
+        self.state: Optional[Tuple[int, int, int, List[int]]] = None
+        # The token of the session the game is part of, if any,
+        # and the token your opponent asked to resume a session with.
+        self.session_token: Optional[bytes] = None
+        self.resume_token: Optional[bytes] = None
+        # Whether your opponent is actually a spectator.
+        self.spectating: bool = False
+        # Measurements of the connection. Bytes received are counted by the reader.
+        self.metrics: Optional[MetricsSink] = metrics
+        self.rtt = RttEstimator()
+        self.bytes_sent: int = 0
+        self.messages_sent: int = 0
+        self.messages_received: int = 0
+        # How many seconds have been spent waiting for the opponent's moves.
+        self.wait_seconds: float = 0
+        self.name: str = opponent_username
+
+    def peer_address(self) -> Optional[Tuple[str, int]]:
+        """
+        Gets the address of your opponent.
+        :return: The address, or None if it isn't known.
+        """
+        return None
+
+    def connection_name(self) -> str:
+        """
+        Names the connection in measurements.
+        :return: The opponent's username and address.
+        """
+        address = self.peer_address()
+        if isinstance(address, tuple):
+            return f'{self.opponent_username}@[{address[0]}]:{address[1]}'
+        return self.opponent_username
+
+    def said_hello(self) -> bool:
+        """
+        Checks if your opponent has said hello, so the game can start.
+        :return: True if they have, False otherwise.
+        """
+        return self.version is not None
+
+    def queue_frame(self, message_type: int, payload: bytes = b'') -> None:
+        """
+        Queues a frame to be sent by the next flush(),
+        so that several frames can be sent at once.
+        :param message_type: The type of the frame.
+        :param payload: The payload of the frame.
+        """
+        self.outgoing += encode_frame(message_type, payload)
+        self.messages_sent += 1
+
+    def queue_hello(self) -> None:
+        """Queues the hello, which must be the first frame sent."""
+        self.queue_frame(MessageType.HELLO, encode_hello(self.username))
+
+    def queue_ping(self) -> None:
+        """
+        Queues a ping, which your opponent answers with a pong once they
+        receive it. The round trip time is measured when the pong arrives.
+        """
+        self.queue_frame(MessageType.PING, PING_STRUCT.pack(time.perf_counter()))
+
+    def queue_move(self, column: int) -> None:
+        """
+        Queues a move, after which it is your opponent's turn.
+        :param column: The column where your tile was placed.
+        """
+        if self.metrics is not None:
+            # The ping is sent first, so your opponent answers it
+            # as soon as they receive it, rather than after their move.
+            self.queue_ping()
+        self.queue_frame(MessageType.MOVE,
+                         MOVE_STRUCT.pack(self.moves_sent & 0xFFFF, column))
+        self.moves_sent += 1
+        self.expect_move()
+
+    def queue_state(self, game: ConnectFour) -> None:
+        """
+        Queues the whole game so far.
+        :param game: The game.
+        """
+        self.queue_frame(MessageType.STATE_SYNC, encode_state(
+            game.rows, game.columns, game.connect_n, game.moves))
+
+    def queue_session(self) -> bool:
+        """
+        Starts a session as the host, queuing its token for your opponent,
+        so that they can reconnect if the connection drops.
+        :return: True if a session was started, or False if your opponent
+                 speaks a version of the protocol without sessions.
+        """
+        if self.version is None or self.version < SESSION_PROTOCOL_VERSION:
+            return False
+        self.session_token = secrets.token_bytes(SESSION_TOKEN_BYTES)
+        self.queue_frame(MessageType.SESSION, self.session_token)
+        return True
+
+    def expect_move(self) -> None:
+        """Starts the time your opponent has to make their move."""
+        if self.move_timeout is not None:
+            self.move_deadline = time.monotonic() + self.move_timeout
+
+    def process_frames(self) -> None:
+        """Handles every whole frame that has been received."""
+        frame = self.reader.next_frame()
+        while frame is not None:
+            self.handle_frame(*frame)
+            frame = self.reader.next_frame()
+
+    def handle_frame(self, message_type: int, payload: bytes) -> None:
+        """
+        Handles a frame from your opponent.
+        Frames of unknown types are ignored.
+        :param message_type: The type of the frame.
+        :param payload: The payload of the frame.
+        """
+        self.messages_received += 1
+        if self.version is None:
+            if message_type != MessageType.HELLO:
+                raise ProtocolError('The other player did not say hello.')
+            min_version, max_version, self.opponent_username = decode_hello(payload)
+            self.version = negotiate_version(min_version, max_version)
+            self.name = self.connection_name()
+            # The host moves first.
+            if self.player == Player.TWO and not self.moves_received:
+                self.expect_move()
+        elif message_type == MessageType.MOVE:
+            number, column = decode_payload(MOVE_STRUCT, payload)
+            self.moves_received += 1
+            self.move_deadline = None
+            # The acknowledgement is sent along with your next move.
+            self.queue_frame(MessageType.MOVE_ACK, ACK_STRUCT.pack(number))
+            self.received_moves.append(column)
+        elif message_type == MessageType.RESIGN:
+            self.opponent_resigned = True
+            self.move_deadline = None
+            self.received_moves.append(None)
+        elif message_type == MessageType.MOVE_ACK:
+            number = decode_payload(ACK_STRUCT, payload)[0]
+            # Moves are numbered modulo 2 ** 16.
+            self.moves_acknowledged += (number + 1 - self.moves_acknowledged) & 0xFFFF
+        elif message_type == MessageType.PING:
+            self.queue_frame(MessageType.PONG, payload)
+            self.urgent = True
+        elif message_type == MessageType.PONG and len(payload) == PING_STRUCT.size:
+            sample = time.perf_counter() - PING_STRUCT.unpack(payload)[0]
+            self.rtt.update(sample)
+            self.record('rtt', sample)
+        elif message_type == MessageType.CHAT:
+            self.chat_messages.append(payload.decode(CHAT_ENCODING, 'replace'))
+        elif message_type == MessageType.REMATCH:
+            self.rematch_requested = True
+        elif message_type == MessageType.STATE_SYNC:
+            self.state = decode_state(payload)
+        elif message_type == MessageType.SESSION:
+            self.session_token = payload
+        elif message_type == MessageType.RESUME:
+            self.resume_token = payload
+        elif message_type == MessageType.SPECTATE:
+            self.spectating = True
+        elif message_type == MessageType.FULL:
+            raise ProtocolError('The game in the lobby has already started.')
+
+    def timed_out(self, now: Optional[float] = None) -> bool:
+        """
+        Checks if your opponent has run out of time to make their move.
+        :param now: The current time.monotonic(), if already known.
+        :return: True if they have, False otherwise.
+        """
+        if self.move_deadline is None:
+            return False
+        if now is None:
+            now = time.monotonic()
+        return now >= self.move_deadline
+
+    def record(self, name: str, value: float) -> None:
+        """
+        Records a measurement of the connection, if it is being measured.
+        :param name: What was measured.
+        :param value: The measurement.
+        """
+        if self.metrics is not None:
+            self.metrics.record(self.name, name, value)
+
+    def record_wait(self, start: float) -> None:
+        """
+        Records time spent waiting for your opponent's move.
+        :param start: When the wait started, by time.perf_counter().
+        """
+        wait = time.perf_counter() - start
+        self.wait_seconds += wait
+        self.record('wait', wait)
+
+    def record_counters(self) -> None:
+        """Records the totals of the connection, if it is being measured."""
+        if self.metrics is not None:
+            for name, value in self.counters().items():
+                self.record(name, value)
+
+    def counters(self) -> Dict[str, float]:
+        """
+        Gets the totals measured over the connection so far.
+        :return: The totals, by name.
+        """
+        return {
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.reader.bytes_received,
+            'messages_sent': self.messages_sent,
+            'messages_received': self.messages_received,
+            'wait_seconds': self.wait_seconds,
+            'smoothed_rtt': self.rtt.rtt,
+            'rtt_jitter': self.rtt.jitter,
+        }
+
+
+class GameConnection(BaseGameConnection):
+    """
+    Simplifies the process of playing Connect 4 across a network.
+
+    By default every method blocks until it is done. In non-blocking mode
+    nothing blocks: what is received is handled by receive_available(),
+    which a ConnectionSelector calls for many connections from one thread.
+    """
 
     def __init__(self,
                  game_socket: socket.socket,
                  player: Player,
                  username: str,
-                 opponent_username: str = '') -> None:
+                 opponent_username: str = '',
+                 metrics: Optional[MetricsSink] = None,
+                 move_timeout: Optional[float] = MOVE_TIMEOUT,
+                 handshake_timeout: Optional[float] = HANDSHAKE_TIMEOUT,
+                 blocking: bool = True) -> None:
         """
         Wraps an existing socket to simplify the process of
         sending and receiving information to play a game of Connect 4.
+
+        Both players start by saying hello, which exchanges their usernames
+        and agrees on the version of the protocol to speak. When blocking,
+        this waits for your opponent to say hello back.
+
         :param game_socket: The TCP socket already connected to your opponent.
+        :param player: The player you are.
+        :param username: Your username.
+        :param opponent_username: Your opponent's username, if known.
+                                  It is replaced by the one they say hello with.
+        :param metrics: Where to record measurements of the connection,
+                        or None to not measure it.
+        :param move_timeout: How many seconds your opponent has to make each move,
+                             or None to wait forever.
+        :param handshake_timeout: How many seconds your opponent has to say hello,
+                                  or None to wait forever.
+        :param blocking: Whether to block until each method is done.
         """
-        game_socket.settimeout(None)
+        super().__init__(player, username, opponent_username, metrics, move_timeout)
+        enable_keepalive(game_socket)
+        game_socket.setblocking(blocking)
         self.game_socket: socket.socket = game_socket
-        self.player: Player = player
-        self.username: str = username
-        self.opponent_username: str = opponent_username
-        # Joining player, send username to the host.
-        if self.opponent_username:
-            self.send_username()
-        # Hosting player, receive username from the joining player.
+        self.blocking: bool = blocking
+        self.queue_hello()
+        if blocking:
+            self.handshake(handshake_timeout)
         else:
-            self.opponent_username = self.receive_username()
+            self.flush()
+
+    def handshake(self, timeout: Optional[float] = HANDSHAKE_TIMEOUT) -> None:
+        """
+        Says hello to your opponent, and waits for them to say hello back.
+        :param timeout: How many seconds to wait, or None to wait forever.
+        """
+        self.receive_until(self.said_hello, timeout)
+
+    def receive_after_hello(self, timeout: Optional[float] = HANDSHAKE_TIMEOUT) -> None:
+        """
+        Receives the frame your opponent sends straight after hello
+        (since protocol version 3), which tells the host whether they
+        want to play, to watch, or to resume a session.
+        :param timeout: How many seconds to wait, or None to wait forever.
+        """
+        # The hello is the first message received.
+        self.receive_until(lambda: self.messages_received > 1, timeout)
+
+    def receive_until(self,
+                      condition: Callable[[], bool],
+                      timeout: Optional[float] = None) -> None:
+        """
+        Receives from your opponent until a condition is met,
+        raising TimeoutError if it isn't met in time.
+        :param condition: The condition.
+        :param timeout: How many seconds to wait, or None to wait forever.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not condition():
+            self.receive(deadline)
+
+    def peer_address(self) -> Optional[Tuple[str, int]]:
+        try:
+            address = self.game_socket.getpeername()
+        except OSError:
+            return None
+        return address if isinstance(address, tuple) else None
+
+    def fileno(self) -> int:
+        return self.game_socket.fileno()
 
-    def send_column(self,
-                    column: int,
-                    packing_struct: Struct = GAME_STRUCT) -> None:
+    def wants_write(self) -> bool:
+        """
+        Checks if there are frames that couldn't be sent yet in non-blocking mode.
+        :return: True if there are, False otherwise.
+        """
+        return bool(self.outgoing)
+
+    def flush(self) -> None:
+        """
+        Sends every queued frame.
+        In non-blocking mode, as much is sent as can be without blocking.
+        """
+        if not self.outgoing:
+            return
+        if self.blocking:
+            self.game_socket.sendall(self.outgoing)
+            sent = len(self.outgoing)
+        else:
+            try:
+                sent = self.game_socket.send(self.outgoing)
+            except BlockingIOError:
+                sent = 0
+        self.bytes_sent += sent
+        del self.outgoing[:sent]
+        self.urgent = self.urgent and bool(self.outgoing)
+
+    def send_frame(self, message_type: int, payload: bytes = b'') -> None:
+        """
+        Sends a frame, along with any queued frames.
+        :param message_type: The type of the frame.
+        :param payload: The payload of the frame.
+        """
+        self.queue_frame(message_type, payload)
+        self.flush()
+
+    def receive(self, deadline: Optional[float] = None) -> None:
+        """
+        Sends any queued frames, then blocks until more is received from your
+        opponent, handling any frames it completes.
+        :param deadline: When to give up waiting (by time.monotonic()),
+                         or None to wait forever.
+        """
+        self.flush()
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError('Your opponent stopped responding.')
+            self.game_socket.settimeout(remaining)
+        try:
+            data = self.game_socket.recv(4096)
+        except socket.timeout:
+            raise TimeoutError('Your opponent stopped responding.')
+        finally:
+            if deadline is not None:
+                self.game_socket.settimeout(None)
+        if not data:
+            raise ConnectionError('Your opponent disconnected.')
+        self.reader.feed(data)
+        self.process_frames()
+        if self.urgent:
+            self.flush()
+
+    def receive_available(self) -> bool:
+        """
+        Handles everything received from your opponent without blocking,
+        in non-blocking mode, then sends as many queued frames as possible.
+        Received moves are added to received_moves.
+        :return: False if your opponent has disconnected, True otherwise.
+        """
+        while True:
+            try:
+                data = self.game_socket.recv(4096)
+            except BlockingIOError:
+                break
+            if not data:
+                self.process_frames()
+                return False
+            self.reader.feed(data)
+        self.process_frames()
+        self.flush()
+        return True
+
+    def send_column(self, column: int) -> None:
         """
         Sends the column you placed your tile in to your opponent.
         :param column: The column where your tile was placed.
-        :param packing_struct: The Struct to pack the column with.
-        """
-        data = packing_struct.pack(column)
-        self.game_socket.send(data)
-
-    def receive_column(self, packing_struct: Struct = GAME_STRUCT) -> int:
-        """
-        Receives the column that your opponent placed their tile in.
-        :param packing_struct: The Struct to unpack the received message with.
-        :return: The column that your opponent placed their tile in.
-        """
-        data = self.game_socket.recv(packing_struct.size)
-        return packing_struct.unpack(data)[0]
-
-    def send_username(self,
-                      username: Optional[str] = None,
-                      bytes_length: int = USERNAME_BYTES,
-                      encoding: str = NAME_ENCODING,
-                      errors: str = NAME_ERRORS) -> None:
-        if username is None:
-            username = self.username
-        username_bytes = username.encode(encoding, errors)
-        data = pack(f'!{bytes_length}s', username_bytes)
-        self.game_socket.send(data)
-
-    def receive_username(self,
-                         bytes_length: int = USERNAME_BYTES,
-                         encoding: str = NAME_ENCODING,
-                         errors: str = NAME_ERRORS) -> str:
-        data = self.game_socket.recv(bytes_length)
-        username_bytes = unpack(f'!{bytes_length}s', data)[0]
-        username = username_bytes.decode(encoding, errors).rstrip('\x00')
-        return username
+        """
+        self.queue_move(column)
+        self.flush()
+
+    def receive_column(self) -> Optional[int]:
+        """
+        Receives the column that your opponent placed their tile in,
+        blocking until it arrives or they run out of time (TimeoutError).
+
+        Anything else your opponent sends in the meantime is handled,
+        such as chat messages.
+
+        :return: The column that your opponent placed their tile in,
+                 or None if they resigned.
+        """
+        start = time.perf_counter()
+        try:
+            while not self.received_moves:
+                self.receive(self.move_deadline)
+            return self.received_moves.popleft()
+        finally:
+            self.record_wait(start)
+
+    def send_chat(self, message: str) -> None:
+        """
+        Sends a chat message to your opponent.
+        :param message: The message.
+        """
+        self.send_frame(MessageType.CHAT, message.encode(CHAT_ENCODING))
+
+    def resign(self) -> None:
+        """Gives up the game."""
+        self.send_frame(MessageType.RESIGN)
+
+    def request_rematch(self) -> None:
+        """Asks your opponent to play again."""
+        self.send_frame(MessageType.REMATCH)
+
+    def ping(self) -> None:
+        """Sends a ping, along with any queued frames."""
+        self.queue_ping()
+        self.flush()
+
+    def send_state(self, game: ConnectFour) -> None:
+        """
+        Sends the whole game so far to your opponent.
+        :param game: The game.
+        """
+        self.queue_state(game)
+        self.flush()
+
+    def start_session(self) -> bool:
+        """
+        Starts a session as the host, so that your opponent can reconnect
+        if the connection drops.
+        :return: True if a session was started, or False if your opponent
+                 speaks a version of the protocol without sessions.
+        """
+        started = self.queue_session()
+        self.flush()
+        return started
+
+    def refuse(self) -> None:
+        """
+        Tells a player who joined after the game started
+        that they can't play, then disconnects them.
+        """
+        self.queue_frame(MessageType.FULL)
+        self.disconnect()
+
+    def resume(self, token: bytes) -> None:
+        """
+        Asks the host to resume a session after reconnecting.
+        :param token: The token of the session.
+        """
+        self.send_frame(MessageType.RESUME, token)
 
     def disconnect(self) -> None:
-        """Disconnects from the game."""
+        """
+        Disconnects from the game, sending any queued frames first.
+        If the connection is being measured, its totals are recorded.
+        """
+        try:
+            self.flush()
+        except OSError:
+            pass
         self.game_socket.close()
+        self.record_counters()
@@ -0,0 +1,240 @@
+import socket
+from enum import IntEnum
+from struct import Struct, pack, unpack_from
+from typing import Any, List, Optional, Sequence, Tuple
+
+from network_settings import (FRAME_STRUCT, HELLO_STRUCT, KEEPALIVE_COUNT,
+                              KEEPALIVE_IDLE, KEEPALIVE_INTERVAL,
+                              MAX_PAYLOAD_BYTES, MIN_PROTOCOL_VERSION,
+                              NAME_ENCODING, NAME_ERRORS, PROTOCOL_VERSION,
+                              STATE_STRUCT)
+
+
+class MessageType(IntEnum):
+    """The type of a frame, which says what its payload holds."""
+
+    # Each player's username and supported protocol versions.
+    HELLO = 1
+    # A move (MOVE_STRUCT), which is answered with a MOVE_ACK (ACK_STRUCT).
+    MOVE = 2
+    MOVE_ACK = 3
+    # A message to the other player (CHAT_ENCODING text).
+    CHAT = 4
+    # Giving up the game, or asking to play again (no payload).
+    RESIGN = 5
+    REMATCH = 6
+    # A PING (PING_STRUCT) is answered with a PONG holding the same payload.
+    PING = 7
+    PONG = 8
+    # The whole game so far (STATE_STRUCT followed by the moves).
+    STATE_SYNC = 9
+    # The host's session token, which the joining player sends back
+    # with a RESUME after reconnecting (since protocol version 2).
+    SESSION = 10
+    RESUME = 11
+    # Asking to watch the game rather than play it (since protocol version 3).
+    SPECTATE = 12
+    # Telling a player who joined a lobby after its game started
+    # that they can't play, before disconnecting them (no payload,
+    # since protocol version 3).
+    FULL = 13
+
+
+# A frame's type and payload. The type is left as an int,
+# as frames of types this version doesn't know about are ignored.
+Frame = Tuple[int, bytes]
+
+
+class ProtocolError(Exception):
+    """The other player broke the protocol, or can't speak a version of it we can."""
+
+
+def encode_frame(message_type: int, payload: bytes = b'') -> bytes:
+    """
+    Frames a payload so that it can be sent.
+    :param message_type: The type of the payload.
+    :param payload: The payload.
+    :return: The frame.
+    """
+    if len(payload) > MAX_PAYLOAD_BYTES:
+        raise ValueError(f'payloads can be at most {MAX_PAYLOAD_BYTES} bytes')
+    return FRAME_STRUCT.pack(len(payload), message_type) + payload
+
+
+class FrameReader:
+    """
+    Splits received bytes back into frames.
+
+    Bytes can be fed in however they arrive, so a frame split across
+    several reads, or several frames arriving in one read, are both handled.
+    """
+
+    def __init__(self) -> None:
+        """Creates a reader with nothing buffered."""
+        self.buffer = bytearray()
+        # Where the next frame starts in the buffer. The bytes before it
+        # have already been read, and are removed once there are enough
+        # of them, rather than after every frame.
+        self.start: int = 0
+        self.bytes_received: int = 0
+
+    def feed(self, data: bytes) -> None:
+        """
+        Adds received bytes to the buffer.
+        :param data: The bytes.
+        """
+        self.buffer += data
+        self.bytes_received += len(data)
+
+    def next_frame(self) -> Optional[Frame]:
+        """
+        Takes the next frame from the buffer.
+        :return: The frame, or None if a whole frame hasn't been received yet.
+        """
+        buffer = self.buffer
+        payload_start = self.start + FRAME_STRUCT.size
+        if len(buffer) < payload_start:
+            return None
+        length, message_type = FRAME_STRUCT.unpack_from(buffer, self.start)
+        end = payload_start + length
+        if len(buffer) < end:
+            return None
+        payload = bytes(buffer[payload_start:end])
+        if end == len(buffer):
+            buffer.clear()
+            self.start = 0
+        elif end > 4096:
+            del buffer[:end]
+            self.start = 0
+        else:
+            self.start = end
+        return message_type, payload
+
+    def receive(self, connected_socket: socket.socket, bytes_length: int = 4096) -> Frame:
+        """
+        Receives the next frame from a socket, blocking until it arrives.
+        :param connected_socket: The socket.
+        :param bytes_length: The most bytes to receive at once.
+        :return: The frame.
+        """
+        frame = self.next_frame()
+        while frame is None:
+            data = connected_socket.recv(bytes_length)
+            if not data:
+                raise ConnectionError('The other player disconnected.')
+            self.feed(data)
+            frame = self.next_frame()
+        return frame
+
+
+def enable_keepalive(connected_socket: socket.socket,
+                     idle: int = KEEPALIVE_IDLE,
+                     interval: int = KEEPALIVE_INTERVAL,
+                     count: int = KEEPALIVE_COUNT) -> None:
+    """
+    Has the operating system probe an idle connection,
+    dropping it if the other end stops answering.
+
+    The timing options aren't available on every platform,
+    in which case the platform's defaults are used.
+
+    :param connected_socket: The TCP socket.
+    :param idle: How many seconds the connection is idle before it is probed.
+    :param interval: How many seconds between probes.
+    :param count: How many unanswered probes before the connection is dropped.
+    """
+    if connected_socket.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+    connected_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # macOS calls TCP_KEEPIDLE TCP_KEEPALIVE.
+    idle_option = getattr(socket, 'TCP_KEEPIDLE', getattr(socket, 'TCP_KEEPALIVE', None))
+    for option, value in ((idle_option, idle),
+                          (getattr(socket, 'TCP_KEEPINTVL', None), interval),
+                          (getattr(socket, 'TCP_KEEPCNT', None), count)):
+        if option is not None:
+            connected_socket.setsockopt(socket.IPPROTO_TCP, option, value)
+
+
+def decode_payload(packing_struct: Struct, payload: bytes) -> Tuple[Any, ...]:
+    """
+    Unpacks a fixed size payload, such as a move.
+    :param packing_struct: The Struct to unpack the payload with.
+    :param payload: The payload.
+    :return: The unpacked values.
+    """
+    if len(payload) != packing_struct.size:
+        raise ProtocolError(f'Expected a {packing_struct.size} byte payload, '
+                            f'but received {len(payload)} bytes.')
+    return packing_struct.unpack(payload)
+
+
+def encode_hello(username: str,
+                 min_version: int = MIN_PROTOCOL_VERSION,
+                 max_version: int = PROTOCOL_VERSION) -> bytes:
+    """
+    Creates the payload of a HELLO frame.
+    :param username: The username of the player sending it.
+    :param min_version: The lowest protocol version the player can speak.
+    :param max_version: The highest protocol version the player can speak.
+    :return: The payload.
+    """
+    return HELLO_STRUCT.pack(min_version, max_version,
+                             username.encode(NAME_ENCODING, NAME_ERRORS))
+
+
+def decode_hello(payload: bytes) -> Tuple[int, int, str]:
+    """
+    Reads the payload of a HELLO frame.
+    :param payload: The payload.
+    :return: The lowest and highest protocol versions
+             the other player can speak, and their username.
+    """
+    if len(payload) < HELLO_STRUCT.size:
+        raise ProtocolError('The hello was too short.')
+    min_version, max_version, username_bytes = HELLO_STRUCT.unpack_from(payload)
+    username = username_bytes.decode(NAME_ENCODING, NAME_ERRORS).rstrip('\x00')
+    return min_version, max_version, username
+
+
+def negotiate_version(min_version: int, max_version: int) -> int:
+    """
+    Picks the highest protocol version both players can speak.
+    :param min_version: The lowest version the other player can speak.
+    :param max_version: The highest version the other player can speak.
+    :return: The version.
+    """
+    version = min(max_version, PROTOCOL_VERSION)
+    if version < max(min_version, MIN_PROTOCOL_VERSION):
+        raise ProtocolError(
+            f'The other player speaks protocol versions {min_version}-{max_version}, '
+            f'but only versions {MIN_PROTOCOL_VERSION}-{PROTOCOL_VERSION} are supported.'
+        )
+    return version
+
+
+def encode_state(rows: int, columns: int, connect_n: int,
+                 moves: Sequence[int]) -> bytes:
+    """
+    Creates the payload of a STATE_SYNC frame.
+    :param rows: The number of rows.
+    :param columns: The number of columns.
+    :param connect_n: How many tiles in a row to win.
+    :param moves: The column of every move so far.
+    :return: The payload.
+    """
+    return STATE_STRUCT.pack(rows, columns, connect_n) + pack(f'!{len(moves)}H', *moves)
+
+
+def decode_state(payload: bytes) -> Tuple[int, int, int, List[int]]:
+    """
+    Reads the payload of a STATE_SYNC frame.
+    :param payload: The payload.
+    :return: The number of rows, the number of columns,
+             how many tiles in a row to win, and the column of every move.
+    """
+    if len(payload) < STATE_STRUCT.size or (len(payload) - STATE_STRUCT.size) % 2:
+        raise ProtocolError('The state sync was the wrong length.')
+    rows, columns, connect_n = STATE_STRUCT.unpack_from(payload)
+    move_count = (len(payload) - STATE_STRUCT.size) // 2
+    moves = list(unpack_from(f'!{move_count}H', payload, STATE_STRUCT.size))
+    return rows, columns, connect_n, moves
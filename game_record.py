@@ -0,0 +1,429 @@
+import argparse
+import os
+import sys
+from array import array
+from collections import Counter
+from enum import IntEnum
+from struct import Struct
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from connect_four import ConnectFour
+from network_settings import NAME_ENCODING, NAME_ERRORS
+from player import Player
+
+# A record file is a header, then any number of game records back to back,
+# then an index footer with the offset of every record.
+# The footer is rewritten whenever records are appended, so records can be
+# read by scanning from the start, or looked up by number with the footer.
+
+# The format of the start of a record file.
+# !  = Network (big) endian
+# 4s = magic   : char[4]
+# B  = version : unsigned char
+RECORD_FILE_STRUCT: Struct = Struct('!4sB')
+RECORD_MAGIC: bytes = b'C4GR'
+RECORD_VERSION: int = 1
+
+# The format of the start of each game record. It is followed by the
+# players' names, then the moves packed into as few bits each as the
+# number of columns allows (3 bits for 7 columns), most significant first.
+# ! = Network (big) endian
+# B = rows            : unsigned char
+# B = columns         : unsigned char
+# B = connect_n       : unsigned char
+# B = outcome         : unsigned char (an Outcome)
+# B = player one name : unsigned char (length in bytes)
+# B = player two name : unsigned char (length in bytes)
+# H = move count      : unsigned short
+RECORD_HEADER_STRUCT: Struct = Struct('!BBBBBBH')
+
+# The format of the very end of a record file, after the record offsets,
+# each of which is an unsigned long long.
+# !  = Network (big) endian
+# Q  = index offset : unsigned long long (where the record offsets start)
+# Q  = count        : unsigned long long (how many records there are)
+# 4s = magic        : char[4]
+INDEX_FOOTER_STRUCT: Struct = Struct('!QQ4s')
+INDEX_MAGIC: bytes = b'C4IX'
+
+
+class Outcome(IntEnum):
+    """How a recorded game ended."""
+
+    # The game was abandoned before it ended.
+    UNFINISHED = 0
+    PLAYER_ONE = 1
+    PLAYER_TWO = 2
+    DRAW = 3
+
+    @classmethod
+    def of(cls, game: ConnectFour, resigned: Optional[Player] = None) -> 'Outcome':
+        """
+        Gets the outcome of a game.
+        :param game: The game.
+        :param resigned: The player who resigned, if either did.
+        :return: The outcome.
+        """
+        if resigned is not None:
+            return cls.PLAYER_ONE if resigned == Player.TWO else cls.PLAYER_TWO
+        if not game.is_over():
+            return cls.UNFINISHED
+        winner = game.winner()
+        if winner is None:
+            return cls.DRAW
+        return cls.PLAYER_ONE if winner == Player.ONE else cls.PLAYER_TWO
+
+
+def move_bits(columns: int) -> int:
+    """
+    Gets how many bits each move is packed into.
+    :param columns: The number of columns.
+    :return: The number of bits.
+    """
+    return max(1, (columns - 1).bit_length())
+
+
+def pack_moves(moves: array, columns: int) -> bytes:
+    """
+    Packs moves into as few bits each as the number of columns allows.
+    :param moves: The columns that were placed in, in order.
+    :param columns: The number of columns.
+    :return: The packed moves, padded with zeros to a whole byte.
+    """
+    bits = move_bits(columns)
+    packed = 0
+    for column in moves:
+        packed = packed << bits | column
+    length = (len(moves) * bits + 7) // 8
+    return (packed << (length * 8 - len(moves) * bits)).to_bytes(length, 'big')
+
+
+def unpack_moves(packed: bytes, move_count: int, columns: int) -> array:
+    """
+    Unpacks moves packed by pack_moves().
+    :param packed: The packed moves.
+    :param move_count: How many moves were packed.
+    :param columns: The number of columns.
+    :return: The columns that were placed in, in order.
+    """
+    bits = move_bits(columns)
+    mask = (1 << bits) - 1
+    value = int.from_bytes(packed, 'big') >> (len(packed) * 8 - move_count * bits)
+    moves = array('B', bytes(move_count))
+    for index in range(move_count - 1, -1, -1):
+        moves[index] = value & mask
+        value >>= bits
+    return moves
+
+
+class GameRecord:
+    """
+    A recorded game. The moves are kept packed until they are asked for,
+    so that scanning records is cheap.
+    """
+
+    __slots__ = ('rows', 'columns', 'connect_n', 'outcome',
+                 'player_one', 'player_two', 'move_count', 'packed_moves')
+
+    def __init__(self,
+                 rows: int,
+                 columns: int,
+                 connect_n: int,
+                 outcome: Outcome,
+                 player_one: str,
+                 player_two: str,
+                 move_count: int,
+                 packed_moves: bytes) -> None:
+        """
+        Creates a record.
+
+        :param rows: The number of rows.
+        :param columns: The number of columns.
+        :param connect_n: How many tiles in a row to win.
+        :param outcome: How the game ended.
+        :param player_one: The username of the player who went first.
+        :param player_two: The username of the player who went second.
+        :param move_count: How many moves were made.
+        :param packed_moves: The moves, as packed by pack_moves().
+        """
+        self.rows: int = rows
+        self.columns: int = columns
+        self.connect_n: int = connect_n
+        self.outcome: Outcome = outcome
+        self.player_one: str = player_one
+        self.player_two: str = player_two
+        self.move_count: int = move_count
+        self.packed_moves: bytes = packed_moves
+
+    @classmethod
+    def from_game(cls,
+                  game: ConnectFour,
+                  player_one: str,
+                  player_two: str,
+                  resigned: Optional[Player] = None) -> 'GameRecord':
+        """
+        Records a game.
+        :param game: The game.
+        :param player_one: The username of the player who went first.
+        :param player_two: The username of the player who went second.
+        :param resigned: The player who resigned, if either did.
+        :return: The record.
+        """
+        return cls(game.rows, game.columns, game.connect_n,
+                   Outcome.of(game, resigned), player_one, player_two,
+                   len(game.moves), pack_moves(game.moves, game.columns))
+
+    def moves(self) -> array:
+        """
+        Unpacks the moves.
+        :return: The columns that were placed in, in order.
+        """
+        return unpack_moves(self.packed_moves, self.move_count, self.columns)
+
+    def replay(self) -> ConnectFour:
+        """
+        Plays the game again.
+        :return: The game, as it was when it was recorded.
+        :raises ValueError: If one of the moves can't be placed.
+        """
+        game = ConnectFour(self.rows, self.columns, self.connect_n)
+        for column in self.moves():
+            if column >= game.columns or not game.place(column):
+                raise ValueError(f'Column {column} could not be placed.')
+        return game
+
+    def serialize(self) -> bytes:
+        """
+        Serializes the record to bytes.
+        :return: The bytes that represent the record.
+        """
+        player_one = self.player_one.encode(NAME_ENCODING, NAME_ERRORS)[:255]
+        player_two = self.player_two.encode(NAME_ENCODING, NAME_ERRORS)[:255]
+        return RECORD_HEADER_STRUCT.pack(
+            self.rows, self.columns, self.connect_n, self.outcome,
+            len(player_one), len(player_two), self.move_count
+        ) + player_one + player_two + self.packed_moves
+
+
+def read_record(file: BinaryIO) -> Optional[GameRecord]:
+    """
+    Reads the next record from a file.
+    :param file: The file, positioned at the start of a record.
+    :return: The record, or None if the file ends before a whole record,
+             or what follows isn't a record.
+    """
+    header = file.read(RECORD_HEADER_STRUCT.size)
+    if len(header) < RECORD_HEADER_STRUCT.size:
+        return None
+    rows, columns, connect_n, outcome, player_one_length, player_two_length, move_count = \
+        RECORD_HEADER_STRUCT.unpack(header)
+    # The record offsets of an interrupted footer start with zero bytes,
+    # which isn't a valid size, so they aren't mistaken for a record.
+    if not rows or not columns or outcome > Outcome.DRAW:
+        return None
+    packed_length = (move_count * move_bits(columns) + 7) // 8
+    length = player_one_length + player_two_length + packed_length
+    body = file.read(length)
+    if len(body) < length:
+        return None
+    player_two_start = player_one_length
+    moves_start = player_two_start + player_two_length
+    return GameRecord(
+        rows, columns, connect_n, Outcome(outcome),
+        body[:player_two_start].decode(NAME_ENCODING, NAME_ERRORS),
+        body[player_two_start:moves_start].decode(NAME_ENCODING, NAME_ERRORS),
+        move_count, body[moves_start:]
+    )
+
+
+def check_record_file(file: BinaryIO, path: str) -> None:
+    """
+    Makes sure a file is a record file.
+    :param file: The file, positioned at the start.
+    :param path: The path of the file, for the error message.
+    :raises ValueError: If the file is not a record file.
+    """
+    header = file.read(RECORD_FILE_STRUCT.size)
+    if len(header) < RECORD_FILE_STRUCT.size or \
+            RECORD_FILE_STRUCT.unpack(header) != (RECORD_MAGIC, RECORD_VERSION):
+        raise ValueError(f'{path} is not a version {RECORD_VERSION} game record file.')
+
+
+def read_index_footer(file: BinaryIO) -> Optional[Tuple[int, int]]:
+    """
+    Reads the index footer from the end of a record file.
+    :param file: The file.
+    :return: Where the record offsets start and how many records there are,
+             or None if the file has no footer, such as if writing it was
+             interrupted.
+    """
+    size = file.seek(0, os.SEEK_END)
+    if size < RECORD_FILE_STRUCT.size + INDEX_FOOTER_STRUCT.size:
+        return None
+    file.seek(size - INDEX_FOOTER_STRUCT.size)
+    index_offset, count, magic = INDEX_FOOTER_STRUCT.unpack(file.read(INDEX_FOOTER_STRUCT.size))
+    if magic != INDEX_MAGIC or \
+            index_offset + count * 8 + INDEX_FOOTER_STRUCT.size != size:
+        return None
+    return index_offset, count
+
+
+def read_records(path: str) -> Iterator[GameRecord]:
+    """
+    Reads every record in a file, one at a time,
+    so that files of any size can be scanned.
+
+    :param path: The path of the record file.
+    :return: The records, in the order they were written.
+    :raises ValueError: If the file is not a record file.
+    """
+    with open(path, 'rb') as file:
+        footer = read_index_footer(file)
+        file.seek(0)
+        check_record_file(file, path)
+        # Without a footer, the records are read until the file runs out.
+        end = footer[0] if footer is not None else None
+        while end is None or file.tell() < end:
+            record = read_record(file)
+            if record is None:
+                break
+            yield record
+
+
+class GameRecordReader:
+    """Looks up records in a file by their number, using its index footer."""
+
+    def __init__(self, path: str) -> None:
+        """
+        Opens a record file, reading its index.
+        :param path: The path of the record file.
+        :raises ValueError: If the file is not a record file, or has no index.
+        """
+        self.file: BinaryIO = open(path, 'rb')
+        try:
+            check_record_file(self.file, path)
+            footer = read_index_footer(self.file)
+            if footer is None:
+                raise ValueError(f'{path} has no index.')
+        except ValueError:
+            self.file.close()
+            raise
+        index_offset, count = footer
+        self.file.seek(index_offset)
+        self.offsets: array = array('Q')
+        self.offsets.frombytes(self.file.read(count * 8))
+        if sys.byteorder == 'little':
+            self.offsets.byteswap()
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, number: int) -> GameRecord:
+        self.file.seek(self.offsets[number])
+        record = read_record(self.file)
+        if record is None:
+            raise ValueError(f'Record {number} is cut short.')
+        return record
+
+    def close(self) -> None:
+        """Closes the file."""
+        self.file.close()
+
+
+class GameRecordWriter:
+    """
+    Appends records to a file, one at a time.
+    The index footer is written when the writer is closed.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Opens a record file, adding to the end of it if it exists.
+        :param path: The path of the record file.
+        :raises ValueError: If the file exists but is not a record file.
+        """
+        self.path: str = path
+        self.offsets: array = array('Q')
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            self.file: BinaryIO = open(path, 'wb')
+            self.file.write(RECORD_FILE_STRUCT.pack(RECORD_MAGIC, RECORD_VERSION))
+            return
+        self.file = open(path, 'r+b')
+        try:
+            check_record_file(self.file, path)
+        except ValueError:
+            self.file.close()
+            raise
+        footer = read_index_footer(self.file)
+        if footer is not None:
+            index_offset, count = footer
+            self.file.seek(index_offset)
+            self.offsets.frombytes(self.file.read(count * 8))
+            if sys.byteorder == 'little':
+                self.offsets.byteswap()
+            end = index_offset
+        else:
+            # Writing the footer was interrupted, so find the records again.
+            self.file.seek(RECORD_FILE_STRUCT.size)
+            end = self.file.tell()
+            while read_record(self.file) is not None:
+                self.offsets.append(end)
+                end = self.file.tell()
+        # New records overwrite the old footer.
+        self.file.seek(end)
+        self.file.truncate()
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def write(self, record: GameRecord) -> None:
+        """
+        Appends a record.
+        :param record: The record.
+        """
+        self.offsets.append(self.file.tell())
+        self.file.write(record.serialize())
+
+    def write_game(self,
+                   game: ConnectFour,
+                   player_one: str,
+                   player_two: str,
+                   resigned: Optional[Player] = None) -> None:
+        """
+        Appends a record of a game.
+        :param game: The game.
+        :param player_one: The username of the player who went first.
+        :param player_two: The username of the player who went second.
+        :param resigned: The player who resigned, if either did.
+        """
+        self.write(GameRecord.from_game(game, player_one, player_two, resigned))
+
+    def close(self) -> None:
+        """Writes the index footer, then closes the file."""
+        index_offset = self.file.tell()
+        offsets = array('Q', self.offsets)
+        if sys.byteorder == 'little':
+            offsets.byteswap()
+        self.file.write(offsets.tobytes())
+        self.file.write(INDEX_FOOTER_STRUCT.pack(index_offset, len(self.offsets), INDEX_MAGIC))
+        self.file.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Summarizes game record files.')
+    parser.add_argument('paths', nargs='+', help='the record files to read')
+    args = parser.parse_args()
+    outcomes: Counter = Counter()
+    moves = 0
+    for path in args.paths:
+        for record in read_records(path):
+            outcomes[record.outcome] += 1
+            moves += record.move_count
+    games = sum(outcomes.values())
+    print(f'{games} games, {moves} moves.')
+    for outcome in Outcome:
+        print(f'{outcome.name.lower().replace("_", " ")}: {outcomes[outcome]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import logging
+import socket
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Optional, Set
+
+from computer_player import ComputerPlayer
+from async_game_connection import AsyncGameConnection
+from connect_four import ConnectFour, Player
+from game_protocol import ProtocolError
+from game_record import GameRecordWriter
+from joinable_lobby import JoinableLobby
+from lobby_advertiser import LobbyAdvertiser
+from network_settings import (ADVERTISING_ADDRESS, ADVERTISING_WAIT_TIME,
+                              MOVE_TIMEOUT)
+from tournament import Policy, PolicyFactory
+
+logger = logging.getLogger(__name__)
+
+# The computer player of each search process. Every match searched in
+# a process shares it, so there is one transposition table per process
+# rather than one per match.
+search_player: Optional[ComputerPlayer] = None
+
+
+def start_search_process(time_limit: float, table_size: int) -> None:
+    """
+    Creates the computer player of a search process.
+    This runs in the search processes when they start.
+
+    :param time_limit: How many seconds to spend choosing a move.
+    :param table_size: How many entries the transposition table holds.
+    """
+    global search_player
+    search_player = ComputerPlayer(time_limit=time_limit, table_size=table_size)
+
+
+def search_move(game: ConnectFour) -> int:
+    """
+    Chooses a move with the computer player of the process this runs in.
+
+    :param game: The game to choose a move for.
+    :return: The chosen column.
+    """
+    return search_player(game)
+
+
+def shared_policy() -> Policy:
+    """
+    Gets the policy of a match that searches with the search processes'
+    computer players, instead of creating a computer player of its own.
+
+    :return: The policy.
+    """
+    return search_move
+
+
+class ServerLobby:
+    """A lobby hosted by a GameServer, which any number of players can join."""
+
+    def __init__(self, info: JoinableLobby, server: asyncio.AbstractServer) -> None:
+        """
+        Creates a hosted lobby.
+
+        :param info: The lobby info that is advertised.
+        :param server: The server accepting connections for the lobby.
+        """
+        self.info: JoinableLobby = info
+        self.server: asyncio.AbstractServer = server
+        self.matches: Set[asyncio.Task] = set()
+
+
+class GameServer:
+    """
+    Hosts many lobbies and matches in one asyncio event loop.
+
+    Every player who joins a lobby gets their own match against the server,
+    which plays first using a policy (the computer player by default).
+    Players join with the same protocol as a HostedLobby,
+    so any client can play on the server.
+    """
+
+    def __init__(self,
+                 host_name: str = 'Server',
+                 policy_factory: Optional[PolicyFactory] = None,
+                 executor: Optional[Executor] = None,
+                 search_workers: Optional[int] = None,
+                 time_limit: float = 0.1,
+                 table_size: int = 1 << 16,
+                 move_timeout: float = MOVE_TIMEOUT,
+                 advertising_wait_time: float = ADVERTISING_WAIT_TIME,
+                 recorder: Optional[GameRecordWriter] = None) -> None:
+        """
+        Creates a game server with no lobbies.
+
+        :param host_name: The username the server plays as.
+        :param policy_factory: Creates the policy the server plays each match with,
+                               or None to play with the computer player.
+        :param executor: Where the policies are run, so that searching for a
+                         move doesn't stop the event loop. None creates one
+                         for the server: a pool of search_workers processes
+                         for the computer player, which each have one
+                         transposition table shared by all of their matches,
+                         or a pool of search_workers threads for other policies.
+        :param search_workers: How many processes or threads the server's
+                               own executor has, or None for one per core.
+        :param time_limit: How many seconds the computer player spends
+                           choosing each move.
+        :param table_size: How many entries the transposition table
+                           of each search process holds.
+        :param move_timeout: How many seconds players have to make each move.
+        :param advertising_wait_time: How many seconds to wait between
+                                      advertising the lobbies.
+        :param recorder: Where to record every match, or None to not record them.
+                         It is closed when the server is.
+        """
+        # Only an executor created by the server is shut down by it.
+        self.owns_executor: bool = executor is None
+        if executor is None:
+            if policy_factory is None:
+                executor = ProcessPoolExecutor(search_workers,
+                                               initializer=start_search_process,
+                                               initargs=(time_limit, table_size))
+            else:
+                executor = ThreadPoolExecutor(search_workers)
+        if policy_factory is None:
+            policy_factory = shared_policy
+        self.host_name: str = host_name
+        self.policy_factory: PolicyFactory = policy_factory
+        self.executor: Executor = executor
+        self.move_timeout: float = move_timeout
+        self.advertising_wait_time: float = advertising_wait_time
+        self.recorder: Optional[GameRecordWriter] = recorder
+        self.lobbies: Dict[int, ServerLobby] = {}
+        self.advertiser = LobbyAdvertiser()
+        self.advertising_socket = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        self.advertising_socket.setblocking(False)
+        self.advertising_task: Optional[asyncio.Task] = None
+        self.matches_started: int = 0
+        # Matches that were played to the end or resigned.
+        self.matches_finished: int = 0
+        # Matches ended by the player making an illegal move.
+        self.matches_forfeited: int = 0
+
+    async def open_lobby(self,
+                         lobby_name: str,
+                         rows: int = 6,
+                         columns: int = 7,
+                         connect_n: int = 4) -> JoinableLobby:
+        """
+        Starts accepting players for a new lobby.
+
+        :param lobby_name: The name of the lobby.
+        :param rows: The number of rows for Connect 4.
+        :param columns: The number of columns for Connect 4.
+        :param connect_n: How many tiles in a row to win for Connect 4.
+        :return: The lobby info that will be advertised.
+        """
+        lobby: Optional[ServerLobby] = None
+
+        def accept(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            task = asyncio.ensure_future(self.play_match(lobby.info, reader, writer))
+            lobby.matches.add(task)
+            task.add_done_callback(lobby.matches.discard)
+
+        server = await asyncio.start_server(accept, '::', 0, family=socket.AF_INET6)
+        port = server.sockets[0].getsockname()[1]
+        info = JoinableLobby('', port, lobby_name, self.host_name,
+                             rows, columns, connect_n)
+        lobby = ServerLobby(info, server)
+        self.lobbies[port] = lobby
+        self.advertiser.add(info)
+        return info
+
+    async def close_lobby(self, port: int) -> None:
+        """
+        Stops advertising a lobby and ends all of its matches.
+
+        :param port: The port of the lobby.
+        """
+        lobby = self.lobbies.pop(port, None)
+        if lobby is None:
+            return
+        self.advertiser.remove(port)
+        lobby.server.close()
+        for task in list(lobby.matches):
+            task.cancel()
+        await asyncio.gather(*lobby.matches, return_exceptions=True)
+        await lobby.server.wait_closed()
+
+    def start_advertising(self) -> None:
+        """Starts advertising every lobby in the background."""
+        if self.advertising_task is None:
+            self.advertising_task = asyncio.ensure_future(self.advertise_forever())
+
+    async def advertise_forever(self) -> None:
+        """Advertises every lobby, waiting advertising_wait_time between each."""
+        while True:
+            self.advertise()
+            await asyncio.sleep(self.advertising_wait_time)
+
+    def advertise(self) -> None:
+        """
+        Advertises every lobby once, in as few datagrams as possible,
+        including any lobbies that have closed since the last advertisement.
+        """
+        self.advertiser.advertise(self.advertising_socket, ADVERTISING_ADDRESS)
+
+    async def play_match(self,
+                         info: JoinableLobby,
+                         reader: asyncio.StreamReader,
+                         writer: asyncio.StreamWriter) -> None:
+        """
+        Plays a game against a player who has joined a lobby.
+
+        The player's moves are checked on the server, and the player is
+        disconnected if they make an illegal move or take too long.
+        If the server's policy chooses an illegal move, the server resigns.
+
+        :param info: The lobby the player joined.
+        :param reader: The stream to receive the player's messages from.
+        :param writer: The stream to send messages to the player with.
+        """
+        self.matches_started += 1
+        loop = asyncio.get_running_loop()
+        policy = self.policy_factory()
+        game = ConnectFour(info.rows, info.columns, info.connect_n)
+        connection = AsyncGameConnection(reader, writer, Player.ONE, self.host_name,
+                                         move_timeout=self.move_timeout)
+        resigned: Optional[Player] = None
+        try:
+            await connection.handshake(self.move_timeout)
+            while not game.is_over():
+                if game.turn == Player.ONE:
+                    # The policy searches a copy, as a search that is still
+                    # running when the match is cancelled mustn't change
+                    # the game that is recorded.
+                    column = await loop.run_in_executor(self.executor, policy, game.copy())
+                    if not 0 <= column < game.columns or not game.place(column):
+                        logger.warning('%s chose an illegal move in %s, and resigned.',
+                                       self.host_name, info.lobby_name)
+                        resigned = Player.ONE
+                        await connection.resign()
+                        break
+                    await connection.send_move(column)
+                    continue
+                column = await connection.receive_move()
+                if column is None:
+                    resigned = Player.TWO
+                    break
+                if column >= game.columns or not game.place(column):
+                    logger.warning('%s made an illegal move in %s.',
+                                   connection.opponent_username, info.lobby_name)
+                    self.matches_forfeited += 1
+                    break
+            if game.is_over() or resigned is not None:
+                self.matches_finished += 1
+        except (TimeoutError, ConnectionError, ProtocolError):
+            # The player disconnected, stopped responding,
+            # or doesn't speak the protocol.
+            pass
+        finally:
+            if self.recorder is not None and connection.said_hello():
+                self.recorder.write_game(game, self.host_name,
+                                         connection.opponent_username, resigned)
+            try:
+                await connection.disconnect()
+            except asyncio.CancelledError:
+                pass
+
+    def active_matches(self) -> int:
+        """
+        Counts the matches being played.
+
+        :return: The number of matches.
+        """
+        return sum(len(lobby.matches) for lobby in self.lobbies.values())
+
+    async def close(self) -> None:
+        """Stops advertising and closes every lobby, ending their matches."""
+        if self.advertising_task is not None:
+            self.advertising_task.cancel()
+            await asyncio.gather(self.advertising_task, return_exceptions=True)
+            self.advertising_task = None
+        for port in list(self.lobbies):
+            await self.close_lobby(port)
+        # Tell listeners that the lobbies have closed.
+        self.advertise()
+        self.advertising_socket.close()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        if self.owns_executor:
+            # Shutting down waits for any search that is still running,
+            # which mustn't stop the event loop.
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, partial(self.executor.shutdown,
+                                                     cancel_futures=True))
+
+
+async def serve(lobby_count: int, host_name: str, record_path: Optional[str] = None) -> None:
+    recorder = GameRecordWriter(record_path) if record_path else None
+    server = GameServer(host_name, recorder=recorder)
+    for lobby_number in range(1, lobby_count + 1):
+        info = await server.open_lobby(f'{host_name} {lobby_number}')
+        print(f'Hosting "{info.lobby_name}" on port {info.port}.')
+    server.start_advertising()
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f'{server.active_matches()} active matches, '
+                  f'{server.matches_finished} finished.')
+    finally:
+        await server.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Hosts lobbies against the computer.')
+    parser.add_argument('--lobbies', type=int, default=1,
+                        help='how many lobbies to host')
+    parser.add_argument('--name', default='Server',
+                        help='the username the server plays as')
+    parser.add_argument('--record', default=None,
+                        help='a game record file to add every match to')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    try:
+        asyncio.run(serve(args.lobbies, args.name, args.record))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+import secrets
+import socket
+import time
+from queue import Empty, Queue
+from threading import Thread
+from typing import Optional
+
+from connect_four import ConnectFour, Player
+from game_connection import GameConnection
+from game_protocol import ProtocolError
+from hosted_lobby import HostedLobby
+from joinable_lobby import JoinableLobby
+from network_settings import HANDSHAKE_TIMEOUT, JOINING_TIMEOUT, RECONNECT_TIMEOUT
+from spectators import SpectatorHub
+
+# How many seconds the joining player waits between attempts to reconnect.
+RETRY_WAIT: float = 1
+
+
+class GameSession:
+    """
+    A game against an opponent over a connection.
+    This can't be resumed if the connection drops; subclasses can.
+    """
+
+    def __init__(self,
+                 connection: GameConnection,
+                 reconnect_timeout: float = RECONNECT_TIMEOUT) -> None:
+        """
+        Creates a session.
+        :param connection: The connection to your opponent.
+        :param reconnect_timeout: How many seconds to try to resume for.
+        """
+        self.connection: GameConnection = connection
+        self.reconnect_timeout: float = reconnect_timeout
+
+    def resume(self, game: ConnectFour) -> bool:
+        """
+        Reconnects to your opponent after the connection dropped,
+        replacing connection and bringing the game up to date.
+        :param game: The game being played.
+        :return: True if the session was resumed, False otherwise.
+        """
+        return False
+
+    def played(self, game: ConnectFour) -> None:
+        """
+        Called after each move is placed, by either player.
+        :param game: The game being played.
+        """
+        pass
+
+    def close(self) -> None:
+        """Ends the session, disconnecting from your opponent."""
+        self.connection.disconnect()
+
+
+class HostSession(GameSession):
+    """
+    The host's side of a session. The host keeps the game as it really is,
+    and waits for the joining player to reconnect to the lobby.
+
+    Anyone else who connects to the lobby can watch the game,
+    which is streamed to them by a SpectatorHub.
+    """
+
+    def __init__(self,
+                 hosted_lobby: HostedLobby,
+                 connection: GameConnection,
+                 reconnect_timeout: float = RECONNECT_TIMEOUT,
+                 spectators: Optional[SpectatorHub] = None) -> None:
+        """
+        Starts a session, sending its token to the joining player,
+        and starts admitting spectators and reconnections to the lobby.
+
+        :param hosted_lobby: The lobby the joining player joined, which must
+                             still be accepting connections for them to reconnect.
+        :param connection: The connection to the joining player.
+        :param reconnect_timeout: How many seconds to wait for them to reconnect.
+        :param spectators: The hub for spectators who arrived before the game
+                           started, or None to start a new one.
+        """
+        super().__init__(connection, reconnect_timeout)
+        self.hosted_lobby: HostedLobby = hosted_lobby
+        # The lobby is still advertised, so the game can be found to watch.
+        hosted_lobby.info.in_progress = True
+        self.spectators: SpectatorHub = spectators if spectators is not None else SpectatorHub()
+        self.token: Optional[bytes] = None
+        if connection.start_session():
+            self.token = connection.session_token
+        # Connections that asked to resume the session, for resume() to check.
+        self.resumes: Queue = Queue()
+        self.admitting_thread: Optional[Thread] = None
+        if hosted_lobby.accepting_thread is not None:
+            self.admitting_thread = Thread(target=self.admit_connections, daemon=True)
+            self.admitting_thread.start()
+
+    def admit_connections(self) -> None:
+        """Admits each connection to the lobby on its own thread, until closed."""
+        while True:
+            game_socket = self.hosted_lobby.accepting_thread.next_connection()
+            if game_socket is None:
+                break
+            # Saying hello can take a while, so one slow connection
+            # mustn't hold up the rest.
+            Thread(target=self.admit, args=(game_socket,), daemon=True).start()
+
+    def admit(self, game_socket: socket.socket) -> None:
+        """
+        Says hello to a connection to the lobby, then adds it to the
+        spectators, or queues it for resume() if it asked to resume.
+        Anyone else wants to play, and is refused, as the game has started.
+        :param game_socket: The connected socket.
+        """
+        connection = None
+        try:
+            connection = GameConnection(
+                game_socket, Player.ONE, self.connection.username,
+                metrics=self.connection.metrics,
+                move_timeout=self.connection.move_timeout
+            )
+            connection.receive_after_hello(HANDSHAKE_TIMEOUT)
+        except (OSError, ProtocolError):
+            if connection is None:
+                game_socket.close()
+            else:
+                connection.disconnect()
+            return
+        if connection.spectating:
+            self.spectators.add(game_socket)
+        elif connection.resume_token is not None:
+            self.resumes.put(connection)
+        else:
+            connection.refuse()
+
+    def resume(self, game: ConnectFour) -> bool:
+        if self.token is None or self.admitting_thread is None:
+            return False
+        self.connection.disconnect()
+        deadline = time.monotonic() + self.reconnect_timeout
+        while time.monotonic() < deadline:
+            try:
+                connection = self.resumes.get(
+                    timeout=max(0.0, deadline - time.monotonic()))
+            except Empty:
+                return False
+            # Anyone could connect to the lobby, so make sure it's the same player.
+            if not secrets.compare_digest(connection.resume_token, self.token):
+                connection.disconnect()
+                continue
+            try:
+                connection.session_token = self.token
+                connection.send_state(game)
+            except OSError:
+                connection.disconnect()
+                continue
+            if game.turn != connection.player:
+                connection.expect_move()
+            self.connection = connection
+            return True
+        return False
+
+    def played(self, game: ConnectFour) -> None:
+        self.spectators.update(game)
+
+    def close(self) -> None:
+        super().close()
+        if self.admitting_thread is not None:
+            # Wake up the admitting thread so that it stops.
+            self.hosted_lobby.accepting_thread.new_connections.put(None)
+            self.admitting_thread.join()
+        self.spectators.close()
+        self.hosted_lobby.close()
+        while not self.resumes.empty():
+            self.resumes.get().disconnect()
+
+
+class JoinSession(GameSession):
+    """
+    The joining player's side of a session, which reconnects to the lobby
+    and takes the game as the host has it.
+    """
+
+    def __init__(self,
+                 lobby: JoinableLobby,
+                 connection: GameConnection,
+                 reconnect_timeout: float = RECONNECT_TIMEOUT) -> None:
+        """
+        Creates a session. It can be resumed once the host has sent its token.
+
+        :param lobby: The lobby that was joined.
+        :param connection: The connection to the host.
+        :param reconnect_timeout: How many seconds to keep trying to reconnect.
+        """
+        super().__init__(connection, reconnect_timeout)
+        self.lobby: JoinableLobby = lobby
+
+    def resume(self, game: ConnectFour) -> bool:
+        token = self.connection.session_token
+        if token is None:
+            return False
+        self.connection.disconnect()
+        deadline = time.monotonic() + self.reconnect_timeout
+        while time.monotonic() < deadline:
+            connection = None
+            try:
+                connection = self.lobby.join(
+                    self.connection.username,
+                    min(JOINING_TIMEOUT, max(0.1, deadline - time.monotonic())),
+                    resume_token=token
+                )
+                if connection is None:
+                    continue
+                connection.receive_until(lambda: connection.state is not None,
+                                         HANDSHAKE_TIMEOUT)
+            except (OSError, ProtocolError):
+                if connection is not None:
+                    connection.disconnect()
+                time.sleep(RETRY_WAIT)
+                continue
+            if not self.replay(game, connection):
+                connection.disconnect()
+                return False
+            connection.session_token = token
+            connection.move_deadline = None
+            if game.turn != connection.player:
+                connection.expect_move()
+            self.connection = connection
+            return True
+        return False
+
+    @staticmethod
+    def replay(game: ConnectFour, connection: GameConnection) -> bool:
+        """
+        Replaces the game with the one the host sent.
+        :param game: The game being played.
+        :param connection: The connection the host sent their game over.
+        :return: True if the host's game could be played, False otherwise.
+        """
+        rows, columns, connect_n, moves = connection.state
+        if (rows, columns, connect_n) != (game.rows, game.columns, game.connect_n):
+            return False
+        game.reset()
+        for column in moves:
+            if column >= game.columns or not game.place(column):
+                return False
+        return True
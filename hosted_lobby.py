@@ -15,7 +15,7 @@ class HostedLobby:
         # Create the server socket.
         self.server_socket = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
         self.server_socket.bind(('', 0))
-        self.server_socket.listen(1)
+        self.server_socket.listen()
         # Create the advertising socket.
         self.advertising_socket = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
         # self.advertising_socket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_HOPS, struct.pack('!i', 5))
@@ -40,10 +40,10 @@ class HostedLobby:
     def advertise(self) -> None:
         self.advertising_socket.sendto(self.info.serialize(), ADVERTISING_ADDRESS)
 
-    def start_accepting(self) -> None:
+    def start_accepting(self, max_connections: int = 1) -> None:
         if self.accepting_thread:
             return
-        self.accepting_thread = AcceptThread(self.server_socket)
+        self.accepting_thread = AcceptThread(self.server_socket, max_connections)
         self.accepting_thread.start()
 
     def stop_accepting(self) -> None:
@@ -4,13 +4,18 @@ from typing import Tuple, Optional
 
 from connect_four import Player
 from game_connection import GameConnection
-from network_settings import (JOINING_TIMEOUT, LOBBY_STRUCT,
-                              NAME_ENCODING, NAME_ERRORS)
+from game_protocol import ProtocolError
+from network_settings import (HANDSHAKE_TIMEOUT, JOINING_TIMEOUT, LOBBY_STRUCT,
+                              NAME_ENCODING, NAME_ERRORS, SPECTATOR_PROTOCOL_VERSION)
+from spectators import SpectatorConnection
 
 
 class JoinableLobby:
     """Contains information about a lobby and how to join it."""
 
+    __slots__ = ('ip_address', 'port', 'lobby_name', 'host_name',
+                 'rows', 'columns', 'connect_n', 'in_progress', 'serialized')
+
     def __init__(self,
                  ip_address: str,
                  port: int,
@@ -18,7 +23,8 @@ class JoinableLobby:
                  host_name: str,
                  rows: int = 6,
                  columns: int = 7,
-                 connect_n: int = 4) -> None:
+                 connect_n: int = 4,
+                 in_progress: bool = False) -> None:
         """
         Creates a lobby that can be joined.
 
@@ -29,6 +35,8 @@ class JoinableLobby:
         :param rows: The number of rows for Connect 4.
         :param columns: The number of columns for Connect 4.
         :param connect_n: How many tiles in a row to win for Connect 4.
+        :param in_progress: Whether the lobby's game has started,
+                            so it can be watched but not joined.
         """
         self.ip_address: str = ip_address
         self.port: int = port
@@ -37,6 +45,10 @@ class JoinableLobby:
         self.rows: int = rows
         self.columns: int = columns
         self.connect_n: int = connect_n
+        self.in_progress: bool = in_progress
+        # The fields that serialize() last packed with the default arguments,
+        # and what it returned, or None if it hasn't been called yet.
+        self.serialized: Optional[Tuple[tuple, bytes]] = None
 
     def address(self) -> Tuple[str, int]:
         """
@@ -47,21 +59,80 @@ class JoinableLobby:
 
     def join(self,
              username: str,
-             timeout: float = JOINING_TIMEOUT) -> Optional[GameConnection]:
+             timeout: float = JOINING_TIMEOUT,
+             resume_token: Optional[bytes] = None) -> Optional[GameConnection]:
         """
         Joins the lobby.
+
+        Since protocol version 3, this waits until the host has seated you,
+        and raises ProtocolError if another player has already been seated.
+        The socket is closed if the connection or the handshake fails.
+
         :param timeout: How long to wait for the connection to succeed.
+        :param resume_token: The token of the session to resume,
+                             or None to join as a new player.
         :return: The GameConnection connected to the host,
-                 or None if the connection failed or timed out.
+                 or None if the connection timed out.
         """
         game_socket = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
         game_socket.settimeout(timeout)
+        connection = None
         try:
             game_socket.connect(self.address())
-            return GameConnection(
+            connection = GameConnection(
                 game_socket, Player.TWO, username, self.host_name)
+            # Say why you've connected, so the host doesn't have to wait to find out.
+            if resume_token is not None:
+                connection.resume(resume_token)
+            elif connection.version >= SPECTATOR_PROTOCOL_VERSION:
+                connection.ping()
+                # The host sends its session, or its first move,
+                # once you are seated.
+                connection.receive_until(
+                    lambda: connection.session_token is not None or connection.moves_received,
+                    HANDSHAKE_TIMEOUT
+                )
+            return connection
+        except TimeoutError:
+            self.close_failed(game_socket, connection)
+            return None
+        except (OSError, ProtocolError):
+            self.close_failed(game_socket, connection)
+            raise
+
+    @staticmethod
+    def close_failed(game_socket: socket.socket,
+                     connection: Optional[GameConnection]) -> None:
+        """
+        Closes a connection to the lobby that failed.
+        :param game_socket: The socket of the connection.
+        :param connection: The connection, or None if it wasn't created.
+        """
+        if connection is None:
+            game_socket.close()
+        else:
+            connection.disconnect()
+
+    def spectate(self,
+                 username: str,
+                 timeout: float = JOINING_TIMEOUT) -> Optional[SpectatorConnection]:
+        """
+        Watches the game being played in the lobby.
+        :param timeout: How long to wait for the connection to succeed.
+        :return: The SpectatorConnection connected to the host,
+                 or None if the connection failed or timed out.
+        """
+        game_socket = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+        game_socket.settimeout(timeout)
+        try:
+            game_socket.connect(self.address())
+            return SpectatorConnection(game_socket, username)
         except TimeoutError:
+            game_socket.close()
             return None
+        except (OSError, ProtocolError):
+            game_socket.close()
+            raise
 
     def serialize(self,
                   packing_struct: Struct = LOBBY_STRUCT,
@@ -71,20 +142,31 @@ class JoinableLobby:
         Serializes the object to bytes.
 
         This should be used before sending the object across the network.
+        With the default arguments, the bytes are cached until the lobby changes.
 
         :param packing_struct: The Struct to pack the object with.
         :param encoding: The encoding to use for lobby_name and host_name.
         :param errors: The errors used when encoding lobby_name and host_name.
         :return: The bytes object that represents the object.
         """
+        default = (packing_struct is LOBBY_STRUCT
+                   and encoding == NAME_ENCODING and errors == NAME_ERRORS)
+        fields = (self.port, self.lobby_name, self.host_name,
+                  self.rows, self.columns, self.connect_n, self.in_progress)
+        # The cached bytes are only used if none of the fields have changed.
+        if default and self.serialized is not None and self.serialized[0] == fields:
+            return self.serialized[1]
         # Encode lobby_name and host_name
         lobby_name_bytes = self.lobby_name.encode(encoding, errors)
         host_name_bytes = self.host_name.encode(encoding, errors)
         # Pack everything in a string of bytes
-        return packing_struct.pack(
+        serialized = packing_struct.pack(
             self.port, lobby_name_bytes, host_name_bytes,
-            self.rows, self.columns, self.connect_n
+            self.rows, self.columns, self.connect_n, self.in_progress
         )
+        if default:
+            self.serialized = (fields, serialized)
+        return serialized
 
     @staticmethod
     def deserialize(ip_address: str,
@@ -113,6 +195,7 @@ class JoinableLobby:
         rows = unpacked_items[3]
         columns = unpacked_items[4]
         connect_n = unpacked_items[5]
+        in_progress = unpacked_items[6]
         # Decode lobby_name and host_name
         # strip to remove padding bytes from packing/unpacking
         lobby_name = lobby_name_bytes.decode(encoding, errors).rstrip('\x00')
@@ -120,5 +203,5 @@ class JoinableLobby:
         # Create and return the joinable lobby object
         return JoinableLobby(
             ip_address, port, lobby_name, host_name,
-            rows, columns, connect_n
+            rows, columns, connect_n, in_progress
         )
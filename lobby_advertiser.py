@@ -0,0 +1,176 @@
+import socket
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from joinable_lobby import JoinableLobby
+from network_settings import (ADVERTISEMENT_HEADER_STRUCT, ADVERTISEMENT_MAGIC,
+                              ADVERTISEMENT_MAX_BYTES, ADVERTISEMENT_RECORD_STRUCT,
+                              ADVERTISEMENT_VERSION, ADVERTISING_ADDRESS,
+                              CLOSED_RECORD, FULL_ADVERTISEMENT_INTERVAL,
+                              FULL_RECORD, HEARTBEAT_RECORD, LOBBY_STRUCT)
+
+# One record of a batch: the record type, the port of the lobby,
+# its sequence number, and the lobby itself for full records.
+AdvertisementRecord = Tuple[int, int, int, Optional[JoinableLobby]]
+
+# The most records a batch can hold, as the count is an unsigned char.
+MAX_RECORDS: int = 255
+
+
+class LobbyAdvertiser:
+    """
+    Advertises many lobbies at once, batching them into as few datagrams
+    as possible.
+
+    Each lobby is sent in full when it changes, and every
+    full_interval advertisements so that new listeners learn about it.
+    Otherwise only a small heartbeat is sent, which listeners match to the
+    lobby they already have by its port and sequence number.
+    """
+
+    def __init__(self,
+                 full_interval: int = FULL_ADVERTISEMENT_INTERVAL,
+                 max_bytes: int = ADVERTISEMENT_MAX_BYTES) -> None:
+        """
+        Creates an advertiser with no lobbies.
+
+        :param full_interval: How often (in advertisements) unchanged lobbies
+                              are sent in full.
+        :param max_bytes: The most bytes each datagram can be.
+        """
+        self.full_interval: int = full_interval
+        self.max_bytes: int = max_bytes
+        self.lobbies: Dict[int, JoinableLobby] = {}
+        # The sequence number of each lobby, which goes up when it changes,
+        # and the serialized lobby it was last sent as.
+        self.sequences: Dict[int, int] = {}
+        self.sent: Dict[int, bytes] = {}
+        # The ports of closed lobbies that listeners haven't been told about.
+        self.closed: List[int] = []
+        self.advertisements: int = 0
+
+    def add(self, lobby: JoinableLobby) -> None:
+        """
+        Starts advertising a lobby, replacing any lobby with the same port.
+        The lobby is sent in full whenever it changes.
+        :param lobby: The lobby.
+        """
+        self.lobbies[lobby.port] = lobby
+        self.sequences.setdefault(lobby.port, 0)
+        if lobby.port in self.closed:
+            self.closed.remove(lobby.port)
+
+    def remove(self, port: int) -> None:
+        """
+        Stops advertising a lobby, telling listeners
+        that it has closed in the next advertisement.
+        :param port: The port of the lobby.
+        """
+        if self.lobbies.pop(port, None) is None:
+            return
+        self.sent.pop(port, None)
+        self.closed.append(port)
+
+    def records(self) -> Iterator[bytes]:
+        """
+        Packs the records of one advertisement,
+        updating the sequence numbers of any changed lobbies.
+        :return: The packed records.
+        """
+        send_all = self.advertisements % self.full_interval == 0
+        self.advertisements += 1
+        for port in self.closed:
+            yield ADVERTISEMENT_RECORD_STRUCT.pack(
+                CLOSED_RECORD, port, self.sequences.pop(port, 0))
+        self.closed.clear()
+        for port, lobby in self.lobbies.items():
+            serialized = lobby.serialize()
+            changed = self.sent.get(port) != serialized
+            if changed and port in self.sent:
+                self.sequences[port] = (self.sequences[port] + 1) & 0xFFFFFFFF
+            sequence = self.sequences[port]
+            if changed or send_all:
+                self.sent[port] = serialized
+                yield ADVERTISEMENT_RECORD_STRUCT.pack(FULL_RECORD, port, sequence) + serialized
+            else:
+                yield ADVERTISEMENT_RECORD_STRUCT.pack(HEARTBEAT_RECORD, port, sequence)
+
+    def datagrams(self) -> List[bytes]:
+        """
+        Creates the datagrams of one advertisement.
+        :return: The datagrams, which each hold as many records as fit.
+        """
+        datagrams = []
+        batch: List[bytes] = []
+        size = ADVERTISEMENT_HEADER_STRUCT.size
+        for record in self.records():
+            if batch and (size + len(record) > self.max_bytes or len(batch) == MAX_RECORDS):
+                datagrams.append(pack_batch(batch))
+                batch = []
+                size = ADVERTISEMENT_HEADER_STRUCT.size
+            batch.append(record)
+            size += len(record)
+        if batch:
+            datagrams.append(pack_batch(batch))
+        return datagrams
+
+    def advertise(self,
+                  advertising_socket: socket.socket,
+                  address: Tuple[str, int] = ADVERTISING_ADDRESS) -> None:
+        """
+        Sends one advertisement.
+        :param advertising_socket: The UDP socket to send the datagrams with.
+        :param address: The address to send the datagrams to.
+        """
+        for datagram in self.datagrams():
+            try:
+                advertising_socket.sendto(datagram, address)
+            except OSError:
+                # Advertisements are repeated, so a dropped one doesn't matter.
+                pass
+
+
+def pack_batch(records: List[bytes]) -> bytes:
+    """
+    Packs records into a batch, with a header in front.
+    :param records: The packed records.
+    :return: The batch.
+    """
+    header = ADVERTISEMENT_HEADER_STRUCT.pack(
+        ADVERTISEMENT_MAGIC, ADVERTISEMENT_VERSION, len(records))
+    return header + b''.join(records)
+
+
+def unpack_batch(ip_address: str, source: bytes) -> List[AdvertisementRecord]:
+    """
+    Unpacks the records of a batch.
+
+    Anything that isn't a batch of this version, and any records cut short,
+    are ignored rather than raising an exception,
+    as anyone can send datagrams to the advertising address.
+
+    :param ip_address: The IP address the batch was sent from.
+    :param source: The batch.
+    :return: The records of the batch.
+    """
+    header_size = ADVERTISEMENT_HEADER_STRUCT.size
+    if len(source) < header_size:
+        return []
+    magic, version, count = ADVERTISEMENT_HEADER_STRUCT.unpack_from(source)
+    if magic != ADVERTISEMENT_MAGIC or version != ADVERTISEMENT_VERSION:
+        return []
+    records = []
+    offset = header_size
+    for _ in range(count):
+        if offset + ADVERTISEMENT_RECORD_STRUCT.size > len(source):
+            break
+        record_type, port, sequence = ADVERTISEMENT_RECORD_STRUCT.unpack_from(source, offset)
+        offset += ADVERTISEMENT_RECORD_STRUCT.size
+        lobby = None
+        if record_type == FULL_RECORD:
+            end = offset + LOBBY_STRUCT.size
+            if end > len(source):
+                break
+            lobby = JoinableLobby.deserialize(ip_address, source[offset:end])
+            offset = end
+        records.append((record_type, port, sequence, lobby))
+    return records
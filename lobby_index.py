@@ -0,0 +1,192 @@
+from bisect import bisect_left, insort
+from threading import RLock
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from joinable_lobby import JoinableLobby
+from lobby_manager import LobbyEvent
+
+# Lobbies are identified by their address (IP address and port).
+LobbyKey = Tuple[str, int]
+
+
+class LobbyPage:
+    """One page of the results of a LobbyIndex query."""
+
+    def __init__(self, lobbies: List[JoinableLobby], page: int,
+                 page_size: int, total: int) -> None:
+        """
+        Creates a page of results.
+
+        :param lobbies: The lobbies on the page.
+        :param page: The 0-indexed number of the page.
+        :param page_size: The most lobbies a page can have.
+        :param total: How many lobbies matched the query, across every page.
+        """
+        self.lobbies: List[JoinableLobby] = lobbies
+        self.page: int = page
+        self.page_size: int = page_size
+        self.total: int = total
+
+    def pages(self) -> int:
+        """
+        Gets how many pages of results there are.
+        :return: The number of pages, which is at least 1.
+        """
+        return max(1, -(-self.total // self.page_size))
+
+    def first_number(self) -> int:
+        """
+        Gets the 1-indexed position of the first lobby on the page,
+        out of every lobby that matched the query.
+        :return: The position.
+        """
+        return self.page * self.page_size + 1
+
+
+class LobbyIndex:
+    """
+    Indexes lobbies by board size, gamemode, name and host,
+    so that large numbers of lobbies can be searched and paginated.
+
+    The index is updated one lobby at a time as advertisements arrive,
+    by subscribing handle_event() to a LobbyManager.
+    """
+
+    def __init__(self, lobbies: Iterable[JoinableLobby] = ()) -> None:
+        """
+        Creates an index.
+        :param lobbies: The lobbies to start with.
+        """
+        self.lobbies: Dict[LobbyKey, JoinableLobby] = {}
+        self.by_size: Dict[Tuple[int, int], Set[LobbyKey]] = {}
+        self.by_connect_n: Dict[int, Set[LobbyKey]] = {}
+        self.by_host: Dict[str, Set[LobbyKey]] = {}
+        # Sorted by lowercase lobby name, for prefix searches and ordering.
+        self.names: List[Tuple[str, LobbyKey]] = []
+        # Held while the index is used, as events may come from another thread.
+        self.lock = RLock()
+        for lobby in lobbies:
+            self.add(lobby)
+
+    def __len__(self) -> int:
+        return len(self.lobbies)
+
+    def handle_event(self, event: LobbyEvent, lobby: JoinableLobby) -> None:
+        """
+        Updates the index with a change to the available lobbies.
+        This can be passed to LobbyManager.subscribe().
+        :param event: The kind of change.
+        :param lobby: The lobby that changed.
+        """
+        if event == LobbyEvent.REMOVED:
+            self.remove(lobby.address())
+        else:
+            self.add(lobby)
+
+    def add(self, lobby: JoinableLobby) -> None:
+        """
+        Adds a lobby to the index, replacing any lobby with the same address.
+        :param lobby: The lobby.
+        """
+        key = lobby.address()
+        with self.lock:
+            self.remove(key)
+            self.lobbies[key] = lobby
+            self.by_size.setdefault((lobby.rows, lobby.columns), set()).add(key)
+            self.by_connect_n.setdefault(lobby.connect_n, set()).add(key)
+            self.by_host.setdefault(lobby.host_name.lower(), set()).add(key)
+            insort(self.names, (lobby.lobby_name.lower(), key))
+
+    def remove(self, key: LobbyKey) -> Optional[JoinableLobby]:
+        """
+        Removes a lobby from the index.
+        :param key: The address of the lobby.
+        :return: The removed lobby, or None if it wasn't in the index.
+        """
+        with self.lock:
+            lobby = self.lobbies.pop(key, None)
+            if lobby is None:
+                return None
+            discard(self.by_size, (lobby.rows, lobby.columns), key)
+            discard(self.by_connect_n, lobby.connect_n, key)
+            discard(self.by_host, lobby.host_name.lower(), key)
+            name = (lobby.lobby_name.lower(), key)
+            del self.names[bisect_left(self.names, name)]
+            return lobby
+
+    def query(self,
+              rows: Optional[int] = None,
+              columns: Optional[int] = None,
+              connect_n: Optional[int] = None,
+              name_prefix: str = '',
+              host_name: Optional[str] = None,
+              page: int = 0,
+              page_size: int = 20) -> LobbyPage:
+        """
+        Finds the lobbies matching every given filter,
+        sorted by lobby name.
+
+        :param rows: The number of rows, or None for any.
+        :param columns: The number of columns, or None for any.
+        :param connect_n: How many tiles in a row to win, or None for any.
+        :param name_prefix: What the lobby name starts with (ignoring case).
+        :param host_name: The username of the host (ignoring case), or None for any.
+        :param page: The 0-indexed page of results to get.
+        :param page_size: How many lobbies are on each page.
+        :return: The page of results.
+        """
+        with self.lock:
+            filters = []
+            if rows is not None or columns is not None:
+                filters.append(set().union(*(
+                    keys for (size_rows, size_columns), keys in self.by_size.items()
+                    if rows in (None, size_rows) and columns in (None, size_columns)
+                )))
+            if connect_n is not None:
+                filters.append(self.by_connect_n.get(connect_n, set()))
+            if host_name is not None:
+                filters.append(self.by_host.get(host_name.lower(), set()))
+            # Check the most selective filter first.
+            filters.sort(key=len)
+            prefix = name_prefix.lower()
+            start = bisect_left(self.names, (prefix,))
+            end = len(self.names)
+            if prefix:
+                end = bisect_left(self.names, (prefix[:-1] + chr(ord(prefix[-1]) + 1),))
+            skip = page * page_size
+            if not filters:
+                # Every name in the range matches, so only the page is needed.
+                page_start = min(start + skip, end)
+                page_end = min(page_start + page_size, end)
+                matches = [self.lobbies[key] for _, key in self.names[page_start:page_end]]
+                return LobbyPage(matches, page, page_size, end - start)
+            if len(filters[0]) < end - start:
+                # Sorting the few lobbies that pass the most selective filter
+                # is quicker than going through every name.
+                names = sorted(
+                    (self.lobbies[key].lobby_name.lower(), key)
+                    for key in filters[0] if all(key in keys for keys in filters[1:])
+                    and self.lobbies[key].lobby_name.lower().startswith(prefix)
+                )
+            else:
+                names = [(name, key) for name, key in self.names[start:end]
+                         if all(key in keys for keys in filters)]
+            matches = [self.lobbies[key] for _, key in names[skip:skip + page_size]]
+            total = len(names)
+            return LobbyPage(matches, page, page_size, total)
+
+
+def discard(index: Dict, value, key: LobbyKey) -> None:
+    """
+    Removes a key from one of the sets of an index,
+    removing the set if it is left empty.
+    :param index: The index.
+    :param value: The value the key is indexed by.
+    :param key: The key to remove.
+    """
+    keys = index.get(value)
+    if keys is None:
+        return
+    keys.discard(key)
+    if not keys:
+        del index[value]
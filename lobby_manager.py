@@ -1,12 +1,30 @@
+import heapq
+import selectors
 import socket
 import struct
 import time
+from enum import Enum
 from select import select
-from typing import Dict, List, Tuple
+from threading import Event, RLock, Thread
+from typing import Callable, Dict, List, Optional, Tuple
 
 from joinable_lobby import JoinableLobby
-from network_settings import (ADVERTISING_HOST, ADVERTISING_PORT,
-                              LOBBY_STRUCT, LOBBY_TIMEOUT)
+from lobby_advertiser import unpack_batch
+from network_settings import (ADVERTISEMENT_MAX_BYTES, ADVERTISING_HOST,
+                              ADVERTISING_PORT, CLOSED_RECORD, FULL_RECORD,
+                              HEARTBEAT_RECORD, LOBBY_STRUCT, LOBBY_TIMEOUT)
+
+
+class LobbyEvent(Enum):
+    """A change to the available lobbies."""
+
+    ADDED = 'added'
+    UPDATED = 'updated'
+    REMOVED = 'removed'
+
+
+# Called with each change to the available lobbies.
+LobbySubscriber = Callable[[LobbyEvent, JoinableLobby], None]
 
 
 class LobbyManager:
@@ -14,7 +32,24 @@ class LobbyManager:
 
     def __init__(self) -> None:
         """Creates a LobbyManager with no lobbies."""
+        # Every lobby is identified by its host's IP address and its own port,
+        # however it was advertised, which is also its address().
         self.lobbies: Dict[Tuple[str, int], TimedLobby] = {}
+        # The lobby each address advertising a single lobby last sent,
+        # as the message saying that it has closed doesn't say which.
+        self.sender_lobbies: Dict[Tuple, Tuple[str, int]] = {}
+        # When each lobby was last received, earliest first, used to find
+        # timed out lobbies without checking every lobby. Entries for
+        # lobbies that have since been received again are skipped.
+        self.expiry_heap: List[Tuple[float, Tuple[str, int]]] = []
+        self.subscribers: List[LobbySubscriber] = []
+        # Held while the lobbies are changed,
+        # as they may be changed by the discovery thread.
+        self.lock = RLock()
+        self.discovery_thread: Optional[Thread] = None
+        self.stop_event = Event()
+        # Writing to wakeup_sender wakes up the discovery thread, so it can stop.
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
         # Create the socket.
         listening_socket = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
         listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -34,13 +69,87 @@ class LobbyManager:
         """
         A convenience method that calls receive_lobbies(),
         remove_timed_out_lobbies(), and then returns lobbies_list().
+
+        If discovery is running, the lobbies are already up to date,
+        so this only returns lobbies_list().
+
         :param timeout: The parameter for remove_timed_out_lobbies().
         :return: The updated list of available lobbies.
         """
-        self.receive_lobbies()
-        self.remove_timed_out_lobbies(timeout)
+        if not self.is_discovering():
+            self.receive_lobbies()
+            self.remove_timed_out_lobbies(timeout)
         return self.lobbies_list()
 
+    def subscribe(self, subscriber: LobbySubscriber) -> None:
+        """
+        Calls a function whenever a lobby is added, updated, or removed.
+
+        While discovery is running the function is called from the
+        discovery thread, so it should return quickly.
+
+        :param subscriber: The function to call.
+        """
+        self.subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber: LobbySubscriber) -> None:
+        """
+        Stops calling a function that was passed to subscribe().
+        :param subscriber: The function to stop calling.
+        """
+        self.subscribers.remove(subscriber)
+
+    def publish(self, event: LobbyEvent, lobby: JoinableLobby) -> None:
+        """
+        Calls every subscriber with a change to the lobbies.
+        :param event: The kind of change.
+        :param lobby: The lobby that changed.
+        """
+        for subscriber in list(self.subscribers):
+            subscriber(event, lobby)
+
+    def start_discovery(self, timeout: float = LOBBY_TIMEOUT) -> None:
+        """
+        Starts receiving lobbies and removing timed out lobbies
+        in a background thread, as soon as each happens.
+        :param timeout: The parameter for remove_timed_out_lobbies().
+        """
+        if self.discovery_thread is not None:
+            return
+        self.stop_event.clear()
+        self.discovery_thread = Thread(target=self.discover, args=(timeout,), daemon=True)
+        self.discovery_thread.start()
+
+    def stop_discovery(self) -> None:
+        """Stops the background thread started by start_discovery()."""
+        if self.discovery_thread is None:
+            return
+        self.stop_event.set()
+        self.wakeup_sender.send(b'\0')
+        self.discovery_thread.join()
+        self.discovery_thread = None
+        # Drain the wakeup so discovery can be started again.
+        self.wakeup_receiver.recv(1024)
+
+    def is_discovering(self) -> bool:
+        return self.discovery_thread is not None
+
+    def discover(self, timeout: float = LOBBY_TIMEOUT) -> None:
+        """
+        Receives lobbies and removes timed out lobbies until stop_discovery()
+        is called, sleeping until the next message or timeout in between.
+        :param timeout: The parameter for remove_timed_out_lobbies().
+        """
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.listening_socket, selectors.EVENT_READ)
+            selector.register(self.wakeup_receiver, selectors.EVENT_READ)
+            while not self.stop_event.is_set():
+                events = selector.select(self.time_until_timeout(timeout))
+                for key, _ in events:
+                    if key.fileobj is self.listening_socket:
+                        self.receive_lobby()
+                self.remove_timed_out_lobbies(timeout)
+
     def receive_lobbies(self) -> None:
         """
         Receives all incoming lobby messages,
@@ -50,17 +159,110 @@ class LobbyManager:
         # read it and either add, update, or remove a lobby.
         readable = select([self.listening_socket], [], [], 0)[0]
         while readable:
-            received, sender = self.listening_socket.recvfrom(
-                LOBBY_STRUCT.size
-            )
+            self.receive_lobby()
+            readable = select([self.listening_socket], [], [], 0)[0]
+
+    def receive_lobby(self) -> None:
+        """
+        Receives one lobby message, either a single lobby or a batch of them
+        from a LobbyAdvertiser, and adds, updates, or removes lobbies accordingly.
+        This blocks until a message is available.
+        """
+        received, sender = self.listening_socket.recvfrom(
+            max(LOBBY_STRUCT.size, ADVERTISEMENT_MAX_BYTES)
+        )
+        with self.lock:
             # The lobby has closed, remove it.
             if received[:2] == b'00':
-                self.lobbies.pop(sender, None)
+                key = self.sender_lobbies.pop(sender, None)
+                if key is not None:
+                    self.remove_lobby(key)
             # The lobby is still open, update or add it.
-            else:
+            elif len(received) == LOBBY_STRUCT.size:
                 lobby = JoinableLobby.deserialize(sender[0], received)
-                self.lobbies[sender] = TimedLobby(lobby)
-            readable = select([self.listening_socket], [], [], 0)[0]
+                key = lobby.address()
+                self.sender_lobbies[sender] = key
+                self.update_lobby(key, lobby)
+            # A batch of lobbies, which are identified by their own port
+            # rather than the port they were sent from.
+            else:
+                for record_type, port, sequence, lobby in unpack_batch(sender[0], received):
+                    key = (sender[0], port)
+                    if record_type == FULL_RECORD:
+                        self.update_lobby(key, lobby, sequence)
+                    elif record_type == HEARTBEAT_RECORD:
+                        self.refresh_lobby(key, sequence)
+                    elif record_type == CLOSED_RECORD:
+                        self.remove_lobby(key)
+
+    def update_lobby(self, key: Tuple[str, int],
+                     lobby: JoinableLobby, sequence: int = 0) -> None:
+        """
+        Adds or updates a lobby that has been received.
+        :param key: What the lobby is identified by.
+        :param lobby: The lobby.
+        :param sequence: The sequence number the lobby was sent with.
+        """
+        with self.lock:
+            previous = self.lobbies.get(key)
+            timed_lobby = TimedLobby(lobby, sequence)
+            self.lobbies[key] = timed_lobby
+            heapq.heappush(self.expiry_heap, (timed_lobby.time_received, key))
+            if previous is None:
+                self.publish(LobbyEvent.ADDED, lobby)
+            elif previous.lobby.serialize() != lobby.serialize():
+                self.publish(LobbyEvent.UPDATED, lobby)
+
+    def refresh_lobby(self, key: Tuple[str, int], sequence: int) -> None:
+        """
+        Keeps a lobby from timing out after receiving a heartbeat for it.
+
+        If the lobby isn't known, or the sequence number shows that it has
+        changed since it was received, the heartbeat is ignored,
+        as the lobby will be sent in full again soon.
+
+        :param key: What the lobby is identified by.
+        :param sequence: The sequence number the heartbeat was sent with.
+        """
+        with self.lock:
+            timed_lobby = self.lobbies.get(key)
+            if timed_lobby is None or timed_lobby.sequence != sequence:
+                return
+            timed_lobby.time_received = time.monotonic()
+            heapq.heappush(self.expiry_heap, (timed_lobby.time_received, key))
+
+    def remove_lobby(self, key: Tuple[str, int]) -> None:
+        """
+        Removes a lobby that has closed.
+        :param key: What the lobby is identified by.
+        """
+        with self.lock:
+            timed_lobby = self.lobbies.pop(key, None)
+            if timed_lobby is not None:
+                self.forget_senders(key)
+                self.publish(LobbyEvent.REMOVED, timed_lobby.lobby)
+
+    def forget_senders(self, key: Tuple[str, int]) -> None:
+        """
+        Forgets which addresses advertised a lobby that has been removed.
+        :param key: What the lobby is identified by.
+        """
+        for sender in [sender for sender, lobby_key in self.sender_lobbies.items()
+                       if lobby_key == key]:
+            del self.sender_lobbies[sender]
+
+    def time_until_timeout(self, timeout: float = LOBBY_TIMEOUT) -> Optional[float]:
+        """
+        Gets how long until the next lobby could time out.
+        :param timeout: How many seconds between updates before
+                        a timeout is considered to have happened.
+        :return: The number of seconds, or None if there are no lobbies.
+        """
+        with self.lock:
+            if not self.expiry_heap:
+                return None
+            time_received = self.expiry_heap[0][0]
+        return max(0.0, time_received + timeout - time.monotonic())
 
     def remove_timed_out_lobbies(self, timeout: float = LOBBY_TIMEOUT) -> None:
         """
@@ -69,34 +271,49 @@ class LobbyManager:
         :param timeout: How many seconds between updates before
                         a timeout is considered to have happened.
         """
-        self.lobbies = {
-            sender: lobby for sender, lobby in self.lobbies.items()
-            if not lobby.has_timed_out(timeout)
-        }
+        with self.lock:
+            heap = self.expiry_heap
+            while heap and time.monotonic() - heap[0][0] > timeout:
+                time_received, key = heapq.heappop(heap)
+                timed_lobby = self.lobbies.get(key)
+                # Skip lobbies that have been received since.
+                if timed_lobby is None or timed_lobby.time_received != time_received:
+                    continue
+                del self.lobbies[key]
+                self.forget_senders(key)
+                self.publish(LobbyEvent.REMOVED, timed_lobby.lobby)
 
     def lobbies_list(self) -> List[JoinableLobby]:
         """
         Gets the list of available lobbies.
         :return: The list of available lobbies.
         """
-        return [timed_lobby.lobby for timed_lobby in self.lobbies.values()]
+        with self.lock:
+            return [timed_lobby.lobby for timed_lobby in self.lobbies.values()]
 
     def close(self) -> None:
         """Closes the lobby manager."""
+        self.stop_discovery()
         self.listening_socket.close()
+        self.wakeup_sender.close()
+        self.wakeup_receiver.close()
 
 
 class TimedLobby:
     """A helper class for LobbyManager."""
 
-    def __init__(self, lobby: JoinableLobby) -> None:
+    __slots__ = ('time_received', 'lobby', 'sequence')
+
+    def __init__(self, lobby: JoinableLobby, sequence: int = 0) -> None:
         """
         Creates what is effectively a tuple of the current time
         and the lobby given.
         :param lobby: The lobby.
+        :param sequence: The sequence number the lobby was sent with.
         """
         self.time_received = time.monotonic()
         self.lobby = lobby
+        self.sequence = sequence
 
     def has_timed_out(self, timeout: float = LOBBY_TIMEOUT) -> bool:
         """
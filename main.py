@@ -5,10 +5,10 @@ from text_name import accept_username
 
 def main():
     username = accept_username()
-    game_connection = text_lobby(username)
-    if not game_connection:
+    game_session = text_lobby(username)
+    if not game_session:
         return
-    text_game(game_connection)
+    text_game(game_session.connection, game_session)
 
 
 if __name__ == '__main__':
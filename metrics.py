@@ -0,0 +1,193 @@
+import json
+import math
+import time
+from threading import Lock
+from typing import Dict, List, Optional, TextIO
+
+
+class MetricsSink:
+    """
+    Where measurements of connections are sent, such as round trip times.
+    This sink discards them; subclasses keep or export them.
+    """
+
+    def record(self, connection: str, name: str, value: float) -> None:
+        """
+        Records one measurement.
+        :param connection: Which connection was measured, such as its address.
+        :param name: What was measured.
+        :param value: The measurement, in seconds for times.
+        """
+
+    def close(self) -> None:
+        """Releases anything the sink holds, such as files."""
+
+
+class Histogram:
+    """
+    Counts values in buckets that grow exponentially,
+    so that percentiles can be estimated in a fixed amount of memory.
+    """
+
+    # How many buckets there are per doubling of the value.
+    # Percentiles are accurate to within about 9% with 8.
+    BUCKETS_PER_DOUBLING: int = 8
+
+    def __init__(self) -> None:
+        """Creates a histogram with no values."""
+        self.count: int = 0
+        self.total: float = 0
+        self.minimum: float = math.inf
+        self.maximum: float = -math.inf
+        # How many values are in each bucket, which are indexed by
+        # floor(log2(value) * BUCKETS_PER_DOUBLING). None holds values <= 0.
+        self.buckets: Dict[Optional[int], int] = {}
+
+    def add(self, value: float) -> None:
+        """
+        Adds a value to the histogram.
+        :param value: The value.
+        """
+        self.count += 1
+        self.total += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        bucket = None
+        if value > 0:
+            bucket = math.floor(math.log2(value) * self.BUCKETS_PER_DOUBLING)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent: float) -> float:
+        """
+        Estimates a percentile of the values.
+        :param percent: The percentile, from 0 to 100.
+        :return: The upper bound of the bucket the percentile falls in,
+                 clamped to the values seen, or 0 if there are no values.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = self.buckets.get(None, 0)
+        if seen >= rank:
+            return max(0.0, self.minimum)
+        for bucket in sorted(bucket for bucket in self.buckets if bucket is not None):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                upper = 2 ** ((bucket + 1) / self.BUCKETS_PER_DOUBLING)
+                return min(max(upper, self.minimum), self.maximum)
+        return self.maximum
+
+
+class HistogramSink(MetricsSink):
+    """Keeps a Histogram of every measurement, by connection and name."""
+
+    def __init__(self) -> None:
+        """Creates a sink with no measurements."""
+        self.histograms: Dict[str, Dict[str, Histogram]] = {}
+        # Held while recording, as connections may be on different threads.
+        self.lock = Lock()
+
+    def record(self, connection: str, name: str, value: float) -> None:
+        with self.lock:
+            histograms = self.histograms.setdefault(connection, {})
+            histograms.setdefault(name, Histogram()).add(value)
+
+    def histogram(self, name: str, connection: Optional[str] = None) -> Histogram:
+        """
+        Gets the measurements of one name.
+        :param name: What was measured.
+        :param connection: Which connection, or None to combine every connection.
+        :return: The histogram, which is empty if there are no measurements.
+        """
+        with self.lock:
+            if connection is not None:
+                return self.histograms.get(connection, {}).get(name, Histogram())
+            combined = Histogram()
+            for histograms in self.histograms.values():
+                histogram = histograms.get(name)
+                if histogram is None:
+                    continue
+                combined.count += histogram.count
+                combined.total += histogram.total
+                combined.minimum = min(combined.minimum, histogram.minimum)
+                combined.maximum = max(combined.maximum, histogram.maximum)
+                for bucket, count in histogram.buckets.items():
+                    combined.buckets[bucket] = combined.buckets.get(bucket, 0) + count
+            return combined
+
+    def slowest_connections(self, name: str = 'rtt',
+                            percent: float = 95, count: int = 10) -> List[str]:
+        """
+        Finds the connections with the highest measurements.
+        :param name: What was measured.
+        :param percent: The percentile of each connection to compare.
+        :param count: The most connections to return.
+        :return: The connections, highest first.
+        """
+        with self.lock:
+            percentiles = {
+                connection: histograms[name].percentile(percent)
+                for connection, histograms in self.histograms.items()
+                if name in histograms
+            }
+        return sorted(percentiles, key=percentiles.get, reverse=True)[:count]
+
+
+class JsonLinesSink(MetricsSink):
+    """
+    Writes every measurement to a file as a line of JSON, such as
+    {"time": 1700000000.0, "connection": "::1:5000", "name": "rtt", "value": 0.02}
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Opens the file, adding to the end of it if it exists.
+        :param path: The path of the file.
+        """
+        self.file: TextIO = open(path, 'a')
+        self.lock = Lock()
+
+    def record(self, connection: str, name: str, value: float) -> None:
+        line = json.dumps({'time': time.time(), 'connection': connection,
+                           'name': name, 'value': value})
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+
+class RttEstimator:
+    """
+    Smooths round trip time samples the way TCP does (RFC 6298), with an
+    exponentially weighted moving average of the round trip time and of how
+    much it varies (the jitter).
+    """
+
+    # How much weight each new sample gets.
+    RTT_GAIN: float = 1 / 8
+    JITTER_GAIN: float = 1 / 4
+
+    def __init__(self) -> None:
+        """Creates an estimator with no samples."""
+        self.samples: int = 0
+        self.rtt: float = 0
+        self.jitter: float = 0
+
+    def update(self, sample: float) -> None:
+        """
+        Adds a round trip time sample.
+        :param sample: The round trip time, in seconds.
+        """
+        if self.samples == 0:
+            self.rtt = sample
+            self.jitter = sample / 2
+        else:
+            self.jitter += self.JITTER_GAIN * (abs(self.rtt - sample) - self.jitter)
+            self.rtt += self.RTT_GAIN * (sample - self.rtt)
+        self.samples += 1
@@ -28,7 +28,8 @@ NAME_ERRORS = 'ignore'
 #                   I = rows       : unsigned int
 #                   I = columns    : unsigned int
 #                   I = connect_n  : unsigned int
-LOBBY_FORMAT: str = f'!H{LOBBY_NAME_BYTES}s{USERNAME_BYTES}sIII'
+#                   ? = in_progress : bool, whether the game has started
+LOBBY_FORMAT: str = f'!H{LOBBY_NAME_BYTES}s{USERNAME_BYTES}sIII?'
 LOBBY_STRUCT: Struct = Struct(LOBBY_FORMAT)
 
 # How many seconds without receiving an advertisement from a
@@ -63,8 +64,134 @@ JOINING_TIMEOUT: float = 5
 
 """Game settings"""
 
-# The format that game messages (columns) will be sent and received with.
+# Players send each other frames, each of which is a header followed by
+# a payload of the length in the header. The payload formats are below.
 # ! = Network (big) endian
+# H = length : unsigned short, the number of bytes in the payload
+# B = type   : unsigned char, a game_protocol.MessageType
+FRAME_FORMAT: str = '!HB'
+FRAME_STRUCT: Struct = Struct(FRAME_FORMAT)
+
+# The most bytes a payload can be.
+MAX_PAYLOAD_BYTES: int = 0xFFFF
+
+# The versions of the protocol that this version of the game can speak.
+# Players use the highest version they both support.
+# Version 2 added sessions, which let the joining player reconnect,
+# and version 3 added spectators. Since version 3, whoever connects to a
+# lobby sends a frame straight after hello saying why: a PING to play,
+# a SPECTATE to watch, or a RESUME to reconnect.
+MIN_PROTOCOL_VERSION: int = 1
+PROTOCOL_VERSION: int = 3
+SESSION_PROTOCOL_VERSION: int = 2
+SPECTATOR_PROTOCOL_VERSION: int = 3
+
+# The format of the hello payload, which each player sends first.
+#                 ! = Network (big) endian
+#                 B = min_version : unsigned char
+#                 B = max_version : unsigned char
+# {USERNAME_BYTES}s = username    : char[USERNAME_BYTES]
+HELLO_FORMAT: str = f'!BB{USERNAME_BYTES}s'
+HELLO_STRUCT: Struct = Struct(HELLO_FORMAT)
+
+# The format of the move payload.
+# ! = Network (big) endian
+# H = number : unsigned short, which move of the game this is (from 0)
 # I = column : unsigned int
-GAME_FORMAT: str = f'!I'
-GAME_STRUCT: Struct = Struct(GAME_FORMAT)
+MOVE_FORMAT: str = '!HI'
+MOVE_STRUCT: Struct = Struct(MOVE_FORMAT)
+
+# The format of the move acknowledgement payload.
+# ! = Network (big) endian
+# H = number : unsigned short, the number of the move that was received
+ACK_FORMAT: str = '!H'
+ACK_STRUCT: Struct = Struct(ACK_FORMAT)
+
+# The format of the ping payload, which the pong echoes back.
+# ! = Network (big) endian
+# d = sent : double, when the ping was sent, by the clock of its sender
+PING_FORMAT: str = '!d'
+PING_STRUCT: Struct = Struct(PING_FORMAT)
+
+# The format of the state sync payload, which is followed by the column
+# of every move of the game so far, each as a network endian unsigned short.
+# ! = Network (big) endian
+# I = rows      : unsigned int
+# I = columns   : unsigned int
+# I = connect_n : unsigned int
+STATE_FORMAT: str = '!III'
+STATE_STRUCT: Struct = Struct(STATE_FORMAT)
+
+# How many seconds a player has to say hello, and to make each move,
+# before they are considered to have disconnected.
+HANDSHAKE_TIMEOUT: float = 10
+MOVE_TIMEOUT: float = 300
+
+# How many bytes the host's session token is. The joining player sends it
+# back when reconnecting, to prove that they are the same player.
+SESSION_TOKEN_BYTES: int = 16
+
+# How many seconds a dropped game waits for the joining player to reconnect.
+RECONNECT_TIMEOUT: float = 30
+
+# How many bytes can be waiting to be sent to a spectator
+# before they are disconnected for being too slow to keep up.
+SPECTATOR_BUFFER_BYTES: int = 64 * 1024
+
+# TCP keepalive settings, which detect opponents that have disappeared
+# (such as by losing power) while it is your turn, when nothing is sent.
+# How many seconds the connection is idle before it is probed,
+# how many seconds between probes, and how many unanswered probes
+# before the connection is dropped.
+KEEPALIVE_IDLE: int = 30
+KEEPALIVE_INTERVAL: int = 10
+KEEPALIVE_COUNT: int = 3
+
+# Chat messages are encoded with this, rather than NAME_ENCODING,
+# as they don't have a fixed length.
+CHAT_ENCODING = 'utf-8'
+
+
+"""Batched advertising settings"""
+
+# Servers hosting many lobbies advertise them together in batches,
+# each of which is one datagram made of a header followed by records.
+# A lone lobby is still advertised as a bare LOBBY_STRUCT, which listeners
+# tell apart by its size, as no batch is ever LOBBY_STRUCT.size bytes.
+
+# The format of the header of a batch.
+#  ! = Network (big) endian
+# 4s = magic   : ADVERTISEMENT_MAGIC
+#  B = version : unsigned char
+#  B = count   : unsigned char, the number of records in the batch
+ADVERTISEMENT_HEADER_FORMAT: str = '!4sBB'
+ADVERTISEMENT_HEADER_STRUCT: Struct = Struct(ADVERTISEMENT_HEADER_FORMAT)
+ADVERTISEMENT_MAGIC: bytes = b'C4AD'
+# Version 2 added in_progress to LOBBY_STRUCT.
+ADVERTISEMENT_VERSION: int = 2
+
+# The format that every record in a batch starts with.
+# ! = Network (big) endian
+# B = type     : unsigned char, one of the record types below
+# H = port     : unsigned short, the port of the lobby
+# I = sequence : unsigned int, which version of the lobby this is
+ADVERTISEMENT_RECORD_FORMAT: str = '!BHI'
+ADVERTISEMENT_RECORD_STRUCT: Struct = Struct(ADVERTISEMENT_RECORD_FORMAT)
+
+# The types of record.
+# A full record is followed by the lobby, packed with LOBBY_STRUCT.
+# A heartbeat says that the lobby with the sequence number is still open.
+# A closed record says that the lobby has closed.
+FULL_RECORD: int = 1
+HEARTBEAT_RECORD: int = 2
+CLOSED_RECORD: int = 3
+
+# The most bytes a batch can be. This keeps each batch within
+# the smallest packet that IPv6 guarantees, so it isn't fragmented.
+ADVERTISEMENT_MAX_BYTES: int = 1232
+
+# How often (in advertisements) every lobby is sent as a full record,
+# even if it hasn't changed, so that new listeners learn about it.
+# Between those, unchanged lobbies are only sent as heartbeats.
+# This should be well under LOBBY_TIMEOUT / ADVERTISING_WAIT_TIME.
+FULL_ADVERTISEMENT_INTERVAL: int = 3
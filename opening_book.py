@@ -0,0 +1,181 @@
+import argparse
+import mmap
+from struct import Struct
+from typing import List, Optional, Set, Tuple
+
+from computer_player import ComputerPlayer
+from connect_four import ConnectFour
+
+# The format of the start of an opening book file.
+# !   = Network (big) endian
+# 4s  = magic     : char[4]
+# B   = version   : unsigned char
+# H   = rows      : unsigned short
+# H   = columns   : unsigned short
+# H   = connect_n : unsigned short
+# H   = depth     : unsigned short
+# I   = count     : unsigned int
+BOOK_HEADER_STRUCT: Struct = Struct('!4sBHHHHI')
+BOOK_MAGIC: bytes = b'C4BK'
+BOOK_VERSION: int = 1
+
+# The format of each position in an opening book file.
+# The positions are sorted by key, so they can be binary searched.
+# ! = Network (big) endian
+# Q = key    : unsigned long long (the position's canonical key)
+# i = score  : int (from the point of view of the player to move)
+# B = column : unsigned char (the best column in the canonical position)
+BOOK_ENTRY_STRUCT: Struct = Struct('!QiB')
+
+# A book entry, in the orientation of the game it was looked up for.
+BookEntry = Tuple[int, int]
+
+
+class OpeningBook:
+    """
+    Looks up moves in an opening book file.
+
+    The file is memory-mapped rather than read, so opening a book is
+    instant and only the pages touched by lookups are ever loaded.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Opens an opening book.
+
+        :param path: The path of the book file.
+        :raises ValueError: If the file is not an opening book.
+        """
+        self.file = open(path, 'rb')
+        self.map: mmap.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, rows, columns, connect_n, depth, count = \
+            BOOK_HEADER_STRUCT.unpack_from(self.map)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            self.close()
+            raise ValueError(f'{path} is not a version {BOOK_VERSION} opening book.')
+        self.rows: int = rows
+        self.columns: int = columns
+        self.connect_n: int = connect_n
+        self.depth: int = depth
+        self.count: int = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def lookup(self, game: ConnectFour) -> Optional[BookEntry]:
+        """
+        Looks up a game's position in the book.
+
+        :param game: The game to look up.
+        :return: The score of the position and the best column to place in,
+                 or None if the position isn't in the book.
+        """
+        if (game.rows, game.columns, game.connect_n) != \
+                (self.rows, self.columns, self.connect_n):
+            return None
+        if game.move_count > self.depth:
+            return None
+        key = game.canonical_key()
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = BOOK_HEADER_STRUCT.size + middle * BOOK_ENTRY_STRUCT.size
+            entry_key, score, column = BOOK_ENTRY_STRUCT.unpack_from(self.map, offset)
+            if entry_key < key:
+                low = middle + 1
+            elif entry_key > key:
+                high = middle
+            else:
+                # The book stores the column for the canonical position.
+                if game.key != key:
+                    column = game.columns - 1 - column
+                return score, column
+        return None
+
+    def close(self) -> None:
+        """Closes the book file."""
+        self.map.close()
+        self.file.close()
+
+
+def generate_opening_book(path: str,
+                          depth: int,
+                          rows: int = 6,
+                          columns: int = 7,
+                          connect_n: int = 4,
+                          computer: Optional[ComputerPlayer] = None) -> int:
+    """
+    Searches every position up to a number of moves into the game,
+    and writes the results to an opening book file.
+
+    Positions that are mirror images of each other are only searched once.
+
+    :param path: The path to write the book file to.
+    :param depth: How many moves into the game to include positions for.
+    :param rows: The number of rows.
+    :param columns: The number of columns.
+    :param connect_n: How many tiles in a row to win.
+    :param computer: The computer player used to search each position.
+    :return: The number of positions in the book.
+    :raises ValueError: If the position keys for the board size
+                        don't fit in the book's 64-bit keys.
+    """
+    if (rows + 1) * columns > 64:
+        raise ValueError(f'Opening books do not support {rows}x{columns} boards.')
+    if computer is None:
+        computer = ComputerPlayer(time_limit=0.5)
+    game = ConnectFour(rows, columns, connect_n)
+    entries: List[Tuple[int, int, int]] = []
+    seen: Set[int] = set()
+
+    def visit() -> None:
+        key = game.canonical_key()
+        if key in seen or game.is_over():
+            return
+        seen.add(key)
+        column = computer.choose_column(game)
+        if game.key != key:
+            column = columns - 1 - column
+        entries.append((key, computer.score, column))
+        if game.move_count == depth:
+            return
+        for next_column in range(columns):
+            if game.can_place(next_column):
+                game.place_tile(next_column)
+                visit()
+                game.unplace()
+
+    visit()
+    entries.sort()
+    with open(path, 'wb') as file:
+        file.write(BOOK_HEADER_STRUCT.pack(
+            BOOK_MAGIC, BOOK_VERSION, rows, columns, connect_n, depth, len(entries)
+        ))
+        for entry in entries:
+            file.write(BOOK_ENTRY_STRUCT.pack(*entry))
+    return len(entries)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Generates an opening book.')
+    parser.add_argument('path', help='where to write the book')
+    parser.add_argument('--depth', type=int, default=4,
+                        help='how many moves into the game to include')
+    parser.add_argument('--rows', type=int, default=6)
+    parser.add_argument('--columns', type=int, default=7)
+    parser.add_argument('--connect-n', type=int, default=4)
+    parser.add_argument('--time-limit', type=float, default=0.5,
+                        help='how many seconds to search each position for')
+    parser.add_argument('--max-depth', type=int, default=None,
+                        help='how many moves deep to search each position')
+    args = parser.parse_args()
+    computer = ComputerPlayer(time_limit=args.time_limit, max_depth=args.max_depth)
+    count = generate_opening_book(
+        args.path, args.depth, args.rows, args.columns, args.connect_n, computer
+    )
+    print(f'Wrote {count} positions to {args.path}.')
+
+
+if __name__ == '__main__':
+    main()
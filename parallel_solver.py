@@ -0,0 +1,220 @@
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Set, Tuple
+
+from computer_player import SearchStatistics, center_first
+from connect_four import ConnectFour
+from solver import Solver, SolverTable
+
+# A position sent to a worker: its board size (rows, columns, connect_n)
+# and the columns played to reach it.
+Position = Tuple[int, int, int, List[int]]
+
+# The solver of each worker process, which uses the shared table.
+worker_solver: Optional[Solver] = None
+
+
+class SharedSolverTable(SolverTable):
+    """
+    A SolverTable kept in shared memory, so that solvers in different
+    processes share their results.
+
+    Entries are read and written without locks. Each entry is a single
+    aligned 64-bit word holding both the key and the value, so a process
+    never sees one process's key with another's value; at worst a write
+    is lost, which only costs a search that is done again.
+
+    Only the process that created the table clears it,
+    so that workers can't clear each other's results.
+    """
+
+    def __init__(self, buckets: int = 1 << 21, name: Optional[str] = None) -> None:
+        """
+        Creates a table in shared memory, or attaches to an existing one.
+        :param buckets: How many buckets of two entries the table has.
+        :param name: The name of the shared memory to attach to,
+                     or None to create a new table.
+        """
+        self.buckets: int = buckets
+        self.owner: bool = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=16 * buckets)
+        else:
+            # Worker processes share their creator's resource tracker,
+            # so the memory is still only unlinked by its creator.
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.entries: memoryview = self.memory.buf.cast('Q')
+        if self.owner:
+            self.clear()
+
+    def clear(self) -> None:
+        if self.owner:
+            self.memory.buf[:] = bytes(self.memory.size)
+
+    def close(self) -> None:
+        """Detaches from the shared memory, freeing it if this process created it."""
+        self.entries.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def attach_table(name: str, buckets: int) -> None:
+    """
+    Creates the solver of a worker process, using the shared table.
+    This runs in the worker processes when they start.
+    :param name: The name of the shared table's memory.
+    :param buckets: How many buckets the shared table has.
+    """
+    global worker_solver
+    worker_solver = Solver(SharedSolverTable(buckets, name))
+
+
+def solve_position(position: Position, weak: bool) -> Tuple[int, int, float]:
+    """
+    Solves a position. This runs in the worker processes.
+    :param position: The position.
+    :param weak: Whether to only find who wins, rather than how quickly.
+    :return: The score, and how many nodes and seconds it took.
+    """
+    rows, columns, connect_n, moves = position
+    game = ConnectFour(rows, columns, connect_n)
+    for column in moves:
+        game.place_tile(column)
+    score = worker_solver.solve(game, weak)
+    return score, worker_solver.statistics.nodes, worker_solver.statistics.seconds
+
+
+class ParallelSolver:
+    """
+    Solves positions across a pool of processes by splitting the root:
+    each move of the player to move is solved by a different process,
+    and the best of them is the score of the position.
+
+    The processes share a SharedSolverTable, so positions reached by more
+    than one move are usually only searched once.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, buckets: int = 1 << 21) -> None:
+        """
+        Creates the shared table and starts the processes.
+        :param max_workers: The number of processes, or None for one per core.
+        :param buckets: How many buckets of two entries the shared table has.
+        """
+        self.table = SharedSolverTable(buckets)
+        self.executor = ProcessPoolExecutor(
+            max_workers, initializer=attach_table, initargs=(self.table.memory.name, buckets)
+        )
+        # Prepares the table for each board size, which workers can't do.
+        self.solver = Solver(self.table)
+        self.statistics: SearchStatistics = SearchStatistics()
+
+    def analyze(self, game: ConnectFour, weak: bool = False) -> List[Optional[int]]:
+        """
+        Scores every move of the player to move, solving them in parallel.
+        :param game: The game, which must not be over. It isn't changed.
+        :param weak: Whether to only find who wins (1, 0 or -1),
+                     rather than how quickly.
+        :return: The score of placing in each column, from the point of view
+                 of the player to move, or None for full columns.
+        """
+        self.solver.prepare(game)
+        self.statistics = SearchStatistics()
+        start = time.perf_counter()
+        cells = game.rows * game.columns
+        scores: List[Optional[int]] = [None] * game.columns
+        pending: Dict[Future, int] = {}
+        # The center moves usually take the longest, so they are started first.
+        for column in center_first(game.columns):
+            if not game.can_place(column):
+                continue
+            game.place_tile(column)
+            if game.winning_player is not None:
+                scores[column] = 1 if weak else (cells + 2 - game.move_count) // 2
+            elif game.is_over():
+                scores[column] = 0
+            else:
+                position = (game.rows, game.columns, game.connect_n, list(game.moves))
+                pending[self.executor.submit(solve_position, position, weak)] = column
+            game.unplace()
+        waiting: Set[Future] = set(pending)
+        while waiting:
+            done, waiting = wait(waiting, return_when=FIRST_COMPLETED)
+            for future in done:
+                score, nodes, _ = future.result()
+                scores[pending[future]] = -score
+                self.statistics.nodes += nodes
+        self.statistics.depth = cells - game.move_count
+        self.statistics.seconds = time.perf_counter() - start
+        return scores
+
+    def solve(self, game: ConnectFour, weak: bool = False) -> int:
+        """
+        Finds the score of a game's position for the player to move.
+        :param game: The game, which must not be over. It isn't changed.
+        :param weak: Whether to only find who wins, rather than how quickly.
+        :return: The score.
+        """
+        return max(score for score in self.analyze(game, weak) if score is not None)
+
+    def close(self) -> None:
+        """Stops the processes and frees the shared table."""
+        self.executor.shutdown()
+        self.table.close()
+
+
+def measure_speedup(game: ConnectFour,
+                    worker_counts: List[int],
+                    weak: bool = False,
+                    buckets: int = 1 << 21) -> List[Tuple[int, float, int]]:
+    """
+    Times solving a position with different numbers of processes.
+    :param game: The game, which must not be over.
+    :param worker_counts: The numbers of processes to try.
+    :param weak: Whether to only find who wins, rather than how quickly.
+    :param buckets: How many buckets of two entries the shared table has.
+    :return: The number of processes, seconds and nodes of each solve.
+    """
+    timings = []
+    for workers in worker_counts:
+        solver = ParallelSolver(workers, buckets)
+        try:
+            solver.solve(game, weak)
+        finally:
+            solver.close()
+        timings.append((workers, solver.statistics.seconds, solver.statistics.nodes))
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Measures how much faster a position is solved with more processes.')
+    parser.add_argument('moves', nargs='?', default='1114176155432314575644',
+                        help='the 1-indexed columns placed in to reach the position')
+    parser.add_argument('--rows', type=int, default=6)
+    parser.add_argument('--columns', type=int, default=7)
+    parser.add_argument('--connect-n', type=int, default=4)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='the numbers of processes to try')
+    parser.add_argument('--weak', action='store_true',
+                        help='only find who wins, not how quickly')
+    args = parser.parse_args()
+    game = ConnectFour(args.rows, args.columns, args.connect_n)
+    for move in args.moves:
+        if not game.place(int(move) - 1) or game.is_over():
+            parser.error(f'{args.moves} is not a position in progress.')
+    solver = Solver()
+    score = solver.solve(game, args.weak)
+    base = solver.statistics.seconds
+    print(f'{os.cpu_count()} cores. Score {score}.')
+    print(f'single process solver: {base:.3f}s, {solver.statistics.nodes} nodes')
+    for workers, seconds, nodes in measure_speedup(game, args.workers, args.weak):
+        print(f'{workers} workers: {seconds:.3f}s, {nodes} nodes, '
+              f'{base / seconds:.2f}x speedup')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+import argparse
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from connect_four import ConnectFour
+from game_record import (RECORD_FILE_STRUCT, GameRecordReader, Outcome,
+                         read_record)
+
+# Part of a record file to index: its path, where its first record starts,
+# and how many records it has (None for the rest of the file).
+Chunk = Tuple[str, int, Optional[int]]
+# A position, as its board size and the bytes of its canonical key.
+PositionKey = Tuple[int, int, int, bytes]
+# How many games through a position player one won, drew and player two won.
+PositionCounts = Dict[PositionKey, List[int]]
+
+# Where each outcome is counted in PositionCounts.
+OUTCOME_COLUMNS: Dict[Outcome, int] = {
+    Outcome.PLAYER_ONE: 0,
+    Outcome.DRAW: 1,
+    Outcome.PLAYER_TWO: 2,
+}
+
+CREATE_TABLE: str = '''
+    CREATE TABLE IF NOT EXISTS positions (
+        rows INTEGER NOT NULL,
+        columns INTEGER NOT NULL,
+        connect_n INTEGER NOT NULL,
+        position BLOB NOT NULL,
+        player_one_wins INTEGER NOT NULL,
+        draws INTEGER NOT NULL,
+        player_two_wins INTEGER NOT NULL,
+        PRIMARY KEY (rows, columns, connect_n, position)
+    ) WITHOUT ROWID
+'''
+
+ADD_COUNTS: str = '''
+    INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT DO UPDATE SET
+        player_one_wins = player_one_wins + excluded.player_one_wins,
+        draws = draws + excluded.draws,
+        player_two_wins = player_two_wins + excluded.player_two_wins
+'''
+
+LOOKUP: str = '''
+    SELECT player_one_wins, draws, player_two_wins FROM positions
+    WHERE rows = ? AND columns = ? AND connect_n = ? AND position = ?
+'''
+
+
+def key_bytes(key: int, rows: int, columns: int) -> bytes:
+    """
+    Converts a position key to bytes, the same length for every position
+    of a board size, so that keys can be compared as bytes.
+    :param key: The key.
+    :param rows: The number of rows.
+    :param columns: The number of columns.
+    :return: The key, as big endian bytes.
+    """
+    return key.to_bytes(((rows + 1) * columns + 7) // 8, 'big')
+
+
+class PositionStats:
+    """How the recorded games that reached a position ended."""
+
+    def __init__(self, player_one_wins: int, draws: int, player_two_wins: int) -> None:
+        """
+        Creates the stats of a position.
+
+        :param player_one_wins: How many games player one won.
+        :param draws: How many games were drawn.
+        :param player_two_wins: How many games player two won.
+        """
+        self.player_one_wins: int = player_one_wins
+        self.draws: int = draws
+        self.player_two_wins: int = player_two_wins
+
+    def games(self) -> int:
+        """
+        Gets how many recorded games reached the position.
+        :return: The number of games.
+        """
+        return self.player_one_wins + self.draws + self.player_two_wins
+
+    def player_one_rate(self) -> float:
+        """
+        Gets how often player one won from the position.
+        :return: The fraction of games that player one won.
+        """
+        return self.player_one_wins / self.games()
+
+    def __str__(self) -> str:
+        return (f'{self.games()} games: {self.player_one_wins} player one wins, '
+                f'{self.draws} draws, {self.player_two_wins} player two wins')
+
+
+def count_positions(path: str, offset: int, count: Optional[int]) -> PositionCounts:
+    """
+    Replays a chunk of a record file, counting how the games through each
+    position ended. This runs in the worker processes.
+
+    Mirror images count as the same position. Unfinished games,
+    and games with moves that can't be placed, are skipped.
+
+    :param path: The path of the record file.
+    :param offset: Where the first record of the chunk starts.
+    :param count: How many records are in the chunk, or None for the rest of the file.
+    :return: The counts of every position in the chunk.
+    """
+    counts: PositionCounts = {}
+    games: Dict[Tuple[int, int, int], ConnectFour] = {}
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        read = 0
+        while count is None or read < count:
+            record = read_record(file)
+            if record is None:
+                break
+            read += 1
+            outcome = OUTCOME_COLUMNS.get(record.outcome)
+            if outcome is None:
+                continue
+            size = (record.rows, record.columns, record.connect_n)
+            game = games.get(size)
+            if game is None:
+                game = games[size] = ConnectFour(*size)
+            game.reset()
+            keys = [game.canonical_key()]
+            for column in record.moves():
+                if column >= game.columns or not game.can_place(column):
+                    break
+                game.place_tile(column)
+                keys.append(game.canonical_key())
+            else:
+                for key in keys:
+                    position = (*size, key_bytes(key, record.rows, record.columns))
+                    position_counts = counts.get(position)
+                    if position_counts is None:
+                        position_counts = counts[position] = [0, 0, 0]
+                    position_counts[outcome] += 1
+    return counts
+
+
+def split_records(paths: Iterable[str], chunk_size: int) -> List[Chunk]:
+    """
+    Splits record files into chunks that can be indexed in parallel.
+    Files without an index footer are one chunk.
+    :param paths: The paths of the record files.
+    :param chunk_size: The most records in each chunk.
+    :return: The chunks.
+    """
+    chunks: List[Chunk] = []
+    for path in paths:
+        try:
+            reader = GameRecordReader(path)
+        except ValueError:
+            chunks.append((path, RECORD_FILE_STRUCT.size, None))
+            continue
+        offsets = reader.offsets
+        reader.close()
+        for start in range(0, len(offsets), chunk_size):
+            chunks.append((path, offsets[start], min(chunk_size, len(offsets) - start)))
+    return chunks
+
+
+class PositionIndex:
+    """
+    An SQLite database of how the recorded games through each position ended,
+    so that any position can be looked up in well under a second,
+    however many games were recorded.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Opens an index, creating it if it doesn't exist.
+        :param path: The path of the database file.
+        """
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute(CREATE_TABLE)
+
+    def add_records(self,
+                    paths: Iterable[str],
+                    max_workers: Optional[int] = None,
+                    chunk_size: int = 10000) -> int:
+        """
+        Adds the games in record files to the index.
+        Indexing the same games twice counts them twice.
+
+        The files are split into chunks, which are replayed across a pool
+        of processes, and their counts are added to the database as each
+        chunk finishes.
+
+        :param paths: The paths of the record files.
+        :param max_workers: The number of processes, or None for one per core.
+        :param chunk_size: How many records each process replays at a time.
+        :return: How many positions were added to or updated in the index.
+        """
+        updated = 0
+        with ProcessPoolExecutor(max_workers) as executor:
+            pending: Set[Future] = {executor.submit(count_positions, *chunk)
+                                    for chunk in split_records(paths, chunk_size)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    updated += self.add_counts(future.result())
+        return updated
+
+    def add_counts(self, counts: PositionCounts) -> int:
+        """
+        Adds counts to the index.
+        :param counts: The counts.
+        :return: How many positions were added to or updated in the index.
+        """
+        with self.connection:
+            self.connection.executemany(ADD_COUNTS, (
+                (*position, *position_counts)
+                for position, position_counts in counts.items()
+            ))
+        return len(counts)
+
+    def lookup(self, game: ConnectFour) -> Optional[PositionStats]:
+        """
+        Looks up the position of a game. Its mirror image is the same position.
+        :param game: The game.
+        :return: How the recorded games through the position ended,
+                 or None if no recorded game reached it.
+        """
+        row = self.connection.execute(LOOKUP, (
+            game.rows, game.columns, game.connect_n,
+            key_bytes(game.canonical_key(), game.rows, game.columns)
+        )).fetchone()
+        if row is None:
+            return None
+        return PositionStats(*row)
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+
+    def close(self) -> None:
+        """Closes the database."""
+        self.connection.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Indexes game records by position, and looks positions up.')
+    parser.add_argument('database', help='the index database file')
+    parser.add_argument('--add', nargs='+', default=[], metavar='RECORDS',
+                        help='record files to add to the index')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='how many processes to index with')
+    parser.add_argument('--moves', default=None,
+                        help='the 1-indexed columns placed in to reach the '
+                             'position to look up, such as 4435')
+    parser.add_argument('--rows', type=int, default=6)
+    parser.add_argument('--columns', type=int, default=7)
+    parser.add_argument('--connect-n', type=int, default=4)
+    args = parser.parse_args()
+    index = PositionIndex(args.database)
+    try:
+        if args.add:
+            start = time.perf_counter()
+            updated = index.add_records(args.add, args.workers)
+            print(f'Indexed {updated} positions in {time.perf_counter() - start:.1f}s.')
+        if args.moves is not None:
+            game = ConnectFour(args.rows, args.columns, args.connect_n)
+            for move in args.moves:
+                game.place(int(move) - 1)
+            start = time.perf_counter()
+            stats = index.lookup(game)
+            elapsed = time.perf_counter() - start
+            print(stats if stats is not None else 'No recorded games reached that position.')
+            print(f'Looked up in {elapsed * 1000:.2f}ms.')
+    finally:
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,438 @@
+import argparse
+import time
+from array import array
+from operator import itemgetter
+from typing import Callable, List, Optional
+
+from computer_player import SearchStatistics, center_first
+from connect_four import ConnectFour
+
+# Scores are from the point of view of the player to move, as in
+# Pascal Pons' solver: a win scores 1 for winning with your last possible
+# tile, 2 for winning with your second to last, and so on. A loss is the
+# negative of your opponent's win, and a draw scores 0.
+
+# Finds the empty cells that would complete a connection for a player,
+# given their tiles and every tile.
+WinningCells = Callable[[int, int], int]
+
+# How entries are packed into the transposition table's unsigned 64-bit
+# integers. The key's slot is its remainder when divided by the number of
+# slots, so only the quotient needs storing to tell keys apart.
+# bits 0-7   = value     (a bound on the score, 0 for an empty entry)
+# bits 8-13  = remaining (how many cells were empty, to prefer bigger searches)
+# bits 14-63 = quotient  (the key divided by the number of slots)
+VALUE_BITS: int = 8
+REMAINING_BITS: int = 6
+QUOTIENT_SHIFT: int = VALUE_BITS + REMAINING_BITS
+VALUE_MASK: int = (1 << VALUE_BITS) - 1
+REMAINING_MASK: int = (1 << REMAINING_BITS) - 1
+MAX_QUOTIENT_BITS: int = 64 - QUOTIENT_SHIFT
+
+
+class SolverTable:
+    """
+    A fixed size transposition table for the solver, stored in an array
+    of unsigned 64-bit integers so that millions of entries cost 8 bytes each.
+
+    Each key hashes to a bucket of two entries. The first keeps whichever
+    position had the most empty cells, as it took the most work to search,
+    and the second always takes the newest entry that didn't replace the first.
+    """
+
+    def __init__(self, buckets: int = 1 << 21) -> None:
+        """
+        Creates an empty table.
+        :param buckets: How many buckets of two entries the table has.
+                        An odd number spreads keys out the best.
+        """
+        self.buckets: int = buckets
+        self.entries: array = array('Q', bytes(16 * buckets))
+
+    def clear(self) -> None:
+        """Removes every entry from the table."""
+        self.entries = array('Q', bytes(16 * self.buckets))
+
+    def get(self, key: int) -> int:
+        """
+        Gets the value stored for a key.
+        :param key: The key.
+        :return: The value, or 0 if the key isn't in the table.
+        """
+        quotient, bucket = divmod(key, self.buckets)
+        entries = self.entries
+        entry = entries[2 * bucket]
+        if entry >> QUOTIENT_SHIFT == quotient and entry:
+            return entry & VALUE_MASK
+        entry = entries[2 * bucket + 1]
+        if entry >> QUOTIENT_SHIFT == quotient and entry:
+            return entry & VALUE_MASK
+        return 0
+
+    def put(self, key: int, remaining: int, value: int) -> None:
+        """
+        Stores a value for a key.
+        :param key: The key.
+        :param remaining: How many cells were empty in the key's position.
+        :param value: The value, which must be from 1 to 255.
+        """
+        quotient, bucket = divmod(key, self.buckets)
+        entries = self.entries
+        index = 2 * bucket
+        entry = entries[index]
+        if entry and entry >> QUOTIENT_SHIFT != quotient \
+                and (entry >> VALUE_BITS) & REMAINING_MASK > remaining:
+            index += 1
+        entries[index] = quotient << QUOTIENT_SHIFT | remaining << VALUE_BITS | value
+
+
+class Solver:
+    """
+    Finds the score of a position with perfect play from both players,
+    using the method of Pascal Pons' Connect 4 solver.
+
+    The search is a negamax on bitboards with alpha-beta pruning that
+    only ever searches with a null window (is the score above x?),
+    narrowing the score down like a binary search. Moves that lose
+    straight away are never searched, the other moves are searched in the
+    order of how many winning cells they make, and every result is stored
+    in a SolverTable as a bound on the score. A position and its mirror
+    image share their table entry.
+
+    Pure Python searches a few hundred thousand positions per second,
+    which solves small boards and the last 20 or so moves of a standard
+    game quickly, but not a standard game from its start.
+    """
+
+    def __init__(self, table: Optional[SolverTable] = None) -> None:
+        """
+        Creates a solver.
+        :param table: The transposition table, or None for one with the default size.
+        """
+        self.table: SolverTable = table if table is not None else SolverTable()
+        self.statistics: SearchStatistics = SearchStatistics()
+        # The board size the table's entries are for.
+        self.size: Optional[tuple] = None
+
+    def __call__(self, game: ConnectFour) -> int:
+        return self.choose_column(game)
+
+    def prepare(self, game: ConnectFour) -> None:
+        """
+        Sets up the constants of a game's board size.
+        The table is cleared if the size has changed.
+        :param game: The game.
+        :raises ValueError: If the board is too large to solve.
+        """
+        size = (game.rows, game.columns, game.connect_n)
+        if size == self.size:
+            return
+        rows, columns, connect_n = size
+        cells = rows * columns
+        key_bits = (rows + 1) * columns
+        min_score = -(cells // 2)
+        max_score = (cells + 1) // 2
+        if cells > REMAINING_MASK or 2 * (max_score - min_score) + 3 > VALUE_MASK \
+                or key_bits - (self.table.buckets.bit_length() - 1) > MAX_QUOTIENT_BITS:
+            raise ValueError(f'{rows}x{columns} boards are too large to solve.')
+        self.table.clear()
+        self.size = size
+        self.rows: int = rows
+        self.columns: int = columns
+        self.cells: int = cells
+        self.min_score: int = min_score
+        self.max_score: int = max_score
+        self.bottom_mask: int = game.bottom_mask
+        self.board_mask: int = game.board_mask
+        self.order: List[int] = center_first(columns)
+        self.column_masks: List[int] = [
+            ((1 << rows) - 1) << (column * game.column_bits) for column in range(columns)
+        ]
+        # How far to shift a tile to move it to the mirrored column.
+        self.mirror_shifts: List[int] = [
+            (columns - 1 - 2 * column) * game.column_bits for column in range(columns)
+        ]
+        self.winning_cells: WinningCells = winning_cells_function(game)
+
+    def solve(self, game: ConnectFour, weak: bool = False) -> int:
+        """
+        Finds the score of a game's position for the player to move.
+        The game is left as it was found.
+
+        :param game: The game, which must not be over.
+        :param weak: Whether to only find who wins (1, 0 or -1),
+                     rather than how quickly, which is faster.
+        :return: The score.
+        """
+        self.prepare(game)
+        self.statistics = SearchStatistics()
+        start = time.perf_counter()
+        current = game.bitboards[game.turn.value]
+        mask = game.bitboards[0] | game.bitboards[1]
+        moves = game.move_count
+        mirror_current = self.mirror(current)
+        mirror_mask = self.mirror(mask)
+        cells = self.cells
+        if self.winning_cells(current, mask) & ((mask + self.bottom_mask) & self.board_mask):
+            self.statistics.seconds = time.perf_counter() - start
+            return 1 if weak else (cells + 1 - moves) // 2
+        low = -((cells - moves) // 2)
+        high = (cells + 1 - moves) // 2
+        if weak:
+            low = max(low, -1)
+            high = min(high, 1)
+        # Narrow the score down with null window searches, trying scores
+        # near 0 first, as they are quicker to prove or disprove.
+        while low < high:
+            middle = low + (high - low) // 2
+            if middle <= 0 and low // 2 < middle:
+                middle = low // 2
+            elif middle >= 0 and high // 2 > middle:
+                middle = high // 2
+            score = self.negamax(current, mask, mirror_current, mirror_mask,
+                                 moves, middle, middle + 1)
+            if score <= middle:
+                high = score
+            else:
+                low = score
+        self.statistics.depth = cells - moves
+        self.statistics.seconds = time.perf_counter() - start
+        if weak:
+            # The search may have proven more than was asked for.
+            return (low > 0) - (low < 0)
+        return low
+
+    def mirror(self, bitboard: int) -> int:
+        """
+        Mirrors a bitboard left to right.
+        :param bitboard: The bitboard.
+        :return: The mirrored bitboard.
+        """
+        mirrored = 0
+        for column, shift in enumerate(self.mirror_shifts):
+            tiles = bitboard & self.column_masks[column]
+            mirrored |= tiles << shift if shift >= 0 else tiles >> -shift
+        return mirrored
+
+    def negamax(self,
+                current: int,
+                mask: int,
+                mirror_current: int,
+                mirror_mask: int,
+                moves: int,
+                alpha: int,
+                beta: int) -> int:
+        """
+        Scores a position from the point of view of the player to move,
+        who must not be able to win with their next move.
+
+        :param current: The bitboard of the tiles of the player to move.
+        :param mask: The bitboard of every tile.
+        :param mirror_current: current, mirrored left to right.
+        :param mirror_mask: mask, mirrored left to right.
+        :param moves: How many tiles have been placed.
+        :param alpha: The score the player to move is already guaranteed.
+        :param beta: The score their opponent is already guaranteed.
+        :return: The score if it is between alpha and beta,
+                 otherwise a bound on the score that is outside them.
+        """
+        statistics = self.statistics
+        statistics.nodes += 1
+        cells = self.cells
+        winning_cells = self.winning_cells
+        board_mask = self.board_mask
+        possible = (mask + self.bottom_mask) & board_mask
+        opponent_wins = winning_cells(current ^ mask, mask)
+        forced = possible & opponent_wins
+        if forced:
+            # Two threats can't both be blocked.
+            if forced & (forced - 1):
+                return -((cells - moves) // 2)
+            possible = forced
+        # Don't play under a cell that would win for the opponent.
+        possible &= ~(opponent_wins >> 1)
+        if not possible:
+            return -((cells - moves) // 2)
+        if moves >= cells - 2:
+            return 0
+        # The opponent can't win with their next move, so the score is at least this.
+        low = -((cells - 2 - moves) // 2)
+        if alpha < low:
+            alpha = low
+            if alpha >= beta:
+                return alpha
+        # The player to move can't win with this move, so the score is at most this.
+        high = (cells - 1 - moves) // 2
+        key = current + mask
+        mirror_key = mirror_current + mirror_mask
+        if mirror_key < key:
+            key = mirror_key
+        table = self.table
+        statistics.table_probes += 1
+        value = table.get(key)
+        min_score = self.min_score
+        max_score = self.max_score
+        if value:
+            statistics.table_hits += 1
+            if value > max_score - min_score + 1:
+                low = value + 2 * min_score - max_score - 2
+                if alpha < low:
+                    alpha = low
+                    if alpha >= beta:
+                        return alpha
+            else:
+                high = value + min_score - 1
+        if beta > high:
+            beta = high
+            if alpha >= beta:
+                return beta
+        # Try the moves that make the most winning cells first.
+        candidates = []
+        column_masks = self.column_masks
+        mirror_shifts = self.mirror_shifts
+        for column in self.order:
+            move = possible & column_masks[column]
+            if move:
+                threats = winning_cells(current | move, mask)
+                candidates.append((bin(threats).count('1'), column, move))
+        candidates.sort(key=itemgetter(0), reverse=True)
+        remaining = cells - moves
+        for _, column, move in candidates:
+            shift = mirror_shifts[column]
+            mirror_move = move << shift if shift >= 0 else move >> -shift
+            score = -self.negamax(current ^ mask, mask | move,
+                                  mirror_current ^ mirror_mask, mirror_mask | mirror_move,
+                                  moves + 1, -beta, -alpha)
+            if score >= beta:
+                table.put(key, remaining, score + max_score - 2 * min_score + 2)
+                return score
+            if score > alpha:
+                alpha = score
+        table.put(key, remaining, alpha - min_score + 1)
+        return alpha
+
+    def analyze(self, game: ConnectFour, weak: bool = False) -> List[Optional[int]]:
+        """
+        Scores every move of the player to move. The game is left as it was found.
+        :param game: The game, which must not be over.
+        :param weak: Whether to only find who wins (1, 0 or -1),
+                     rather than how quickly.
+        :return: The score of placing in each column, from the point of view
+                 of the player to move, or None for full columns.
+        """
+        scores: List[Optional[int]] = [None] * game.columns
+        cells = game.rows * game.columns
+        nodes = 0
+        seconds = 0.0
+        for column in range(game.columns):
+            if not game.can_place(column):
+                continue
+            game.place_tile(column)
+            if game.winning_player is not None:
+                scores[column] = 1 if weak else (cells + 2 - game.move_count) // 2
+            elif game.is_over():
+                scores[column] = 0
+            else:
+                scores[column] = -self.solve(game, weak)
+                nodes += self.statistics.nodes
+                seconds += self.statistics.seconds
+            game.unplace()
+        self.statistics.nodes = nodes
+        self.statistics.seconds = seconds
+        return scores
+
+    def choose_column(self, game: ConnectFour) -> int:
+        """
+        Chooses a column with the best score, preferring the center.
+        This can be used as a tournament policy.
+        :param game: The game, which must not be over.
+        :return: The column.
+        """
+        scores = self.analyze(game)
+        order = center_first(game.columns)
+        return max((column for column in order if scores[column] is not None),
+                   key=lambda column: scores[column])
+
+
+def winning_cells_function(game: ConnectFour) -> WinningCells:
+    """
+    Creates a function that finds the empty cells that would complete
+    a connection for a player, for a game's board size.
+
+    Connect 4 has its own unrolled version, as the solver calls it for
+    every move it searches.
+
+    :param game: The game.
+    :return: The function.
+    """
+    board_mask = game.board_mask
+    column_bits = game.column_bits
+    if game.connect_n != 4:
+        def winning_cells(position: int, mask: int) -> int:
+            return game.winning_cells(position) & (board_mask ^ mask)
+        return winning_cells
+    shifts = (column_bits, column_bits - 1, column_bits + 1)
+
+    def winning_cells(position: int, mask: int) -> int:
+        # Vertical connections can only be completed on top.
+        cells = (position << 1) & (position << 2) & (position << 3)
+        for shift in shifts:
+            pair = (position << shift) & (position << 2 * shift)
+            cells |= pair & (position << 3 * shift)
+            cells |= pair & (position >> shift)
+            pair = (position >> shift) & (position >> 2 * shift)
+            cells |= pair & (position << shift)
+            cells |= pair & (position >> 3 * shift)
+        return cells & (board_mask ^ mask)
+    return winning_cells
+
+
+def moves_to_end(score: int, move_count: int, cells: int) -> int:
+    """
+    Gets how many more moves a game lasts with perfect play.
+    :param score: The score of the position, from solve().
+    :param move_count: How many moves have been made.
+    :param cells: How many cells the grid has.
+    :return: The number of moves, including the winning move.
+    """
+    if score == 0:
+        return cells - move_count
+    # The winning move is made after one of two numbers of moves with the
+    # same score, and only one of them is on the winner's turn.
+    winner_turn = move_count if score > 0 else move_count + 1
+    moves_before_win = cells - 2 * abs(score)
+    if (moves_before_win - winner_turn) % 2:
+        moves_before_win += 1
+    return moves_before_win - move_count + 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Solves a position with perfect play.')
+    parser.add_argument('moves', nargs='?', default='',
+                        help='the 1-indexed columns placed in to reach the '
+                             'position, such as 4435')
+    parser.add_argument('--rows', type=int, default=6)
+    parser.add_argument('--columns', type=int, default=7)
+    parser.add_argument('--connect-n', type=int, default=4)
+    parser.add_argument('--weak', action='store_true',
+                        help='only find who wins, not how quickly')
+    parser.add_argument('--buckets', type=int, default=1 << 21,
+                        help='how many buckets of two entries the table has')
+    args = parser.parse_args()
+    game = ConnectFour(args.rows, args.columns, args.connect_n)
+    for move in args.moves:
+        if not game.place(int(move) - 1) or game.is_over():
+            parser.error(f'{args.moves} is not a position in progress.')
+    solver = Solver(SolverTable(args.buckets))
+    score = solver.solve(game, args.weak)
+    if args.weak:
+        print(['Loss', 'Draw', 'Win'][score + 1], 'for the player to move.')
+    else:
+        outcome = 'Win' if score > 0 else 'Loss' if score < 0 else 'Draw'
+        print(f'Score {score}: {outcome} for the player to move, after '
+              f'{moves_to_end(score, game.move_count, game.rows * game.columns)} more moves.')
+    print(solver.statistics)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+import selectors
+import socket
+from collections import deque
+from threading import Lock, Thread
+from typing import Deque, Dict, Optional
+
+from connect_four import ConnectFour
+from game_protocol import (FrameReader, MessageType, ProtocolError,
+                           decode_hello, decode_payload, decode_state,
+                           enable_keepalive, encode_frame, encode_hello,
+                           encode_state, negotiate_version)
+from network_settings import (HANDSHAKE_TIMEOUT, MOVE_STRUCT,
+                              SPECTATOR_BUFFER_BYTES, SPECTATOR_PROTOCOL_VERSION)
+
+
+class Spectator:
+    """A helper class for SpectatorHub."""
+
+    __slots__ = ('spectator_socket', 'pending', 'buffered')
+
+    def __init__(self, spectator_socket: socket.socket) -> None:
+        """
+        Creates a spectator with nothing waiting to be sent.
+        :param spectator_socket: The non-blocking socket connected to the spectator.
+        """
+        self.spectator_socket: socket.socket = spectator_socket
+        # The frames waiting to be sent, which are shared between spectators,
+        # and how many bytes they add up to.
+        self.pending: Deque[memoryview] = deque()
+        self.buffered: int = 0
+
+
+class SpectatorHub:
+    """
+    Streams a game to any number of spectators.
+
+    Each move is encoded once, and the same bytes are queued for every
+    spectator, then sent from a background thread so that the players never
+    wait on spectators. Spectators who fall more than max_buffered_bytes behind
+    are disconnected, rather than the hub buffering for them forever.
+    Spectators who arrive mid-game are sent the game so far first.
+    """
+
+    def __init__(self,
+                 game: Optional[ConnectFour] = None,
+                 max_buffered_bytes: int = SPECTATOR_BUFFER_BYTES) -> None:
+        """
+        Creates a hub with no spectators, and starts its thread.
+        :param game: The game being streamed, or None for a new game
+                     with the default size.
+        :param max_buffered_bytes: How many bytes can be waiting to be sent
+                                   to a spectator before they are disconnected.
+        """
+        self.max_buffered_bytes: int = max_buffered_bytes
+        self.spectators: Dict[socket.socket, Spectator] = {}
+        # The game so far, as a STATE_SYNC frame for spectators who arrive late.
+        self.snapshot: bytes = self.encode_snapshot(game if game is not None else ConnectFour())
+        self.dropped: int = 0
+        # Held while the spectators are changed, as the players' thread
+        # queues moves while the hub's thread sends them.
+        self.lock = Lock()
+        self.selector = selectors.DefaultSelector()
+        self.stopped: bool = False
+        # Writing to wakeup_sender wakes up the thread, to send new moves or stop.
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+        self.wakeup_receiver.setblocking(False)
+        self.wakeup_sender.setblocking(False)
+        self.selector.register(self.wakeup_receiver, selectors.EVENT_READ)
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __len__(self) -> int:
+        return len(self.spectators)
+
+    def add(self, spectator_socket: socket.socket) -> None:
+        """
+        Starts streaming the game to a spectator, starting with the game so far.
+        :param spectator_socket: The socket connected to the spectator,
+                                 which has already said hello.
+        """
+        spectator_socket.setblocking(False)
+        spectator = Spectator(spectator_socket)
+        with self.lock:
+            if self.stopped:
+                spectator_socket.close()
+                return
+            self.spectators[spectator_socket] = spectator
+            self.selector.register(spectator_socket, selectors.EVENT_READ, spectator)
+            self.queue(spectator, memoryview(self.snapshot))
+        self.wake()
+
+    def update(self, game: ConnectFour) -> None:
+        """
+        Sends the last move of a game to every spectator.
+        :param game: The game, which has just had a move placed.
+        """
+        frame = memoryview(encode_frame(MessageType.MOVE, MOVE_STRUCT.pack(
+            (len(game.moves) - 1) & 0xFFFF, game.moves[-1])))
+        snapshot = self.encode_snapshot(game)
+        with self.lock:
+            self.snapshot = snapshot
+            for spectator in list(self.spectators.values()):
+                self.queue(spectator, frame)
+        self.wake()
+
+    @staticmethod
+    def encode_snapshot(game: ConnectFour) -> bytes:
+        """
+        Encodes the game so far, to send to spectators who arrive late.
+        :param game: The game.
+        :return: The STATE_SYNC frame.
+        """
+        return encode_frame(MessageType.STATE_SYNC, encode_state(
+            game.rows, game.columns, game.connect_n, game.moves))
+
+    def queue(self, spectator: Spectator, frame: memoryview) -> None:
+        """
+        Queues a frame for a spectator,
+        disconnecting them instead if they are too far behind.
+        :param spectator: The spectator.
+        :param frame: The frame.
+        """
+        if spectator.buffered + len(frame) > self.max_buffered_bytes:
+            self.drop(spectator)
+            self.dropped += 1
+            return
+        if not spectator.pending:
+            self.selector.modify(spectator.spectator_socket,
+                                 selectors.EVENT_READ | selectors.EVENT_WRITE, spectator)
+        spectator.pending.append(frame)
+        spectator.buffered += len(frame)
+
+    def drop(self, spectator: Spectator) -> None:
+        """
+        Disconnects a spectator.
+        :param spectator: The spectator.
+        """
+        if self.spectators.pop(spectator.spectator_socket, None) is None:
+            return
+        self.selector.unregister(spectator.spectator_socket)
+        spectator.spectator_socket.close()
+
+    def wake(self) -> None:
+        """Wakes up the thread."""
+        try:
+            self.wakeup_sender.send(b'\0')
+        except BlockingIOError:
+            # The thread already has wakeups it hasn't read.
+            pass
+
+    def run(self) -> None:
+        """Sends the queued frames as spectators are ready for them, until closed."""
+        while True:
+            events = self.selector.select()
+            with self.lock:
+                if self.stopped:
+                    break
+                for key, mask in events:
+                    if key.fileobj is self.wakeup_receiver:
+                        self.wakeup_receiver.recv(1024)
+                        continue
+                    spectator: Spectator = key.data
+                    if spectator.spectator_socket not in self.spectators:
+                        continue
+                    if mask & selectors.EVENT_READ:
+                        self.receive(spectator)
+                    if mask & selectors.EVENT_WRITE:
+                        self.send(spectator)
+
+    def receive(self, spectator: Spectator) -> None:
+        """
+        Reads what a spectator sent, which is ignored,
+        to notice when they disconnect.
+        :param spectator: The spectator.
+        """
+        try:
+            data = spectator.spectator_socket.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.drop(spectator)
+
+    def send(self, spectator: Spectator) -> None:
+        """
+        Sends a spectator as many of their pending frames as possible.
+        :param spectator: The spectator.
+        """
+        pending = spectator.pending
+        try:
+            while pending:
+                sent = spectator.spectator_socket.send(pending[0])
+                spectator.buffered -= sent
+                if sent < len(pending[0]):
+                    pending[0] = pending[0][sent:]
+                    return
+                pending.popleft()
+        except BlockingIOError:
+            return
+        except OSError:
+            self.drop(spectator)
+            return
+        self.selector.modify(spectator.spectator_socket, selectors.EVENT_READ, spectator)
+
+    def close(self) -> None:
+        """Stops the thread, disconnecting every spectator."""
+        with self.lock:
+            self.stopped = True
+        self.wake()
+        self.thread.join()
+        for spectator in list(self.spectators.values()):
+            # Give them what they can take without waiting, such as the last move.
+            self.send(spectator)
+            self.drop(spectator)
+        self.selector.close()
+        self.wakeup_sender.close()
+        self.wakeup_receiver.close()
+
+
+class SpectatorConnection:
+    """Watches a game that someone is hosting."""
+
+    def __init__(self,
+                 game_socket: socket.socket,
+                 username: str,
+                 timeout: Optional[float] = HANDSHAKE_TIMEOUT) -> None:
+        """
+        Asks the host to watch their game, and waits for the game so far.
+
+        :param game_socket: The TCP socket already connected to the host.
+        :param username: Your username.
+        :param timeout: How many seconds to wait for the game so far,
+                        or None to wait forever.
+        """
+        enable_keepalive(game_socket)
+        self.game_socket: socket.socket = game_socket
+        self.host_username: str = ''
+        self.reader = FrameReader()
+        # The game being watched, which is kept up to date by receive_move().
+        self.game: Optional[ConnectFour] = None
+        # Asking to spectate along with the hello lets the host tell spectators
+        # apart from players as soon as they say hello.
+        game_socket.sendall(encode_frame(MessageType.HELLO, encode_hello(username))
+                            + encode_frame(MessageType.SPECTATE))
+        game_socket.settimeout(timeout)
+        try:
+            while self.game is None:
+                self.receive_frame()
+        except socket.timeout:
+            raise TimeoutError('The host did not send their game.')
+        finally:
+            game_socket.settimeout(None)
+
+    def receive_frame(self) -> Optional[int]:
+        """
+        Receives a frame from the host and handles it.
+        :return: The column of the move, if the frame was a move.
+        """
+        message_type, payload = self.reader.receive(self.game_socket)
+        if message_type == MessageType.HELLO:
+            min_version, max_version, self.host_username = decode_hello(payload)
+            if negotiate_version(min_version, max_version) < SPECTATOR_PROTOCOL_VERSION:
+                raise ProtocolError('The host does not allow spectators.')
+        elif message_type == MessageType.STATE_SYNC:
+            rows, columns, connect_n, moves = decode_state(payload)
+            self.game = ConnectFour(rows, columns, connect_n)
+            for column in moves:
+                self.game.place(column)
+        elif message_type == MessageType.MOVE and self.game is not None:
+            column = decode_payload(MOVE_STRUCT, payload)[1]
+            self.game.place(column)
+            return column
+        return None
+
+    def receive_move(self) -> Optional[int]:
+        """
+        Waits for the next move, which is placed in game.
+        :return: The column of the move, or None if the host stopped
+                 streaming the game, such as because it is over.
+        """
+        try:
+            column = self.receive_frame()
+            while column is None:
+                column = self.receive_frame()
+        except ConnectionError:
+            return None
+        return column
+
+    def disconnect(self) -> None:
+        """Stops watching the game."""
+        self.game_socket.close()
@@ -0,0 +1,168 @@
+import random
+import unittest
+from typing import List, Optional
+
+from connect_four import ConnectFour, Connection, Tile
+from player import Player
+
+
+class GridConnectFour:
+    """
+    The original Connect 4 engine, which keeps a grid of tiles and scans all
+    of it for connections. ConnectFour is checked against it.
+    """
+
+    def __init__(self, rows: int, columns: int, connect_n: int) -> None:
+        self.rows: int = rows
+        self.columns: int = columns
+        self.connect_n: int = connect_n
+        self.grid: List[List[Tile]] = [[None] * columns for _ in range(rows)]
+        self.column_heights: List[int] = [0] * columns
+        self.turn: Player = Player.ONE
+
+    def can_place(self, column: int) -> bool:
+        return self.column_heights[column] < self.rows
+
+    def place(self, column: int) -> bool:
+        if not self.can_place(column):
+            return False
+        self.grid[self.column_heights[column]][column] = self.turn
+        self.column_heights[column] += 1
+        self.turn = Player(not self.turn)
+        return True
+
+    def is_over(self) -> bool:
+        return self.winner() is not None or not any(map(self.can_place, range(self.columns)))
+
+    def winner(self) -> Optional[Player]:
+        connections = self.winning_connections()
+        if not connections:
+            return None
+        row, column = connections[0][0]
+        return self.grid[row][column]
+
+    def winning_connections(self) -> List[Connection]:
+        connections = []
+        for row in range(self.rows):
+            for column in range(self.columns):
+                player = self.grid[row][column]
+                if player is None:
+                    continue
+                can_check_row = column <= self.columns - self.connect_n
+                can_check_column = row <= self.rows - self.connect_n
+                can_check_reverse_row = column >= self.connect_n - 1
+                steps = []
+                if can_check_row:
+                    steps.append((0, 1))
+                if can_check_column:
+                    steps.append((1, 0))
+                if can_check_row and can_check_column:
+                    steps.append((1, 1))
+                if can_check_reverse_row and can_check_column:
+                    steps.append((1, -1))
+                for row_step, column_step in steps:
+                    cells = tuple((row + i * row_step, column + i * column_step)
+                                  for i in range(self.connect_n))
+                    if all(self.grid[cell_row][cell_column] == player
+                           for cell_row, cell_column in cells):
+                        connections.append(cells)
+        return connections
+
+
+class BaselineTest(unittest.TestCase):
+    """Checks that the bitboard ConnectFour plays the same as GridConnectFour."""
+
+    sizes = [(6, 7, 4), (4, 5, 4), (4, 4, 3), (5, 9, 5), (3, 8, 3), (7, 6, 4)]
+
+    def random_games(self, rows: int, columns: int, connect_n: int, count: int):
+        """
+        Plays random games on both engines, until each game is over.
+
+        :param rows: The number of rows.
+        :param columns: The number of columns.
+        :param connect_n: How many tiles in a row to win.
+        :param count: How many games to play.
+        :return: Each pair of games, after every move.
+        """
+        rng = random.Random(rows * columns * connect_n)
+        for _ in range(count):
+            game = ConnectFour(rows, columns, connect_n)
+            baseline = GridConnectFour(rows, columns, connect_n)
+            yield game, baseline
+            while not baseline.is_over():
+                column = rng.choice([column for column in range(columns)
+                                     if baseline.can_place(column)])
+                self.assertTrue(game.place(column))
+                baseline.place(column)
+                yield game, baseline
+
+    def assert_same(self, game: ConnectFour, baseline: GridConnectFour) -> None:
+        with self.subTest(size=(game.rows, game.columns, game.connect_n),
+                          moves=game.moves.tolist()):
+            self.assertEqual(game.grid, baseline.grid)
+            self.assertEqual(game.turn, baseline.turn)
+            self.assertEqual(game.is_over(), baseline.is_over())
+            self.assertEqual(game.winner(), baseline.winner())
+            self.assertEqual(sorted(game.winning_connections()),
+                             sorted(baseline.winning_connections()))
+            self.assertEqual([game.can_place(column) for column in range(game.columns)],
+                             [baseline.can_place(column) for column in range(game.columns)])
+
+    def test_random_games(self) -> None:
+        for size in self.sizes:
+            for game, baseline in self.random_games(*size, count=20):
+                self.assert_same(game, baseline)
+
+    def test_undo(self) -> None:
+        # Undoing every move of a game passes back through the same positions.
+        for size in self.sizes:
+            history = []
+            for game, baseline in self.random_games(*size, count=5):
+                if not game.moves:
+                    history = []
+                history.append((game.copy(), [row[:] for row in baseline.grid]))
+                if not game.is_over():
+                    continue
+                for previous, grid in reversed(history[:-1]):
+                    game.undo()
+                    with self.subTest(size=size, moves=game.moves.tolist()):
+                        self.assertEqual(game.grid, grid)
+                        self.assertEqual(game.key, previous.key)
+                        self.assertEqual(game.is_over(), previous.is_over())
+                        self.assertEqual(game.winner(), previous.winner())
+
+    def test_keys(self) -> None:
+        # The same tiles reached in a different order have the same key,
+        # and a position and its mirror image have the same canonical key.
+        first = ConnectFour()
+        second = ConnectFour()
+        mirror = ConnectFour()
+        for column in (3, 2, 4, 1):
+            first.place(column)
+        for column in (4, 1, 3, 2):
+            second.place(column)
+        for column in (3, 4, 2, 5):
+            mirror.place(column)
+        self.assertEqual(first.key, second.key)
+        self.assertNotEqual(first.key, mirror.key)
+        self.assertEqual(first.canonical_key(), mirror.canonical_key())
+
+    def test_off_grid_columns(self) -> None:
+        game = ConnectFour(4, 5, 4)
+        for column in (-6, -1, 5, 100):
+            with self.subTest(column=column):
+                self.assertFalse(game.can_place(column))
+                self.assertFalse(game.place(column))
+        self.assertEqual(game.moves.tolist(), [])
+
+    def test_full_column(self) -> None:
+        game = ConnectFour(4, 5, 4)
+        for _ in range(4):
+            self.assertTrue(game.place(2))
+        self.assertFalse(game.can_place(2))
+        self.assertFalse(game.place(2))
+        self.assertEqual(game.column_heights[2], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
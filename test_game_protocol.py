@@ -0,0 +1,187 @@
+import random
+import socket
+import threading
+import unittest
+from typing import List, Tuple
+
+from connect_four import Player
+from game_connection import GameConnection
+from game_protocol import (FrameReader, MessageType, ProtocolError, decode_hello,
+                           decode_payload, decode_state, encode_frame, encode_hello,
+                           encode_state, negotiate_version)
+from network_settings import (MAX_PAYLOAD_BYTES, MIN_PROTOCOL_VERSION, MOVE_STRUCT,
+                              PROTOCOL_VERSION)
+
+
+class FramingTest(unittest.TestCase):
+    """Checks that frames are read back however the bytes arrive."""
+
+    def frames(self, count: int) -> List[Tuple[int, bytes]]:
+        """
+        Creates frames with payloads of many lengths.
+
+        :param count: How many frames to create.
+        :return: The type and payload of each frame.
+        """
+        rng = random.Random(16)
+        return [(rng.choice(list(MessageType)),
+                 bytes(rng.randrange(256) for _ in range(rng.choice([0, 1, 12, 300, 5000]))))
+                for _ in range(count)]
+
+    def read_all(self, reader: FrameReader) -> List[Tuple[int, bytes]]:
+        frames = []
+        frame = reader.next_frame()
+        while frame is not None:
+            frames.append(frame)
+            frame = reader.next_frame()
+        return frames
+
+    def test_all_at_once(self) -> None:
+        frames = self.frames(50)
+        reader = FrameReader()
+        reader.feed(b''.join(encode_frame(*frame) for frame in frames))
+        self.assertEqual(self.read_all(reader), frames)
+        self.assertIsNone(reader.next_frame())
+
+    def test_split(self) -> None:
+        frames = self.frames(50)
+        data = b''.join(encode_frame(*frame) for frame in frames)
+        for size in (1, 2, 3, 7, 1000):
+            with self.subTest(size=size):
+                reader = FrameReader()
+                received = []
+                for start in range(0, len(data), size):
+                    reader.feed(data[start:start + size])
+                    received += self.read_all(reader)
+                self.assertEqual(received, frames)
+                self.assertEqual(reader.bytes_received, len(data))
+
+    def test_receive(self) -> None:
+        first, second = socket.socketpair()
+        try:
+            frames = self.frames(10)
+            first.sendall(b''.join(encode_frame(*frame) for frame in frames))
+            first.close()
+            reader = FrameReader()
+            self.assertEqual([reader.receive(second) for _ in frames], frames)
+            with self.assertRaises(ConnectionError):
+                reader.receive(second)
+        finally:
+            second.close()
+
+    def test_largest_payload(self) -> None:
+        reader = FrameReader()
+        reader.feed(encode_frame(MessageType.CHAT, bytes(MAX_PAYLOAD_BYTES)))
+        self.assertEqual(reader.next_frame(), (MessageType.CHAT, bytes(MAX_PAYLOAD_BYTES)))
+        with self.assertRaises(ValueError):
+            encode_frame(MessageType.CHAT, bytes(MAX_PAYLOAD_BYTES + 1))
+
+    def test_payloads(self) -> None:
+        self.assertEqual(decode_hello(encode_hello('player', 1, 2)), (1, 2, 'player'))
+        self.assertEqual(decode_state(encode_state(6, 7, 4, [3, 3, 2])), (6, 7, 4, [3, 3, 2]))
+        self.assertEqual(decode_payload(MOVE_STRUCT, MOVE_STRUCT.pack(4, 6)), (4, 6))
+        for payload in (b'', MOVE_STRUCT.pack(4, 6) + b'\x00'):
+            with self.assertRaises(ProtocolError):
+                decode_payload(MOVE_STRUCT, payload)
+        with self.assertRaises(ProtocolError):
+            decode_hello(b'\x01')
+        with self.assertRaises(ProtocolError):
+            decode_state(encode_state(6, 7, 4, [3]) + b'\x00')
+
+
+class VersionTest(unittest.TestCase):
+    """Checks that players agree on the highest version they both speak."""
+
+    def test_negotiate(self) -> None:
+        self.assertEqual(negotiate_version(MIN_PROTOCOL_VERSION, PROTOCOL_VERSION),
+                         PROTOCOL_VERSION)
+        self.assertEqual(negotiate_version(1, 255), PROTOCOL_VERSION)
+        self.assertEqual(negotiate_version(1, 1), 1)
+        self.assertEqual(negotiate_version(0, 2), 2)
+        for min_version, max_version in ((PROTOCOL_VERSION + 1, 255), (0, 0), (3, 2)):
+            with self.subTest(min_version=min_version, max_version=max_version):
+                with self.assertRaises(ProtocolError):
+                    negotiate_version(min_version, max_version)
+
+    def connect(self, *frames: Tuple[int, bytes]) -> Tuple[GameConnection, FrameReader,
+                                                           socket.socket]:
+        """
+        Connects a GameConnection to a socket that has sent some frames.
+
+        :param frames: The type and payload of each frame the socket sends first.
+        :return: The connection, a reader for what it sent, and the socket.
+        """
+        first, second = socket.socketpair()
+        self.addCleanup(first.close)
+        first.sendall(b''.join(encode_frame(*frame) for frame in frames))
+        connection = GameConnection(second, Player.ONE, 'host', handshake_timeout=5)
+        self.addCleanup(connection.disconnect)
+        return connection, FrameReader(), first
+
+    def test_old_player(self) -> None:
+        connection, reader, other = self.connect(
+            (MessageType.HELLO, encode_hello('old', 1, 1)))
+        self.assertEqual(connection.version, 1)
+        self.assertEqual(connection.opponent_username, 'old')
+        message_type, payload = reader.receive(other)
+        self.assertEqual(message_type, MessageType.HELLO)
+        self.assertEqual(decode_hello(payload),
+                         (MIN_PROTOCOL_VERSION, PROTOCOL_VERSION, 'host'))
+
+    def test_no_common_version(self) -> None:
+        first, second = socket.socketpair()
+        self.addCleanup(first.close)
+        first.sendall(encode_frame(MessageType.HELLO,
+                                   encode_hello('new', PROTOCOL_VERSION + 1, 255)))
+        with self.assertRaises(ProtocolError):
+            GameConnection(second, Player.ONE, 'host', handshake_timeout=5)
+        second.close()
+
+    def test_frame_after_hello(self) -> None:
+        # The frame after the hello says why the player connected,
+        # and is waited for even if it doesn't arrive with the hello.
+        for message_type, spectating in ((MessageType.SPECTATE, True),
+                                         (MessageType.PING, False)):
+            with self.subTest(message_type=message_type):
+                connection, _, other = self.connect(
+                    (MessageType.HELLO, encode_hello('player')))
+                threading.Timer(0.1, other.sendall, [encode_frame(message_type)]).start()
+                connection.receive_after_hello(5)
+                self.assertEqual(connection.spectating, spectating)
+                self.assertIsNone(connection.resume_token)
+
+    def test_full(self) -> None:
+        connection, _, other = self.connect((MessageType.HELLO, encode_hello('host')))
+        other.sendall(encode_frame(MessageType.FULL))
+        with self.assertRaises(ProtocolError):
+            connection.receive_after_hello(5)
+        # It is just as much of an error if it arrives with the hello.
+        with self.assertRaises(ProtocolError):
+            self.connect((MessageType.HELLO, encode_hello('host')), (MessageType.FULL, b''))
+
+    def test_moves(self) -> None:
+        first, second = socket.socketpair()
+        joined = {}
+        thread = threading.Thread(target=lambda: joined.setdefault(
+            'connection', GameConnection(first, Player.TWO, 'joiner', handshake_timeout=5)))
+        thread.start()
+        host = GameConnection(second, Player.ONE, 'host', handshake_timeout=5)
+        thread.join()
+        joiner = joined['connection']
+        try:
+            self.assertEqual((host.version, joiner.version), (PROTOCOL_VERSION, PROTOCOL_VERSION))
+            self.assertEqual((host.opponent_username, joiner.opponent_username),
+                             ('joiner', 'host'))
+            host.send_column(3)
+            self.assertEqual(joiner.receive_column(), 3)
+            joiner.send_column(6)
+            self.assertEqual(host.receive_column(), 6)
+            host.resign()
+            self.assertIsNone(joiner.receive_column())
+        finally:
+            host.disconnect()
+            joiner.disconnect()
+
+
+if __name__ == '__main__':
+    unittest.main()
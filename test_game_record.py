@@ -0,0 +1,137 @@
+import os
+import random
+import tempfile
+import unittest
+from typing import List
+
+from connect_four import ConnectFour
+from game_record import (INDEX_FOOTER_STRUCT, GameRecord, GameRecordReader,
+                         GameRecordWriter, Outcome, pack_moves, read_records,
+                         unpack_moves)
+from player import Player
+
+
+def random_game(rng: random.Random, rows: int = 6, columns: int = 7,
+                connect_n: int = 4) -> ConnectFour:
+    """
+    Plays a random game, which may be stopped before it is over.
+
+    :param rng: Where the moves come from.
+    :param rows: The number of rows.
+    :param columns: The number of columns.
+    :param connect_n: How many tiles in a row to win.
+    :return: The game.
+    """
+    game = ConnectFour(rows, columns, connect_n)
+    stop = rng.randrange(rows * columns + 1)
+    while not game.is_over() and len(game.moves) < stop:
+        game.place(rng.choice([column for column in range(columns)
+                               if game.can_place(column)]))
+    return game
+
+
+class GameRecordTest(unittest.TestCase):
+    """Checks that game records are read back as they were written."""
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'games.c4gr')
+        self.rng = random.Random(21)
+
+    def write_games(self, count: int) -> List[ConnectFour]:
+        """
+        Appends random games to the record file, then closes it.
+
+        :param count: How many games to write.
+        :return: The games, in the order they were written.
+        """
+        games = [random_game(self.rng, *self.rng.choice([(6, 7, 4), (4, 5, 3), (9, 16, 5)]))
+                 for _ in range(count)]
+        writer = GameRecordWriter(self.path)
+        # The players are named after the record's number in the file.
+        for number, game in enumerate(games, len(writer)):
+            writer.write_game(game, f'one {number}', f'two {number}')
+        writer.close()
+        return games
+
+    def assert_records(self, records: List[GameRecord], games: List[ConnectFour]) -> None:
+        self.assertEqual(len(records), len(games))
+        for number, (record, game) in enumerate(zip(records, games)):
+            with self.subTest(number=number):
+                self.assertEqual((record.rows, record.columns, record.connect_n),
+                                 (game.rows, game.columns, game.connect_n))
+                self.assertEqual(record.moves().tolist(), game.moves.tolist())
+                self.assertEqual(record.outcome, Outcome.of(game))
+                self.assertEqual(record.player_one, f'one {number}')
+                self.assertEqual(record.player_two, f'two {number}')
+                self.assertEqual(record.replay().grid, game.grid)
+
+    def test_pack_moves(self) -> None:
+        for columns in (1, 2, 3, 7, 8, 9, 16, 255):
+            moves = [self.rng.randrange(columns) for _ in range(self.rng.randrange(50))]
+            with self.subTest(columns=columns):
+                packed = pack_moves(moves, columns)
+                self.assertEqual(unpack_moves(packed, len(moves), columns).tolist(), moves)
+
+    def test_round_trip(self) -> None:
+        games = self.write_games(30)
+        self.assert_records(list(read_records(self.path)), games)
+        reader = GameRecordReader(self.path)
+        try:
+            self.assert_records([reader[number] for number in range(len(reader))], games)
+        finally:
+            reader.close()
+
+    def test_resigned(self) -> None:
+        game = ConnectFour()
+        game.place(3)
+        for resigned, outcome in ((Player.ONE, Outcome.PLAYER_TWO),
+                                  (Player.TWO, Outcome.PLAYER_ONE),
+                                  (None, Outcome.UNFINISHED)):
+            with self.subTest(resigned=resigned):
+                record = GameRecord.from_game(game, 'one', 'two', resigned)
+                self.assertEqual(record.outcome, outcome)
+
+    def test_append(self) -> None:
+        games = self.write_games(10) + self.write_games(5)
+        self.assert_records(list(read_records(self.path)), games)
+        reader = GameRecordReader(self.path)
+        try:
+            self.assertEqual(len(reader), 15)
+            self.assertEqual(reader[14].moves().tolist(), games[14].moves.tolist())
+        finally:
+            reader.close()
+
+    def test_interrupted_footer(self) -> None:
+        # Cutting the footer short leaves some of the record offsets behind,
+        # which mustn't be mistaken for records.
+        games = self.write_games(10)
+        size = os.path.getsize(self.path)
+        for cut in (INDEX_FOOTER_STRUCT.size, INDEX_FOOTER_STRUCT.size + 8 * 10 - 13):
+            with self.subTest(cut=cut):
+                with open(self.path, 'r+b') as file:
+                    file.truncate(size - cut)
+                self.assert_records(list(read_records(self.path)), games)
+                with self.assertRaises(ValueError):
+                    GameRecordReader(self.path)
+        # Appending finds the records again, and rewrites the footer.
+        games += self.write_games(3)
+        self.assert_records(list(read_records(self.path)), games)
+        reader = GameRecordReader(self.path)
+        try:
+            self.assertEqual(len(reader), 13)
+        finally:
+            reader.close()
+
+    def test_not_a_record_file(self) -> None:
+        with open(self.path, 'wb') as file:
+            file.write(b'not a record file')
+        with self.assertRaises(ValueError):
+            list(read_records(self.path))
+        with self.assertRaises(ValueError):
+            GameRecordWriter(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
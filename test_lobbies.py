@@ -0,0 +1,239 @@
+import socket
+import time
+import unittest
+from typing import List, Tuple
+
+from joinable_lobby import JoinableLobby
+from lobby_advertiser import LobbyAdvertiser, pack_batch, unpack_batch
+from lobby_index import LobbyIndex
+from lobby_manager import LobbyEvent, LobbyManager
+from network_settings import (ADVERTISEMENT_HEADER_STRUCT, ADVERTISEMENT_MAX_BYTES,
+                              ADVERTISEMENT_RECORD_STRUCT, ADVERTISING_PORT,
+                              CLOSED_RECORD, FULL_RECORD, HEARTBEAT_RECORD,
+                              LOBBY_STRUCT)
+
+
+def make_lobbies(count: int, first_port: int = 5000) -> List[JoinableLobby]:
+    """
+    Creates lobbies with different names, sizes and hosts.
+
+    :param count: How many lobbies to create.
+    :param first_port: The port of the first lobby, which goes up by one for each.
+    :return: The lobbies.
+    """
+    return [JoinableLobby('', first_port + number, f'Lobby {number:03}',
+                          f'host {number % 3}', 6 + number % 2, 7, 4 + number % 2)
+            for number in range(count)]
+
+
+def same_lobby(lobby: JoinableLobby) -> Tuple:
+    """
+    Gets everything that is advertised about a lobby.
+
+    :param lobby: The lobby.
+    :return: A tuple that is equal for lobbies that are advertised the same.
+    """
+    return (lobby.port, lobby.lobby_name, lobby.host_name, lobby.rows,
+            lobby.columns, lobby.connect_n, lobby.in_progress)
+
+
+class AdvertiserTest(unittest.TestCase):
+    """Checks what a LobbyAdvertiser sends, and that it is read back the same."""
+
+    def unpack(self, datagrams: List[bytes]) -> List[Tuple]:
+        records = []
+        for datagram in datagrams:
+            self.assertLessEqual(len(datagram), ADVERTISEMENT_MAX_BYTES)
+            # Lone lobbies are told apart from batches by their size.
+            self.assertNotEqual(len(datagram), LOBBY_STRUCT.size)
+            records += unpack_batch('::1', datagram)
+        return records
+
+    def test_serialize(self) -> None:
+        for lobby in make_lobbies(4):
+            with self.subTest(lobby_name=lobby.lobby_name):
+                received = JoinableLobby.deserialize('::1', lobby.serialize())
+                self.assertEqual(received.address(), ('::1', lobby.port))
+                self.assertEqual(same_lobby(received), same_lobby(lobby))
+        # Names are cut short to fit.
+        lobby = JoinableLobby('', 1, 'x' * 40, 'y' * 40, in_progress=True)
+        received = JoinableLobby.deserialize('::1', lobby.serialize())
+        self.assertEqual((received.lobby_name, received.host_name, received.in_progress),
+                         ('x' * 32, 'y' * 32, True))
+
+    def test_serialized_cache(self) -> None:
+        lobby = make_lobbies(1)[0]
+        first = lobby.serialize()
+        self.assertIs(lobby.serialize(), first)
+        lobby.in_progress = True
+        self.assertTrue(JoinableLobby.deserialize('::1', lobby.serialize()).in_progress)
+        lobby.lobby_name = 'Renamed'
+        self.assertEqual(JoinableLobby.deserialize('::1', lobby.serialize()).lobby_name,
+                         'Renamed')
+
+    def test_full_then_heartbeats(self) -> None:
+        lobbies = make_lobbies(40)
+        advertiser = LobbyAdvertiser(full_interval=3)
+        for lobby in lobbies:
+            advertiser.add(lobby)
+        records = self.unpack(advertiser.datagrams())
+        self.assertEqual([record[0] for record in records], [FULL_RECORD] * 40)
+        self.assertEqual([same_lobby(record[3]) for record in records],
+                         [same_lobby(lobby) for lobby in lobbies])
+        # Unchanged lobbies are only sent as heartbeats, which all fit in one datagram.
+        datagrams = advertiser.datagrams()
+        self.assertEqual(len(datagrams), 1)
+        self.assertEqual(len(datagrams[0]),
+                         ADVERTISEMENT_HEADER_STRUCT.size + 40 * ADVERTISEMENT_RECORD_STRUCT.size)
+        # A changed lobby is sent in full, with its sequence number going up.
+        lobbies[5].in_progress = True
+        records = self.unpack(advertiser.datagrams())
+        self.assertEqual([record[:3] for record in records if record[0] == FULL_RECORD],
+                         [(FULL_RECORD, lobbies[5].port, 1)])
+        self.assertTrue(records[5][3].in_progress)
+        # Every full_interval advertisements, every lobby is sent in full.
+        records = self.unpack(advertiser.datagrams())
+        self.assertEqual({record[0] for record in records}, {FULL_RECORD})
+
+    def test_closed(self) -> None:
+        lobbies = make_lobbies(3)
+        advertiser = LobbyAdvertiser()
+        for lobby in lobbies:
+            advertiser.add(lobby)
+        advertiser.datagrams()
+        advertiser.remove(lobbies[1].port)
+        records = self.unpack(advertiser.datagrams())
+        self.assertEqual([record[:2] for record in records],
+                         [(CLOSED_RECORD, lobbies[1].port),
+                          (HEARTBEAT_RECORD, lobbies[0].port),
+                          (HEARTBEAT_RECORD, lobbies[2].port)])
+        # Listeners are only told once.
+        self.assertNotIn(CLOSED_RECORD, [record[0] for record in
+                                         self.unpack(advertiser.datagrams())])
+
+    def test_unpack_ignores_bad_batches(self) -> None:
+        batch = pack_batch([ADVERTISEMENT_RECORD_STRUCT.pack(FULL_RECORD, 5000, 0)
+                            + make_lobbies(1)[0].serialize()] * 2)
+        self.assertEqual(len(unpack_batch('::1', batch)), 2)
+        self.assertEqual(len(unpack_batch('::1', batch[:-1])), 1)
+        self.assertEqual(unpack_batch('::1', b'XXXX' + batch[4:]), [])
+        self.assertEqual(unpack_batch('::1', batch[:3]), [])
+
+
+class LobbyManagerTest(unittest.TestCase):
+    """Checks how a LobbyManager adds, refreshes and times out lobbies."""
+
+    def setUp(self) -> None:
+        try:
+            self.manager = LobbyManager()
+        except OSError as error:
+            self.skipTest(f'Cannot listen for advertisements: {error}')
+        self.addCleanup(self.manager.close)
+        self.manager.listening_socket.settimeout(5)
+        self.events = []
+        self.manager.subscribe(lambda event, lobby: self.events.append((event, lobby.lobby_name)))
+
+    def send(self, datagrams: List[bytes]) -> None:
+        """
+        Sends datagrams to the manager from one address, and receives them.
+
+        :param datagrams: The datagrams.
+        """
+        sender = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        try:
+            for datagram in datagrams:
+                sender.sendto(datagram, ('::1', ADVERTISING_PORT))
+                self.manager.receive_lobby()
+        finally:
+            sender.close()
+
+    def test_batches(self) -> None:
+        lobbies = make_lobbies(30)
+        advertiser = LobbyAdvertiser()
+        for lobby in lobbies:
+            advertiser.add(lobby)
+        self.send(advertiser.datagrams())
+        self.assertEqual(sorted(lobby.address() for lobby in self.manager.lobbies_list()),
+                         [('::1', lobby.port) for lobby in lobbies])
+        lobbies[0].lobby_name = 'Renamed'
+        advertiser.remove(lobbies[1].port)
+        self.send(advertiser.datagrams())
+        self.assertEqual(self.events[30:], [(LobbyEvent.REMOVED, 'Lobby 001'),
+                                            (LobbyEvent.UPDATED, 'Renamed')])
+        self.assertEqual(len(self.manager.lobbies_list()), 29)
+
+    def test_single_lobby_close(self) -> None:
+        # A lone lobby is closed by a message that doesn't say which lobby,
+        # so it is found by the address that advertised it.
+        self.send([make_lobbies(1)[0].serialize(), b'00'])
+        self.assertEqual(self.events, [(LobbyEvent.ADDED, 'Lobby 000'),
+                                       (LobbyEvent.REMOVED, 'Lobby 000')])
+        self.assertEqual(self.manager.sender_lobbies, {})
+
+    def test_expiry(self) -> None:
+        first, second = make_lobbies(2)
+        self.manager.update_lobby(('::1', first.port), first, 7)
+        self.manager.update_lobby(('::1', second.port), second, 0)
+        time.sleep(0.2)
+        # A heartbeat with the sequence number the lobby was received with
+        # keeps it alive, but one for a newer version of the lobby doesn't.
+        self.manager.refresh_lobby(('::1', first.port), 7)
+        self.manager.refresh_lobby(('::1', second.port), 1)
+        self.manager.remove_timed_out_lobbies(timeout=0.1)
+        self.assertEqual([lobby.port for lobby in self.manager.lobbies_list()], [first.port])
+        self.assertLessEqual(self.manager.time_until_timeout(timeout=0.1), 0.1)
+        time.sleep(0.2)
+        self.manager.remove_timed_out_lobbies(timeout=0.1)
+        self.assertEqual(self.manager.lobbies_list(), [])
+        self.assertIsNone(self.manager.time_until_timeout())
+        self.assertEqual(self.events, [(LobbyEvent.ADDED, 'Lobby 000'),
+                                       (LobbyEvent.ADDED, 'Lobby 001'),
+                                       (LobbyEvent.REMOVED, 'Lobby 001'),
+                                       (LobbyEvent.REMOVED, 'Lobby 000')])
+
+
+class LobbyIndexTest(unittest.TestCase):
+    """Checks LobbyIndex.query() against filtering every lobby."""
+
+    def setUp(self) -> None:
+        self.lobbies = make_lobbies(100)
+        for lobby in self.lobbies:
+            lobby.ip_address = '::1'
+        self.index = LobbyIndex(self.lobbies)
+
+    def assert_query(self, page_size: int = 7, **filters) -> None:
+        expected = [
+            lobby for lobby in self.lobbies
+            if filters.get('rows') in (None, lobby.rows)
+            and filters.get('connect_n') in (None, lobby.connect_n)
+            and filters.get('host_name', lobby.host_name).lower() == lobby.host_name.lower()
+            and lobby.lobby_name.lower().startswith(filters.get('name_prefix', '').lower())
+        ]
+        for page in range(len(expected) // page_size + 2):
+            with self.subTest(page=page, **filters):
+                result = self.index.query(page=page, page_size=page_size, **filters)
+                self.assertEqual(result.total, len(expected))
+                self.assertEqual(result.lobbies,
+                                 expected[page * page_size:(page + 1) * page_size])
+
+    def test_unfiltered(self) -> None:
+        self.assert_query()
+        self.assert_query(name_prefix='lobby 05')
+        self.assert_query(name_prefix='nothing')
+
+    def test_filtered(self) -> None:
+        self.assert_query(rows=7)
+        self.assert_query(connect_n=5, host_name='HOST 1')
+        self.assert_query(rows=6, name_prefix='Lobby 0')
+        self.assert_query(host_name='nobody')
+
+    def test_remove(self) -> None:
+        removed = self.lobbies.pop(50)
+        self.assertIs(self.index.remove(removed.address()), removed)
+        self.assertIsNone(self.index.remove(removed.address()))
+        self.assert_query()
+        self.assert_query(rows=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
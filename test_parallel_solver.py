@@ -0,0 +1,63 @@
+import random
+import unittest
+
+from connect_four import ConnectFour
+from parallel_solver import ParallelSolver
+from solver import Solver
+
+
+class AnalyzeTest(unittest.TestCase):
+    """Checks that ParallelSolver.analyze() agrees with Solver.analyze()."""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.parallel = ParallelSolver(max_workers=2, buckets=1 << 16)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.parallel.close()
+
+    def positions(self, rows: int, columns: int, connect_n: int, count: int):
+        """
+        Creates random positions that aren't over.
+
+        :param rows: The number of rows.
+        :param columns: The number of columns.
+        :param connect_n: How many tiles in a row to win.
+        :param count: How many positions to create.
+        :return: The games of the positions.
+        """
+        rng = random.Random(rows * columns * connect_n)
+        games = []
+        while len(games) < count:
+            game = ConnectFour(rows, columns, connect_n)
+            for _ in range(rng.randrange(rows * columns)):
+                game.place(rng.choice([column for column in range(columns)
+                                       if game.can_place(column)]))
+                if game.is_over():
+                    break
+            if not game.is_over():
+                games.append(game)
+        return games
+
+    def assert_agree(self, game: ConnectFour) -> None:
+        for weak in (False, True):
+            with self.subTest(moves=game.moves.tolist(), weak=weak):
+                self.assertEqual(Solver().analyze(game, weak),
+                                 self.parallel.analyze(game, weak))
+
+    def test_random_positions(self) -> None:
+        for game in self.positions(4, 5, 4, 8) + self.positions(4, 4, 3, 8):
+            self.assert_agree(game)
+
+    def test_immediate_win(self) -> None:
+        game = ConnectFour(4, 5, 4)
+        for column in (0, 1, 0, 1, 0, 1):
+            game.place(column)
+        scores = Solver().analyze(game, weak=True)
+        self.assertEqual(scores[0], 1)
+        self.assert_agree(game)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,19 @@
+from typing import Optional
+
 from connect_four import ConnectFour, Player
 from game_connection import GameConnection
+from game_session import GameSession
 
 
-def text_game(game_connection: GameConnection) -> None:
+def text_game(game_connection: GameConnection,
+              game_session: Optional[GameSession] = None) -> None:
+    if game_session is None:
+        game_session = GameSession(game_connection)
     game = ConnectFour()
     # Main game loop.
     while not game.is_over():
+        # The connection is replaced whenever the session is resumed.
+        game_connection = game_session.connection
         print()
         # Get the player's move and send it to your opponent.
         if game.turn == game_connection.player:
@@ -25,7 +33,12 @@ def text_game(game_connection: GameConnection) -> None:
                 print(f'Column {column} is full.')
                 continue
             game.place(column)
-            game_connection.send_column(column)
+            game_session.played(game)
+            try:
+                game_connection.send_column(column)
+            except OSError:
+                if not reconnect(game_session, game):
+                    return
         # Wait for your opponent's move.
         else:
             print(
@@ -34,20 +47,42 @@ def text_game(game_connection: GameConnection) -> None:
             )
             print(game)
             print('Waiting for their move...')
-            column = game_connection.receive_column()
+            try:
+                column = game_connection.receive_column()
+            except OSError:
+                if not reconnect(game_session, game):
+                    return
+                continue
+            if column is None:
+                break
             game.place(column)
+            game_session.played(game)
+    game_connection = game_session.connection
     # Print the final state of the game.
     print()
     print(game)
     # Print the winner.
     winner = game.winner()
-    if winner is None:
+    if game_connection.opponent_resigned:
+        print(f'{game_connection.opponent_username} resigned. You won!')
+    elif winner is None:
         print('THe game ended in a draw.')
     elif winner == game_connection.player:
         print('You won!')
     else:
         print('You lost.')
-    game_connection.disconnect()
+    game_session.close()
+
+
+def reconnect(game_session: GameSession, game: ConnectFour) -> bool:
+    opponent_username = game_session.connection.opponent_username
+    print(f'Lost the connection to {opponent_username}. Trying to reconnect...')
+    if game_session.resume(game):
+        print('Reconnected!')
+        return True
+    print(f'{opponent_username} stopped responding.')
+    game_session.close()
+    return False
 
 
 def player_to_str(player: Player):
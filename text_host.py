@@ -1,25 +1,53 @@
 from typing import Tuple, Optional
 
+from connect_four import Player
 from game_connection import GameConnection
+from game_protocol import ProtocolError
+from game_session import HostSession
 from hosted_lobby import HostedLobby
+from network_settings import HANDSHAKE_TIMEOUT, SPECTATOR_PROTOCOL_VERSION
+from spectators import SpectatorHub
 from text_name import accept_lobby_name
 
 
 def text_host(username: str,
-              lobby_name: str = '') -> Tuple[str, Optional[GameConnection]]:
+              lobby_name: str = '') -> Tuple[str, Optional[HostSession]]:
     # Ask the user for a lobby name if one wasn't provided.
     if not lobby_name:
         lobby_name = accept_lobby_name()
     # Create the lobby.
     hosted_lobby = HostedLobby(lobby_name, username)
     hosted_lobby.start_advertising()
-    hosted_lobby.start_accepting()
-    # Wait for a connection.
+    # Keep accepting and advertising after the first player joins,
+    # so they can reconnect and others can watch.
+    hosted_lobby.start_accepting(max_connections=0)
+    spectators = SpectatorHub()
+    # Wait for a player, letting anyone who wants to watch in as they arrive.
     print('Waiting for a player to join...')
-    hosted_lobby.accepting_thread.stop_event.wait()
-    # Get the updated username and the new game connection.
     username = hosted_lobby.info.host_name
-    game_connection = hosted_lobby.accepted_connection()
-    # Cleanup and return.
-    hosted_lobby.close()
-    return username, game_connection
+    game_connection = None
+    while game_connection is None:
+        game_socket = hosted_lobby.accepting_thread.next_connection()
+        try:
+            game_connection = GameConnection(game_socket, Player.ONE, username)
+        except (OSError, ProtocolError):
+            game_socket.close()
+            continue
+        # The frame after the hello says whether they want to play or watch.
+        # Older versions of the game can only play.
+        if game_connection.version >= SPECTATOR_PROTOCOL_VERSION:
+            try:
+                game_connection.receive_after_hello(HANDSHAKE_TIMEOUT)
+            except (OSError, ProtocolError):
+                game_connection.disconnect()
+                game_connection = None
+                continue
+        if game_connection.spectating:
+            spectators.add(game_socket)
+            game_connection = None
+        # There is no session to resume yet.
+        elif game_connection.resume_token is not None:
+            game_connection.disconnect()
+            game_connection = None
+    # The session cleans up the lobby when it is closed.
+    return username, HostSession(hosted_lobby, game_connection, spectators=spectators)
@@ -1,37 +1,63 @@
-from time import sleep
+from threading import Event
 from typing import Collection, List, Optional
 
-from game_connection import GameConnection
+from game_protocol import ProtocolError
+from game_session import GameSession, JoinSession
 from joinable_lobby import JoinableLobby
+from lobby_index import LobbyIndex
 from lobby_manager import LobbyManager
 from network_settings import MAX_LOBBY_NAME_LENGTH, MAX_USERNAME_LENGTH, ADVERTISING_WAIT_TIME
 from text_host import text_host
 from text_name import is_valid_lobby_name, username_command
+from text_spectate import text_spectate
 
+# How many lobbies are listed at a time.
+LOBBIES_PER_PAGE: int = 20
 
-def text_lobby(username: str) -> Optional[GameConnection]:
+
+def text_lobby(username: str) -> Optional[GameSession]:
     lobby_manager = LobbyManager()
-    game_connection = None
+    lobby_index = LobbyIndex()
+    game_session = None
     command = ''
-    # Wait enough time for existing lobbies to advertise to us.
+    page = 0
+    # Keep the lobbies up to date in the background,
+    # and stop waiting as soon as the first lobby advertises to us.
+    lobby_found = Event()
+    lobby_manager.subscribe(lobby_index.handle_event)
+    lobby_manager.subscribe(lambda event, lobby: lobby_found.set())
+    lobby_manager.start_discovery()
     print('Looking for lobbies...')
-    sleep(ADVERTISING_WAIT_TIME + 0.1)
-    while command != 'exit' and game_connection is None:
-        lobbies = lobby_manager.get_lobbies()
+    lobby_found.wait(ADVERTISING_WAIT_TIME + 0.1)
+    while command != 'exit' and game_session is None:
+        results = lobby_index.query(page=page, page_size=LOBBIES_PER_PAGE)
+        # Go back to the last page if lobbies have closed since.
+        if page >= results.pages():
+            page = results.pages() - 1
+            results = lobby_index.query(page=page, page_size=LOBBIES_PER_PAGE)
+        lobbies = results.lobbies
         print('\n')
-        print_lobbies(lobbies)
+        print_lobbies(lobbies, results.first_number())
+        if results.pages() > 1:
+            print(f'Page {page + 1} of {results.pages()}.')
         print()
         print('Enter "help" for help.')
         user_input = input('command> ')
         command = user_input.strip().lower()
         # Join
         if is_command(command, 'join'):
-            game_connection = join(command, lobbies, username)
+            game_session = join(command, lobbies, username, results.first_number())
+        # Watch
+        elif is_command(command, 'watch'):
+            watch(command, lobbies, username, results.first_number())
+        # Page
+        elif is_command(command, 'page'):
+            page = page_command(command, page, results.pages())
         # Host
         elif is_command(command, 'host'):
             lobby_name = user_input[len('host') + 1:]
             if not lobby_name or is_valid_lobby_name(lobby_name):
-                username, game_connection = text_host(
+                username, game_session = text_host(
                     username, lobby_name
                 )
         # Username
@@ -48,55 +74,117 @@ def text_lobby(username: str) -> Optional[GameConnection]:
         else:
             print('Unknown command. Try entering "help" for a list of commands.')
     lobby_manager.close()
-    return game_connection
+    return game_session
 
 
 def join(command: str,
          lobbies: List[JoinableLobby],
-         username: str) -> Optional[GameConnection]:
-    lobby_number = command[len('join') + 1:]
-    # Make sure there is at least one lobby to join.
+         username: str,
+         first_number: int = 1) -> Optional[JoinSession]:
+    lobby = choose_lobby(command, 'join', lobbies, first_number)
+    if lobby is None:
+        return None
+    if lobby.in_progress:
+        print(f'{lobby.host_name}\'s game has already started. '
+              'Try the "watch" command instead.')
+        return None
+    # Try and join the specified lobby.
+    try:
+        game_connection = lobby.join(username)
+    except (OSError, ProtocolError):
+        game_connection = None
+    if game_connection is None:
+        print(f'Could not join {lobby.host_name}\'s lobby.')
+        return None
+    return JoinSession(lobby, game_connection)
+
+
+def watch(command: str,
+          lobbies: List[JoinableLobby],
+          username: str,
+          first_number: int = 1) -> None:
+    lobby = choose_lobby(command, 'watch', lobbies, first_number)
+    if lobby is None:
+        return
+    # Try and watch the specified lobby's game.
+    try:
+        spectator_connection = lobby.spectate(username)
+    except (OSError, ProtocolError):
+        spectator_connection = None
+    if spectator_connection is None:
+        print(f'Could not watch {lobby.host_name}\'s game.')
+        return
+    text_spectate(spectator_connection)
+
+
+def choose_lobby(command: str,
+                 command_name: str,
+                 lobbies: List[JoinableLobby],
+                 first_number: int = 1) -> Optional[JoinableLobby]:
+    lobby_number = command[len(command_name) + 1:]
+    # Make sure there is at least one lobby to choose.
     if not lobbies:
-        print('There are currently no lobbies to join.')
+        print(f'There are currently no lobbies to {command_name}.')
         return None
     # Check if a lobby number was provided.
     if not lobby_number:
-        print('The "join" command needs to be followed by a lobby number.')
+        print(f'The "{command_name}" command needs to be followed by a lobby number.')
+        return None
     # Make sure the lobby number is a number.
     try:
         lobby_number = int(lobby_number)
     except ValueError:
         print(f'{lobby_number} is not a lobby number.')
         return None
-    # 0-index the lobby number.
-    lobby_number -= 1
+    # 0-index the lobby number, relative to the current page.
+    lobby_number -= first_number
     # Make sure the provided lobby number is in range.
     if lobby_number < 0 or lobby_number >= len(lobbies):
         print(
-            f'{lobby_number + 1} is not a valid lobby number. '
-            f'Currently there are lobbies 1 to {len(lobbies)}.'
+            f'{lobby_number + first_number} is not a valid lobby number. '
+            f'Currently there are lobbies {first_number} '
+            f'to {first_number + len(lobbies) - 1}.'
         )
         return None
-    # Try and join the specified lobby.
-    return lobbies[lobby_number].join(username)
+    return lobbies[lobby_number]
+
+
+def page_command(command: str, page: int, pages: int) -> int:
+    page_number = command[len('page') + 1:]
+    # With no page number, go to the next page.
+    if not page_number:
+        return (page + 1) % pages
+    try:
+        page_number = int(page_number)
+    except ValueError:
+        print(f'{page_number} is not a page number.')
+        return page
+    if page_number < 1 or page_number > pages:
+        print(f'{page_number} is not a valid page number. '
+              f'Currently there are pages 1 to {pages}.')
+        return page
+    return page_number - 1
 
 
 def print_commands() -> None:
     print('refresh          =  Refreshes the list of lobbies.')
     print('join [n]         =  Joins the Nth lobby in the list.')
+    print('watch [n]        =  Watches the game in the Nth lobby in the list.')
+    print('page [n]         =  Shows the Nth page of lobbies.')
     print('host             =  Hosts a lobby.')
     print('username [name]  =  Changes your username.')
     print('help             =  Shows the different commands.')
     print('exit             =  Exits the game.')
 
 
-def print_lobbies(lobbies: Collection[JoinableLobby]) -> None:
+def print_lobbies(lobbies: Collection[JoinableLobby], first_number: int = 1) -> None:
     if not lobbies:
         print('No lobbies were found nearby.')
         print('Use the "refresh" command to try again.')
         print('Use the "host" command to host your own lobby.')
         return
-    lobby_number_len = len(str(len(lobbies)))
+    # The column widths only depend on the lobbies being shown.
+    lobby_number_len = len(str(first_number + len(lobbies) - 1))
     lobby_name_len = max(map(len, (lobby.lobby_name for lobby in lobbies)))
     lobby_name_len = max(lobby_name_len, 5)
     host_name_len = max(map(len, (lobby.host_name for lobby in lobbies)))
@@ -107,7 +195,7 @@ def print_lobbies(lobbies: Collection[JoinableLobby]) -> None:
         f'{"Host":<{host_name_len}} | '
         'Rows | Columns | Gamemode'
     )
-    for lobby_number, lobby in enumerate(lobbies, 1):
+    for lobby_number, lobby in enumerate(lobbies, first_number):
         print_lobby(lobby_number, lobby, lobby_number_len, lobby_name_len, host_name_len)
 
 
@@ -125,6 +213,7 @@ def print_lobby(lobby_number: int,
         f'{lobby.rows:>{rows_len}} | '
         f'{lobby.columns:>{columns_len}} | '
         f'Connect {lobby.connect_n}'
+        f'{" (in progress)" if lobby.in_progress else ""}'
     )
 
 
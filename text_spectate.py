@@ -0,0 +1,29 @@
+from spectators import SpectatorConnection
+from text_game import player_to_str
+
+
+def text_spectate(spectator_connection: SpectatorConnection) -> None:
+    game = spectator_connection.game
+    host_username = spectator_connection.host_username
+    print()
+    print(f'Watching {host_username}\'s game.')
+    print(game)
+    # Show each move as it is made, until the host stops streaming the game.
+    while not game.is_over():
+        player = game.turn
+        column = spectator_connection.receive_move()
+        if column is None:
+            break
+        print()
+        print(f'{player_to_str(player)} placed a tile in column {column + 1}.')
+        print(game)
+    spectator_connection.disconnect()
+    # Print the winner.
+    print()
+    winner = game.winner()
+    if not game.is_over():
+        print(f'{host_username} stopped streaming the game.')
+    elif winner is None:
+        print('The game ended in a draw.')
+    else:
+        print(f'{player_to_str(winner)} won!')
@@ -0,0 +1,412 @@
+import json
+import logging
+import math
+import random
+import time
+from concurrent.futures import (FIRST_COMPLETED, BrokenExecutor, Future,
+                                ProcessPoolExecutor, wait)
+from functools import partial
+from itertools import combinations
+from typing import Any, Callable, Dict, IO, List, Mapping, Optional, Set, Tuple
+
+from computer_player import ComputerPlayer, center_first
+from connect_four import ConnectFour
+from player import Player
+
+logger = logging.getLogger(__name__)
+
+# Chooses a column to place in for the current player of a game.
+Policy = Callable[[ConnectFour], int]
+# Creates a policy. Factories are sent to the worker processes,
+# so they must be picklable (module level functions and classes,
+# or functools.partial objects of them).
+PolicyFactory = Callable[[], Policy]
+
+# Two players' names, the first of which plays first.
+Pairing = Tuple[str, str]
+# The outcome of a match, as written to the results file.
+MatchResult = Dict[str, Any]
+
+
+class RandomPolicy:
+    """Places in a random column."""
+
+    def __init__(self) -> None:
+        self.random = random.Random()
+
+    def __call__(self, game: ConnectFour) -> int:
+        columns = [column for column in range(game.columns) if game.can_place(column)]
+        return self.random.choice(columns)
+
+
+class CenterPolicy:
+    """Places in the column closest to the center that isn't full."""
+
+    def __call__(self, game: ConnectFour) -> int:
+        return next(filter(game.can_place, center_first(game.columns)))
+
+
+class Standing:
+    """A player's results in a tournament."""
+
+    def __init__(self, name: str) -> None:
+        """
+        Creates a standing with no games played.
+
+        :param name: The name of the player.
+        """
+        self.name: str = name
+        self.wins: int = 0
+        self.draws: int = 0
+        self.losses: int = 0
+        self.byes: int = 0
+
+    def games(self) -> int:
+        """
+        Gets how many games were played.
+
+        :return: The number of games.
+        """
+        return self.wins + self.draws + self.losses
+
+    def points(self) -> float:
+        """
+        Gets the player's points, where a win or a bye is worth 1
+        and a draw is worth half.
+
+        :return: The number of points.
+        """
+        return self.wins + self.byes + self.draws / 2
+
+    def win_rate(self) -> float:
+        """
+        Gets the fraction of points won per game played.
+
+        :return: The win rate.
+        """
+        games = self.games()
+        if not games:
+            return 0
+        return (self.wins + self.draws / 2) / games
+
+    def confidence_interval(self, z: float = 1.96) -> Tuple[float, float]:
+        """
+        Gets the Wilson score interval of the win rate.
+
+        :param z: The z-score of the interval (1.96 is a 95% interval).
+        :return: The low and high ends of the interval.
+        """
+        games = self.games()
+        if not games:
+            return 0, 1
+        rate = self.win_rate()
+        denominator = 1 + z * z / games
+        center = (rate + z * z / (2 * games)) / denominator
+        margin = z * math.sqrt(rate * (1 - rate) / games
+                               + z * z / (4 * games * games)) / denominator
+        return max(0.0, center - margin), min(1.0, center + margin)
+
+    def __str__(self) -> str:
+        low, high = self.confidence_interval()
+        return (
+            f'{self.name}: {self.wins}W {self.draws}D {self.losses}L, '
+            f'win rate {self.win_rate():.1%} (95% CI {low:.1%} to {high:.1%})'
+        )
+
+
+class Tournament:
+    """
+    Plays policies against each other across a pool of processes.
+
+    The pool is started by the first round and used by every round after it,
+    so the tournament should be closed once it has been played.
+    """
+
+    def __init__(self,
+                 policies: Mapping[str, PolicyFactory],
+                 results_path: Optional[str] = None,
+                 rows: int = 6,
+                 columns: int = 7,
+                 connect_n: int = 4,
+                 max_workers: Optional[int] = None,
+                 chunk_size: int = 1) -> None:
+        """
+        Creates a tournament.
+
+        :param policies: The factory of each player's policy, by name.
+        :param results_path: The JSON lines file to append the result of
+                             every match to as it finishes, or None.
+        :param rows: The number of rows.
+        :param columns: The number of columns.
+        :param connect_n: How many tiles in a row to win.
+        :param max_workers: The number of processes, or None for one per core.
+        :param chunk_size: How many matches each process plays at a time.
+                           Larger chunks cost less to schedule,
+                           which matters when the policies are fast.
+        """
+        self.policies: Dict[str, PolicyFactory] = dict(policies)
+        self.results_path: Optional[str] = results_path
+        self.rows: int = rows
+        self.columns: int = columns
+        self.connect_n: int = connect_n
+        self.max_workers: Optional[int] = max_workers
+        self.chunk_size: int = chunk_size
+        self.standings: Dict[str, Standing] = {name: Standing(name) for name in policies}
+        self.results: List[MatchResult] = []
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def round_robin(self, games_per_pair: int = 2) -> Dict[str, Standing]:
+        """
+        Plays every player against every other player.
+        Players take turns at playing first.
+
+        :param games_per_pair: How many games each pair of players plays.
+        :return: The standings of the players.
+        """
+        pairings = []
+        for first, second in combinations(self.policies, 2):
+            for game in range(games_per_pair):
+                pairings.append((first, second) if game % 2 == 0 else (second, first))
+        self.play(pairings, 0)
+        return self.standings
+
+    def swiss(self, rounds: int) -> Dict[str, Standing]:
+        """
+        Plays rounds where players with similar points play each other,
+        avoiding rematches where possible.
+
+        If there is an odd number of players,
+        the lowest player without a bye gets one each round.
+
+        :param rounds: The number of rounds.
+        :return: The standings of the players.
+        """
+        played: Set[frozenset] = set()
+        for round_number in range(rounds):
+            waiting = sorted(self.standings.values(),
+                             key=lambda standing: -standing.points())
+            names = [standing.name for standing in waiting]
+            if len(names) % 2:
+                bye = min(reversed(names), key=lambda name: self.standings[name].byes)
+                names.remove(bye)
+                self.standings[bye].byes += 1
+            pairings = []
+            while names:
+                first = names.pop(0)
+                second = next((name for name in names
+                               if frozenset((first, name)) not in played), names[0])
+                names.remove(second)
+                played.add(frozenset((first, second)))
+                # The player who has played first less often plays first.
+                if self.first_moves(first) > self.first_moves(second):
+                    first, second = second, first
+                pairings.append((first, second))
+            self.play(pairings, round_number)
+        return self.standings
+
+    def first_moves(self, name: str) -> int:
+        """
+        Counts how many games a player has played first in.
+
+        :param name: The name of the player.
+        :return: The number of games.
+        """
+        return sum(result['player_one'] == name for result in self.results)
+
+    def play(self, pairings: List[Pairing], round_number: int) -> None:
+        """
+        Plays matches across the process pool, recording each result
+        as soon as it finishes.
+
+        A policy that raises an exception forfeits its match. If a chunk of
+        matches fails for any other reason (such as a worker process dying),
+        its matches are recorded with the error but don't count as played.
+
+        :param pairings: The players of each match.
+        :param round_number: The round the matches are part of.
+        """
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.max_workers)
+        results_file = None
+        if self.results_path is not None:
+            results_file = open(self.results_path, 'a')
+        try:
+            pending: Dict[Future, List[Pairing]] = {}
+            for start in range(0, len(pairings), self.chunk_size):
+                chunk = [
+                    (pairing, self.policies[pairing[0]], self.policies[pairing[1]])
+                    for pairing in pairings[start:start + self.chunk_size]
+                ]
+                future = self.executor.submit(
+                    play_matches, chunk, self.rows, self.columns, self.connect_n
+                )
+                pending[future] = pairings[start:start + self.chunk_size]
+            waiting: Set[Future] = set(pending)
+            while waiting:
+                done, waiting = wait(waiting, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        results = future.result()
+                    except Exception as error:
+                        logger.warning('A chunk of matches failed: %r', error)
+                        results = [match_result(pairing, [], None, 0, error)
+                                   for pairing in pending[future]]
+                        # A broken pool can't play any more matches, so the
+                        # next round starts a new one.
+                        if isinstance(error, BrokenExecutor):
+                            self.close()
+                    for result in results:
+                        result['round'] = round_number
+                        self.record(result, results_file)
+        finally:
+            if results_file is not None:
+                results_file.close()
+
+    def record(self, result: MatchResult, results_file: Optional[IO[str]]) -> None:
+        """
+        Adds the result of a match to the standings and the results file.
+
+        :param result: The result of the match.
+        :param results_file: The file to write the result to, or None.
+        """
+        self.results.append(result)
+        players = (result['player_one'], result['player_two'])
+        if result['error'] is not None and result['winner'] is None:
+            # The match wasn't played, so it isn't in the standings.
+            pass
+        elif result['winner'] is None:
+            for name in players:
+                self.standings[name].draws += 1
+        else:
+            for name in players:
+                if name == result['winner']:
+                    self.standings[name].wins += 1
+                else:
+                    self.standings[name].losses += 1
+        if results_file is not None:
+            results_file.write(json.dumps(result) + '\n')
+            results_file.flush()
+
+    def report(self) -> str:
+        """
+        Describes the standings, from the most points to the least.
+
+        :return: One line per player.
+        """
+        standings = sorted(self.standings.values(),
+                           key=lambda standing: -standing.points())
+        return '\n'.join(map(str, standings))
+
+    def close(self) -> None:
+        """Stops the processes, if any rounds have been played."""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+def play_matches(chunk: List[Tuple[Pairing, PolicyFactory, PolicyFactory]],
+                 rows: int,
+                 columns: int,
+                 connect_n: int) -> List[MatchResult]:
+    """
+    Plays a chunk of matches. This runs in the worker processes.
+
+    :param chunk: The players of each match and their policy factories.
+    :param rows: The number of rows.
+    :param columns: The number of columns.
+    :param connect_n: How many tiles in a row to win.
+    :return: The result of each match.
+    """
+    results = []
+    for pairing, factory_one, factory_two in chunk:
+        policies = []
+        for loser, factory in enumerate((factory_one, factory_two)):
+            try:
+                policies.append(factory())
+            except Exception as error:
+                # A policy that can't be created forfeits the match.
+                results.append(match_result(pairing, [], pairing[not loser], 0, error))
+                break
+        else:
+            results.append(play_match(pairing, *policies, rows, columns, connect_n))
+    return results
+
+
+def play_match(pairing: Pairing,
+               policy_one: Policy,
+               policy_two: Policy,
+               rows: int = 6,
+               columns: int = 7,
+               connect_n: int = 4) -> MatchResult:
+    """
+    Plays a game between two policies.
+
+    A policy that chooses a full column, or a column that isn't on the grid,
+    or that raises an exception, loses the game.
+
+    :param pairing: The names of the players.
+    :param policy_one: The policy of the player who plays first.
+    :param policy_two: The policy of the player who plays second.
+    :param rows: The number of rows.
+    :param columns: The number of columns.
+    :param connect_n: How many tiles in a row to win.
+    :return: The result of the game.
+    """
+    game = ConnectFour(rows, columns, connect_n)
+    start = time.monotonic()
+    winner = None
+    error = None
+    while not game.is_over():
+        policy = policy_one if game.turn == Player.ONE else policy_two
+        try:
+            column = policy(game)
+        except Exception as policy_error:
+            winner = pairing[not game.turn.value]
+            error = policy_error
+            break
+        if not 0 <= column < game.columns or not game.place(column):
+            winner = pairing[not game.turn.value]
+            break
+    else:
+        if game.winner() is not None:
+            winner = pairing[game.winner().value]
+    return match_result(pairing, game.moves.tolist(), winner,
+                        time.monotonic() - start, error)
+
+
+def match_result(pairing: Pairing,
+                 moves: List[int],
+                 winner: Optional[str],
+                 seconds: float,
+                 error: Optional[BaseException] = None) -> MatchResult:
+    """
+    Creates the result of a match, as written to the results file.
+
+    :param pairing: The names of the players.
+    :param moves: The column of each move.
+    :param winner: The name of the winner, or None if nobody won.
+    :param seconds: How long the match took.
+    :param error: The exception that ended the match, or None.
+    :return: The result of the match.
+    """
+    return {
+        'player_one': pairing[0],
+        'player_two': pairing[1],
+        'moves': moves,
+        'winner': winner,
+        'seconds': seconds,
+        'error': None if error is None else repr(error),
+    }
+
+
+if __name__ == '__main__':
+    tournament = Tournament({
+        'random': RandomPolicy,
+        'center': CenterPolicy,
+        'computer': partial(ComputerPlayer, time_limit=0.01, table_size=1 << 16),
+    }, results_path='tournament_results.jsonl')
+    try:
+        tournament.round_robin(games_per_pair=10)
+    finally:
+        tournament.close()
+    print(tournament.report())